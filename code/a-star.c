@@ -2,6 +2,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+#include <limits.h>
 
 // Node walk state values for marking the status of each node in the pathfinding process
 #define UNREACHABLE 0  // Node cannot be reached
@@ -14,9 +15,14 @@
 // log10(PRECISION_FACTOR) = how many digits after the comma get preserved
 #define PRECISION_FACTOR 10
 
+// cost of a straight and a diagonal step, equal to euclidianDst between neighbors
+#define STRAIGHT_COST 10
+#define DIAGONAL_COST 14
+
 typedef struct Node Node;
 typedef struct Cost Cost;
 typedef struct Pos Pos;
+typedef struct SearchTrace SearchTrace;
 
 /*
  * Represents a 2D position or coordinate in a grid or maze.
@@ -61,6 +67,20 @@ struct Node {
     int walkState; // Current state of the node (e.g., UNREACHABLE, WALKABLE)
 };
 
+/*
+ * A preallocated buffer receiving the expansion order of a search, for replaying it.
+ *
+ * Attributes:
+ *     entries (int*): Pairs of the offset of an expanded node in the graph and its F costs, in the order of expansion.
+ *     capacity (int): The number of pairs fitting into the buffer.
+ *     length (int): The number of expansions, may be larger than the capacity if the buffer was full.
+ */
+struct SearchTrace {
+    int *entries;
+    int capacity;
+    int length;
+};
+
 int min(int a, int b) {
     // Returns the smaller of two integers.
     //
@@ -98,6 +118,20 @@ int euclidianDst(Pos *start, Pos *end) {
     return sqrt(pow(end->x - start->x, 2) + pow(end->y - start->y, 2)) * PRECISION_FACTOR;
 }
 
+int octileDst(Pos *start, Pos *end) {
+    // Calculates the length of the shortest path between two positions without obstacles, which is a consistent heuristic for the step costs.
+    //
+    // Inputs:
+    //     start (Pos*): Pointer to the start position.
+    //     end (Pos*): Pointer to the end position.
+    //
+    // Returns:
+    //     int: The octile distance, scaled by the PRECISION_FACTOR.
+    int dx = abs(end->x - start->x);
+    int dy = abs(end->y - start->y);
+    return STRAIGHT_COST * max(dx, dy) + (DIAGONAL_COST - STRAIGHT_COST) * min(dx, dy);
+}
+
 int offset(int i, int j, Pos *dimensions) {
     // Calculates the offset in a linear array for a 2D coordinate.
     //
@@ -238,7 +272,7 @@ int prepareNeighbor(Node *currentBorderNode, Node *parent, Pos *end) {
 }
 
 // Function to process all neighboring nodes of the current node in the graph
-void computeNeighbors(Node *parent, Pos *end, Node *graph, Node **border, int *borderNodes, Pos *dim) {
+void computeNeighbors(Node *parent, Pos *end, Node *graph, Node **border, int *borderNodes, Pos *dim, int costCutoff, int *skipped) {
     // Processes all neighboring nodes of the current node in the graph.
     //
     // Inputs:
@@ -248,6 +282,8 @@ void computeNeighbors(Node *parent, Pos *end, Node *graph, Node **border, int *b
     //     border (Node**): Array of pointers to nodes in the border.
     //     borderNodes (int*): Pointer to the number of nodes in the border array.
     //     dim (Pos*): Pointer to the dimensions of the graph.
+    //     costCutoff (int): Nodes whose G costs plus octile distance to the end exceed the cutoff cannot lie on a path within it and are skipped.
+    //     skipped (int*): Pointer to the number of skipped nodes, each node is counted once.
     Node *currentNode;
     
     for(int i = max(parent->pos.y - 1, 0); i <= min(parent->pos.y + 1, dim->y - 1); i++) {
@@ -264,8 +300,19 @@ void computeNeighbors(Node *parent, Pos *end, Node *graph, Node **border, int *b
             int borderIdx = getBorderNodeIdx(&(currentNode->pos), border, *borderNodes);
 
             if(borderIdx == -1) {
+                // the costs of a node start at 0 and only the start node keeps them, so a node with costs was skipped before
+                int discovered = currentNode->cost.G_cost != 0;
+
                 // add node to border nodes
                 prepareNeighbor(currentNode, parent, end);
+
+                // the octile distance never overestimates, so the node cannot lead to a path within the cutoff
+                if(currentNode->cost.G_cost + octileDst(&(currentNode->pos), end) > costCutoff) {
+                    currentNode->parent = NULL;
+                    // a node is skipped again from each of its expanded neighbors, but counted once
+                    if(!discovered) (*skipped)++;
+                    continue;
+                }
                 sortInBorderNode(currentNode, border, borderNodes);
             } else {
                 // check if current node has a smaller distance to its parent
@@ -280,7 +327,7 @@ void computeNeighbors(Node *parent, Pos *end, Node *graph, Node **border, int *b
     }
 }
 
-int astar_algorithm(Pos *start, Pos *end, Node *graph, Node **border, Pos *dim) {
+int astar_algorithm(Pos *start, Pos *end, Node *graph, Node **border, Pos *dim, int costCutoff, int *skipped, SearchTrace *trace) {
     // Core A* algorithm function to find the shortest path from start to end positions.
     //
     // Inputs:
@@ -289,6 +336,9 @@ int astar_algorithm(Pos *start, Pos *end, Node *graph, Node **border, Pos *dim)
     //     graph (Node*): Pointer to the graph of nodes.
     //     border (Node**): Array of pointers to nodes in the border.
     //     dim (Pos*): Pointer to the dimensions of the graph.
+    //     costCutoff (int): The highest path costs of interest, INT_MAX for no cutoff.
+    //     skipped (int*): Pointer to the number of nodes skipped because of the cutoff.
+    //     trace (SearchTrace*): Pointer to the trace receiving the expanded nodes, NULL for no trace.
     //
     // Returns:
     //     int: The length of the shortest path found, or 0 if no path is found.
@@ -299,12 +349,26 @@ int astar_algorithm(Pos *start, Pos *end, Node *graph, Node **border, Pos *dim)
 
     while(!compareNodes(&(nextNode->pos), end)) {
         
+        // a node is taken once from the border, but may be marked again if the border ran empty
+        if(trace != NULL && nextNode->walkState != VISITED) {
+            if(trace->length < trace->capacity) {
+                trace->entries[2 * trace->length] = nextNode - graph;
+                trace->entries[2 * trace->length + 1] = nextNode->cost.F_cost;
+            }
+            trace->length++;
+        }
+
         nextNode->walkState = VISITED;
-        computeNeighbors(lastNode, end, graph, border, &borderNodes, dim);
+        computeNeighbors(lastNode, end, graph, border, &borderNodes, dim, costCutoff, skipped);
 
         // exit condition if no path found
-        if(borderNodes == 0)
-            return 0;
+        if(borderNodes == 0) {
+            // the last taken border node is only expanded in the next iteration, which may still add new border nodes
+            if(lastNode == nextNode)
+                return 0;
+            lastNode = nextNode;
+            continue;
+        }
 
         lastNode = nextNode;
         nextNode = border[0];
@@ -327,18 +391,21 @@ int astar_algorithm(Pos *start, Pos *end, Node *graph, Node **border, Pos *dim)
     return pathLength;
 }
 
-// Function to run the A* algorithm and return the distance of the found path
-float run_astar(Pos *start, Pos *end, Node *graph, Pos *dims) {
-    // Executes the A* algorithm and returns the distance of the found path.
+// Function to run the A* algorithm with a cost cutoff and return the distance of the found path
+float run_astar_cutoff(Pos *start, Pos *end, Node *graph, Pos *dims, float cutoff, int *skipped, SearchTrace *trace) {
+    // Executes the A* algorithm, skipping all nodes which cannot lie on a path of at most the cutoff distance, and returns the distance of the found path.
     //
     // Inputs:
     //     start (Pos*): Pointer to the start position.
     //     end (Pos*): Pointer to the end position.
     //     graph (Node*): Pointer to the graph of nodes.
     //     dims (Pos*): Pointer to the dimensions of the graph.
+    //     cutoff (float): The longest distance of interest, e.g. the distance of a known path, a negative value for no cutoff.
+    //     skipped (int*): Pointer to an int receiving the number of nodes skipped because of the cutoff.
+    //     trace (SearchTrace*): Pointer to a trace receiving the order of the expanded nodes, NULL for no trace.
     //
     // Returns:
-    //     float: The distance of the found path, or -1 if memory allocation failed.
+    //     float: The distance of the found path, 0 if no path within the cutoff is found, or -1 if memory allocation failed.
 
     // allocate memory for a pointer array that point to a node that is on the border of all visited nodes
     // size is the perimeter of the maze defined in the csv file
@@ -350,11 +417,359 @@ float run_astar(Pos *start, Pos *end, Node *graph, Pos *dims) {
         return -1;
     }
 
-    int pathLength = astar_algorithm(start, end, graph, border, dims);
+    // the cutoff is rounded up to the integer costs, so a path of exactly the cutoff distance is kept
+    int costCutoff = cutoff < 0 ? INT_MAX : (int) ceil(cutoff * PRECISION_FACTOR);
+    *skipped = 0;
+
+    if(trace != NULL) {
+        trace->length = 0;
+    }
+
+    int pathLength = astar_algorithm(start, end, graph, border, dims, costCutoff, skipped, trace);
     // since each G Cost was calculated as ints with a factor of PRECISION_FACTOR it needs to be accounted for
     float distance = pathLength / (float) PRECISION_FACTOR;
 
     free(border);
     
     return distance;
-}
\ No newline at end of file
+}
+
+// Function to run the A* algorithm and return the distance of the found path
+float run_astar(Pos *start, Pos *end, Node *graph, Pos *dims) {
+    // Executes the A* algorithm and returns the distance of the found path.
+    //
+    // Inputs:
+    //     start (Pos*): Pointer to the start position.
+    //     end (Pos*): Pointer to the end position.
+    //     graph (Node*): Pointer to the graph of nodes.
+    //     dims (Pos*): Pointer to the dimensions of the graph.
+    //
+    // Returns:
+    //     float: The distance of the found path, or -1 if memory allocation failed.
+    int skipped;
+    return run_astar_cutoff(start, end, graph, dims, -1, &skipped, NULL);
+}
+
+
+/* bounded suboptimal search */
+
+// status of a bounded search, stored in the status of its SearchControl
+#define SEARCH_BOUNDED 1   // the path is proven to be at most epsilon times longer than the shortest path
+#define SEARCH_NO_PATH 2   // there is no path between start and end
+#define SEARCH_CANCELLED 3 // the cancel flag was set before the bound was reached
+#define SEARCH_BUDGET 4    // the expansion budget was used up before the bound was reached
+
+// number of expansions between two updates of the bound while no better path is found
+#define BOUND_INTERVAL 1024
+
+typedef struct SearchControl SearchControl;
+typedef struct HeapEntry HeapEntry;
+
+/*
+ * Controls a bounded search and receives its result. It is owned by the caller, so several searches can run in parallel threads.
+ *
+ * Attributes:
+ *     weight (float): The factor of the heuristic, 1 is plain A*, larger weights find a first path faster.
+ *     epsilon (float): The search stops as soon as its path is proven to be at most epsilon times longer than the shortest path.
+ *     maxExpansions (int): The highest number of expanded nodes, 0 for no limit.
+ *     cancel (int): Polled before each expansion, the search stops as soon as another thread sets it to 1.
+ *     status (int): The reason the search stopped (SEARCH_BOUNDED, SEARCH_NO_PATH, SEARCH_CANCELLED or SEARCH_BUDGET).
+ *     expansions (int): The number of expanded nodes.
+ *     bound (float): The proven ratio between the length of the returned path and the shortest path, INFINITY if no path was found.
+ */
+struct SearchControl {
+    float weight;
+    float epsilon;
+    int maxExpansions;
+    volatile int cancel;
+    int status;
+    int expansions;
+    float bound;
+};
+
+/*
+ * An entry of the open list. Entries are not removed when the costs of their node improve, outdated entries are skipped instead.
+ *
+ * Attributes:
+ *     node (Node*): The node of the entry.
+ *     G_cost (int): The G costs of the node when the entry was added.
+ *     key (int): The G costs plus the weighted H costs.
+ */
+struct HeapEntry {
+    Node *node;
+    int G_cost;
+    int key;
+};
+
+int entryBefore(HeapEntry *a, HeapEntry *b) {
+    // Orders the entries of the open list by their key and then by their H costs, like sortInBorderNode.
+    //
+    // Inputs:
+    //     a (HeapEntry*): Pointer to the first entry.
+    //     b (HeapEntry*): Pointer to the second entry.
+    //
+    // Returns:
+    //     int: 1 if a is expanded before b, 0 otherwise.
+    if(a->key != b->key) return a->key < b->key;
+    return a->node->cost.H_cost < b->node->cost.H_cost;
+}
+
+// Function to add an entry to the binary heap of the open list, growing the heap if needed
+// returns 0 if the memory could not be allocated
+int pushEntry(HeapEntry **heap, int *heapSize, int *heapCapacity, Node *node, int key) {
+    // Adds an entry to the open list.
+    //
+    // Inputs:
+    //     heap (HeapEntry**): Pointer to the heap array.
+    //     heapSize (int*): Pointer to the number of entries.
+    //     heapCapacity (int*): Pointer to the allocated number of entries.
+    //     node (Node*): Pointer to the node of the entry.
+    //     key (int): The G costs plus the weighted H costs of the node.
+    //
+    // Returns:
+    //     int: 1 on success, 0 if the memory could not be allocated.
+    if(*heapSize == *heapCapacity) {
+        HeapEntry *grown = realloc(*heap, 2 * *heapCapacity * sizeof(HeapEntry));
+        if(grown == NULL) return 0;
+        *heap = grown;
+        *heapCapacity *= 2;
+    }
+
+    HeapEntry entry = {node, node->cost.G_cost, key};
+    int pos = (*heapSize)++;
+
+    // move the entry up as long as it is expanded before its parent
+    while(pos > 0 && entryBefore(&entry, *heap + (pos - 1) / 2)) {
+        (*heap)[pos] = (*heap)[(pos - 1) / 2];
+        pos = (pos - 1) / 2;
+    }
+    (*heap)[pos] = entry;
+    return 1;
+}
+
+HeapEntry popEntry(HeapEntry *heap, int *heapSize) {
+    // Removes the first entry of the open list.
+    //
+    // Inputs:
+    //     heap (HeapEntry*): The heap array.
+    //     heapSize (int*): Pointer to the number of entries, at least 1.
+    //
+    // Returns:
+    //     HeapEntry: The entry with the smallest key.
+    HeapEntry first = heap[0];
+    HeapEntry last = heap[--(*heapSize)];
+    int pos = 0;
+
+    // move the last entry down as long as a child is expanded before it
+    while(2 * pos + 1 < *heapSize) {
+        int child = 2 * pos + 1;
+        if(child + 1 < *heapSize && entryBefore(heap + child + 1, heap + child)) child++;
+        if(!entryBefore(heap + child, &last)) break;
+        heap[pos] = heap[child];
+        pos = child;
+    }
+    heap[pos] = last;
+    return first;
+}
+
+float provenBound(int pathCost, HeapEntry *heap, int heapSize) {
+    // Calculates how much longer the best path found so far can be than the shortest path.
+    // Every path not found yet passes an up to date entry of the open list, so the smallest G + H costs of these entries bound the shortest path from below.
+    //
+    // Inputs:
+    //     pathCost (int): The costs of the best path found so far.
+    //     heap (HeapEntry*): The heap array.
+    //     heapSize (int): The number of entries.
+    //
+    // Returns:
+    //     float: The ratio between the path costs and the lower bound of the shortest path, at least 1.
+    int lowerBound = pathCost;
+
+    for(int i = 0; i < heapSize; i++) {
+        Node *node = heap[i].node;
+        // skip outdated entries and nodes which cannot lead to a better path
+        if(heap[i].G_cost != node->cost.G_cost || node->walkState != BORDER) continue;
+        lowerBound = min(lowerBound, node->cost.G_cost + node->cost.H_cost);
+    }
+
+    return lowerBound > 0 ? pathCost / (float) lowerBound : 1;
+}
+
+int bounded_astar_algorithm(Pos *start, Pos *end, Node *graph, Pos *dim, SearchControl *control, HeapEntry **heap, int *heapCapacity, Node **inconsistent, char *deferred) {
+    // Anytime weighted A*: expands the nodes in the order of G + weight * H and keeps searching after the first path, until its proven bound reaches epsilon.
+    // Every better path replaces the previous one, nodes whose G + H costs cannot lead to a better path are pruned, nodes reached with smaller costs are expanded again.
+    // Until the first path is found, visited nodes reached with smaller costs are only collected, like in ARA*, so the first path is found as fast as with weighted A* without reexpansions.
+    //
+    // Inputs:
+    //     start (Pos*): Pointer to the start position.
+    //     end (Pos*): Pointer to the end position.
+    //     graph (Node*): Pointer to the graph of nodes.
+    //     dim (Pos*): Pointer to the dimensions of the graph.
+    //     control (SearchControl*): Pointer to the control of the search, receives the status, expansions and bound.
+    //     heap (HeapEntry**): Pointer to the allocated heap array.
+    //     heapCapacity (int*): Pointer to the allocated number of entries.
+    //     inconsistent (Node**): Array for the visited nodes reached with smaller costs before the first path, one entry per node.
+    //     deferred (char*): Array with a flag per node, set if the node is in the inconsistent array.
+    //
+    // Returns:
+    //     int: The costs of the best path found, 0 if no path was found or -1 if memory allocation failed.
+    Node *startNode = graph + offset(start->y, start->x, dim);
+    Node *endNode = graph + offset(end->y, end->x, dim);
+    int pathCost = compareNodes(start, end) ? 0 : -1;
+    int heapSize = 0;
+    int inconsistentNodes = 0;
+
+    startNode->cost.G_cost = 0;
+    startNode->cost.H_cost = octileDst(start, end);
+    startNode->walkState = BORDER;
+    if(!pushEntry(heap, &heapSize, heapCapacity, startNode, (int) (control->weight * startNode->cost.H_cost))) return -1;
+
+    control->expansions = 0;
+    control->bound = pathCost == 0 ? 1 : INFINITY;
+    control->status = SEARCH_BOUNDED;
+
+    while(heapSize > 0 && control->bound > control->epsilon) {
+        if(control->cancel) {
+            control->status = SEARCH_CANCELLED;
+            break;
+        }
+        if(control->maxExpansions > 0 && control->expansions >= control->maxExpansions) {
+            control->status = SEARCH_BUDGET;
+            break;
+        }
+
+        HeapEntry entry = popEntry(*heap, &heapSize);
+        Node *node = entry.node;
+
+        // skip outdated entries and nodes which cannot lead to a better path
+        if(entry.G_cost != node->cost.G_cost || node->walkState != BORDER) continue;
+        if(pathCost >= 0 && node->cost.G_cost + node->cost.H_cost >= pathCost) continue;
+
+        node->walkState = VISITED;
+        control->expansions++;
+        int foundPath = 0;
+
+        for(int i = max(node->pos.y - 1, 0); i <= min(node->pos.y + 1, dim->y - 1); i++) {
+            for(int j = max(node->pos.x - 1, 0); j <= min(node->pos.x + 1, dim->x - 1); j++) {
+                Node *neighbor = graph + offset(i, j, dim);
+                // skip the node itself and obstacles
+                if(neighbor == node || !neighbor->walkState) continue;
+
+                int GCost = node->cost.G_cost + (i != node->pos.y && j != node->pos.x ? DIAGONAL_COST : STRAIGHT_COST);
+                // skip neighbors which were reached with smaller costs
+                if((neighbor->parent != NULL || neighbor == startNode) && GCost >= neighbor->cost.G_cost) continue;
+
+                neighbor->parent = node;
+                neighbor->cost.G_cost = GCost;
+                neighbor->cost.H_cost = octileDst(&(neighbor->pos), end);
+                neighbor->cost.F_cost = GCost + neighbor->cost.H_cost;
+
+                if(neighbor == endNode) {
+                    // a better path was found, the end node is never expanded
+                    pathCost = GCost;
+                    neighbor->walkState = VISITED;
+                    foundPath = 1;
+                    continue;
+                }
+                // before the first path, visited nodes wait in the inconsistent array instead of being expanded again
+                if(pathCost < 0 && neighbor->walkState == VISITED) {
+                    int idx = offset(i, j, dim);
+                    if(!deferred[idx]) {
+                        deferred[idx] = 1;
+                        inconsistent[inconsistentNodes++] = neighbor;
+                    }
+                    continue;
+                }
+                // skip neighbors which cannot lead to a better path
+                if(pathCost >= 0 && neighbor->cost.F_cost >= pathCost) continue;
+
+                neighbor->walkState = BORDER;
+                if(!pushEntry(heap, &heapSize, heapCapacity, neighbor, GCost + (int) (control->weight * neighbor->cost.H_cost))) return -1;
+            }
+        }
+
+        // the first path was found, the collected nodes are expanded again if they can lead to a better path
+        for(int i = 0; foundPath && i < inconsistentNodes; i++) {
+            Node *deferredNode = inconsistent[i];
+            deferred[offset(deferredNode->pos.y, deferredNode->pos.x, dim)] = 0;
+            if(deferredNode->walkState != VISITED || deferredNode->cost.F_cost >= pathCost) continue;
+
+            deferredNode->walkState = BORDER;
+            if(!pushEntry(heap, &heapSize, heapCapacity, deferredNode, deferredNode->cost.G_cost + (int) (control->weight * deferredNode->cost.H_cost))) return -1;
+        }
+        if(foundPath) inconsistentNodes = 0;
+
+        if(pathCost > 0 && (foundPath || control->expansions % BOUND_INTERVAL == 0)) {
+            control->bound = provenBound(pathCost, *heap, heapSize);
+        }
+    }
+
+    // an empty open list proves that no better path exists
+    if(heapSize == 0 && control->status == SEARCH_BOUNDED) {
+        if(pathCost < 0) {
+            control->status = SEARCH_NO_PATH;
+        } else {
+            control->bound = 1;
+        }
+    } else if(pathCost > 0) {
+        control->bound = provenBound(pathCost, *heap, heapSize);
+    }
+    if(pathCost < 0) {
+        return 0;
+    }
+
+    // mark the best path, parents only get replaced by parents with smaller costs, so it is as short as its costs
+    Node *pathNode = endNode;
+    while(1) {
+        pathNode->walkState = PATH;
+
+        // terminate loop if start node was reached
+        if(pathNode == startNode) {
+            break;
+        }
+        pathNode = pathNode->parent;
+    }
+
+    return pathCost;
+}
+
+// Function to run the bounded search and return the distance of the best path found
+float run_bounded_astar(Pos *start, Pos *end, Node *graph, Pos *dims, SearchControl *control) {
+    // Executes the anytime weighted A* algorithm and returns the distance of the best path found.
+    // The search uses no global state, so it can run in several threads with their own graphs and controls.
+    //
+    // Inputs:
+    //     start (Pos*): Pointer to the start position.
+    //     end (Pos*): Pointer to the end position.
+    //     graph (Node*): Pointer to the graph of nodes.
+    //     dims (Pos*): Pointer to the dimensions of the graph.
+    //     control (SearchControl*): Pointer to the control of the search, receives the status, expansions and bound.
+    //
+    // Returns:
+    //     float: The distance of the best path found, 0 if no path was found, or -1 if memory allocation failed.
+
+    // the open list grows when needed, it starts with the perimeter of the maze like the border of run_astar
+    int heapCapacity = 2 * (dims->x + dims->y);
+    HeapEntry *heap = malloc(heapCapacity * sizeof(HeapEntry));
+    Node **inconsistent = malloc(dims->x * dims->y * sizeof(Node*));
+    char *deferred = calloc(dims->x * dims->y, sizeof(char));
+
+    // check if memory could be allocated
+    if(heap == NULL || inconsistent == NULL || deferred == NULL) {
+        free(heap);
+        free(inconsistent);
+        free(deferred);
+        return -1;
+    }
+
+    int pathCost = bounded_astar_algorithm(start, end, graph, dims, control, &heap, &heapCapacity, inconsistent, deferred);
+    free(heap);
+    free(inconsistent);
+    free(deferred);
+
+    if(pathCost == -1) {
+        return -1;
+    }
+    // since each G Cost was calculated as ints with a factor of PRECISION_FACTOR it needs to be accounted for
+    return pathCost / (float) PRECISION_FACTOR;
+}
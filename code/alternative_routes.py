@@ -0,0 +1,183 @@
+import heapq
+import numpy as np
+
+import network_graph
+import network_vulnerability
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST, PRECISION_FACTOR
+from parameters import NodePos
+
+# https://en.wikipedia.org/wiki/K_shortest_path_routing
+# penalty method: after each route the segments it uses get more expensive, so the next search prefers other corridors
+
+# default number of alternatives per city pair
+default_alternatives = 3
+# highest share of the segments of an alternative which may be used by another alternative
+default_max_overlap = 0.5
+# factor applied to the costs of the segments of every found route
+default_penalty = 1.4
+# searches per requested alternative before giving up
+iterations_per_alternative = 5
+
+class AlternativeRoutes():
+    """
+    Finds meaningfully different alternative routes of a vehicle type with the penalty method on the compressed segment graph of its network.
+    The segment graph is built once and reused by all searches: each search only penalizes the segments of the previous routes, the routes are then unpacked with an exact search restricted to the cells of their segments.
+
+    Attributes:
+        vehicle_type (str): The vehicle type, 'train' or 'car'.
+        network (VulnerableNetwork): The network with its pace, fast cells and segments.
+        centroids (np.ndarray): The mean position of the cells of each segment.
+        segment_adjacency (list): The adjacency of the segment graph, a dictionary {neighbor: cost} per segment.
+
+    Methods:
+        __init__: Prepares the network and its segment graph.
+        alternatives: Returns up to k alternative routes between two cities.
+    """
+    def __init__(self, vehicle_type: str, networks: dict[str, np.ndarray] | None = None) -> None:
+        """
+        Initializes a new AlternativeRoutes instance.
+
+        Inputs:
+            vehicle_type: The vehicle type as defined in comparison.vehicle_networks, 'train' or 'car'.
+            networks: Optional networks already loaded with comparison.load_networks.
+        """
+        self.vehicle_type = vehicle_type
+        self.network = network_vulnerability.VulnerableNetwork(vehicle_type, networks)
+        self.centroids, self.segment_adjacency = network_graph.segment_graph(self.network.labels, self.network.segment_count, self.network.pace)
+
+    def segment_route(self, start_segment: int, end_segment: int, penalties: np.ndarray) -> list[int]:
+        """
+        Finds the cheapest sequence of segments with Dijkstra's algorithm on the penalized segment graph.
+
+        Inputs:
+            start_segment: The segment of the start cell.
+            end_segment: The segment of the end cell.
+            penalties: The cost factor of each segment.
+
+        Outputs:
+            _: The segments from start to end, empty if they are not connected.
+        """
+        costs = {start_segment: 0}
+        parents = {start_segment: -1}
+        border = [(0, start_segment)]
+
+        while border:
+            cost, segment = heapq.heappop(border)
+            if segment == end_segment:
+                return network_graph.trace_parents(parents, end_segment)
+            if cost > costs[segment]:
+                continue
+            for neighbor, edge_cost in self.segment_adjacency[segment].items():
+                new_cost = cost + edge_cost * (penalties[segment] + penalties[neighbor]) / 2
+                if new_cost < costs.get(neighbor, INFINITE_COST):
+                    costs[neighbor] = new_cost
+                    parents[neighbor] = segment
+                    heapq.heappush(border, (new_cost, neighbor))
+
+        return []
+
+    def unpack(self, start: int, end: int, segments: list[int]) -> list[int]:
+        """
+        Finds the fastest path through the cells of a sequence of segments.
+
+        Inputs:
+            start: The flat index of the start cell.
+            end: The flat index of the end cell.
+            segments: The segments the path may use.
+
+        Outputs:
+            _: The flat indices of the path, empty if the segments do not connect both cells.
+        """
+        closed = ~np.isin(self.network.labels.ravel(), segments)
+        closed[[start, end]] = False
+        cost, path = network_graph.shortest_path(self.network.adjacency, start, end, self.network.maze.shape[1], self.network.pace, closed)
+        return path if cost < INFINITE_COST else []
+
+    def alternatives(self, start: NodePos, end: NodePos, k: int = default_alternatives, max_overlap: float = default_max_overlap, penalty: float = default_penalty) -> list[dict]:
+        """
+        Returns up to k alternative routes between two positions. The first route is the fastest one.
+        A route is only accepted if at most max_overlap of its segments are used by any already accepted route.
+
+        Inputs:
+            start: The start position.
+            end: The end position.
+            k: The number of alternatives.
+            max_overlap: The highest share of shared segments, between 0 and 1.
+            penalty: The factor applied to the costs of the segments of every found route.
+
+        Outputs:
+            routes: A list of route dictionaries as returned by route_details, with the additional key overlap (the highest share of segments shared with an earlier route), sorted by time.
+
+        Raises:
+            Exception: If no route exists between both positions.
+        """
+        shape = self.network.maze.shape
+        labels = self.network.labels.ravel()
+        start_cell = network_graph.cell_index(start.x, start.y, shape)
+        end_cell = network_graph.cell_index(end.x, end.y, shape)
+
+        # the fastest route is searched exactly on the whole grid
+        _, path = self.network.travel_time(start_cell, end_cell)
+        if not path:
+            raise Exception("No valid path found!")
+
+        routes = [dict(route_details(self.network, self.vehicle_type, path), overlap=0.0)]
+        accepted_segments = [set(labels[path].tolist())]
+        found_segments = accepted_segments[0]
+        penalties = np.ones(self.network.segment_count)
+
+        for _ in range(iterations_per_alternative * k):
+            if len(routes) >= k:
+                break
+
+            # penalize the last found route, also if it was rejected, to push the next search further away
+            penalties[list(found_segments)] *= penalty
+
+            segments = self.segment_route(labels[start_cell], labels[end_cell], penalties)
+            path = self.unpack(start_cell, end_cell, segments) if segments else []
+            if not path:
+                break
+
+            found_segments = set(labels[path].tolist())
+            overlap = max(len(found_segments & other) / len(found_segments) for other in accepted_segments)
+            if overlap <= max_overlap:
+                routes.append(dict(route_details(self.network, self.vehicle_type, path), overlap=round(overlap, 2)))
+                accepted_segments.append(found_segments)
+
+        return sorted(routes, key=lambda route: route["minutes"])
+
+def route_details(network: network_vulnerability.VulnerableNetwork, vehicle_type: str, path: list[int]) -> dict:
+    """
+    Calculates the distance, time and network breakdown of a route.
+
+    Inputs:
+        network: The network the route lies on.
+        vehicle_type: The vehicle type of the network, 'train' or 'car'.
+        path: The flat indices of the route.
+
+    Outputs:
+        _: A dictionary with the real distance in km, the time in minutes, the breakdown {network title: {distance, minutes}} and the path.
+    """
+    cells = np.array(path)
+    steps = np.abs(np.diff(np.stack(np.divmod(cells, network.maze.shape[1])), axis=1)).sum(axis=0)
+    step_lengths = np.where(steps == 2, network_graph.DIAGONAL_COST, network_graph.STRAIGHT_COST) / PRECISION_FACTOR
+    step_minutes = step_lengths * (network.pace[cells[:-1]] + network.pace[cells[1:]]) / 2
+
+    # a step belongs to the fast network if both of its cells do
+    fast_steps = network.fast_cells[cells[:-1]] & network.fast_cells[cells[1:]]
+    slow_title, fast_title = comparison.network_titles[vehicle_type]
+
+    breakdown = {}
+    for title, steps_on_network in [(fast_title, fast_steps), (slow_title, ~fast_steps)]:
+        breakdown[title] = {
+            "distance": round(float(step_lengths[steps_on_network].sum()) * comparison.DISTANCE_SCALE_FACTOR),
+            "minutes": round(float(step_minutes[steps_on_network].sum()))
+        }
+
+    return {
+        "distance": round(float(step_lengths.sum()) * comparison.DISTANCE_SCALE_FACTOR),
+        "minutes": round(float(step_minutes.sum())),
+        "breakdown": breakdown,
+        "path": path
+    }
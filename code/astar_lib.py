@@ -1,9 +1,11 @@
 import numpy as np
 import sys
+import threading
+import weakref
 from parameters import NodePos
 
 #https://stakahama.gitlab.io/sie-eng270/C_intro.html#org363ad48
-from ctypes import c_int, c_float, Structure, CDLL, POINTER, pointer
+from ctypes import c_int, c_float, Structure, CDLL, POINTER, pointer, sizeof
 
 from os.path import exists
 from pathlib import Path
@@ -15,6 +17,12 @@ BORDER = 20
 VISITED = 30
 SOL_PATH = 40
 
+# reasons a bounded search stops, stored in the status of its SearchControl
+SEARCH_BOUNDED = 1
+SEARCH_NO_PATH = 2
+SEARCH_CANCELLED = 3
+SEARCH_BUDGET = 4
+
 # directory and library names 
 ROOT = Path(sys.path[0]).parent
 LIB_NAME = "a-star"
@@ -22,8 +30,13 @@ LIB_NAME = "a-star"
 code_dir = ROOT.joinpath("code")
 maze_dir = ROOT.joinpath("maze")
 
-# global variable to store the function
+# global variables to store the functions
 run_astar = None
+run_astar_cutoff = None
+run_bounded_astar = None
+
+# connected component labels of the maze arrays used by this process, key: id of the array
+loaded_components = {}
 
 """ define useful structs used to pass to the C program """
 
@@ -89,6 +102,65 @@ Node._fields_ = [
         ('walkState', c_int)
     ]
 
+class SearchControl(Structure):
+    """
+    Controls a bounded search and receives its result. Each search needs its own control, the cancel flag may be set from any other thread while the search runs.
+
+    Attributes:
+        weight (c_float): The factor of the heuristic, 1 is plain A*, larger weights find a first path faster.
+        epsilon (c_float): The search stops as soon as its path is proven to be at most epsilon times longer than the shortest path.
+        maxExpansions (c_int): The highest number of expanded nodes, 0 for no limit.
+        cancel (c_int): The search stops as soon as it is set to 1.
+        status (c_int): The reason the search stopped, one of the SEARCH_ constants.
+        expansions (c_int): The number of expanded nodes.
+        bound (c_float): The proven ratio between the length of the returned path and the shortest path, infinite if no path was found.
+    """
+    _fields_ = [
+        ('weight', c_float),
+        ('epsilon', c_float),
+        ('maxExpansions', c_int),
+        ('cancel', c_int),
+        ('status', c_int),
+        ('expansions', c_int),
+        ('bound', c_float)
+    ]
+
+class SearchTrace(Structure):
+    """
+    A preallocated int32 buffer receiving the expanded cells of a search in the order of their expansion, for replaying the search without copying the grid.
+    The buffer can be reused for several searches, each search overwrites it from the start.
+
+    Attributes:
+        entries (POINTER(c_int)): The data of the buffer, pairs of the flat index of an expanded cell and its F costs.
+        capacity (c_int): The number of pairs fitting into the buffer, later expansions are only counted.
+        length (c_int): The number of expansions of the last search.
+        buffer (np.ndarray): The buffer of shape (capacity, 2) the entries point to.
+
+    Methods:
+        __init__: Allocates the buffer.
+        expansions: Returns the recorded expansions of the last search.
+    """
+    _fields_ = [
+        ('entries', POINTER(c_int)),
+        ('capacity', c_int),
+        ('length', c_int)
+    ]
+
+    def __init__(self, capacity: int):
+        self.buffer = np.zeros((capacity, 2), dtype=np.int32)
+        self.entries = self.buffer.ctypes.data_as(POINTER(c_int))
+        self.capacity = capacity
+        self.length = 0
+
+    def expansions(self) -> np.ndarray:
+        """
+        Returns the recorded expansions of the last search.
+
+        Outputs:
+            _: A view of shape (expansions, 2) with the flat index of each expanded cell and its F costs (scaled like the distances by 10), at most capacity rows.
+        """
+        return self.buffer[:min(self.length, self.capacity)]
+
 def load_maze(filename: str) -> np.ndarray:
     """
     Loads a maze from a CSV file, which is a file containing 0's and 1's.
@@ -119,6 +191,98 @@ def is_in_bounds(pos: NodePos, maze: np.ndarray) -> bool:
 def is_walkable(pos: NodePos, maze: np.ndarray) -> bool:
     return maze[pos.y, pos.x] != 0
 
+def label_components(maze: np.ndarray) -> np.ndarray:
+    """
+    Labels the 8-connected components of the walkable cells of a maze, two cells are connected if a path exists between them.
+    The consecutive walkable cells of each row form a run, runs touching each other in adjacent rows (also diagonally) are joined with a union-find.
+
+    Inputs:
+        maze: np.ndarray - The maze array, where obstacles are 0.
+
+    Outputs:
+        labels: An int32 array of the maze shape with the component of each walkable cell, numbered from 0, and -1 for obstacles.
+    """
+    walkable = np.asarray(maze) != OBSTACLE
+    height, width = walkable.shape
+
+    # a run starts at each walkable cell whose left neighbor is an obstacle or outside of the maze
+    starts = walkable.copy()
+    starts[:, 1:] &= ~walkable[:, :-1]
+    runs = np.where(walkable, np.cumsum(starts).reshape(height, width) - 1, -1)
+
+    # pairs of runs touching each other between a row and the next one
+    pairs = []
+    for dx in (-1, 0, 1):
+        upper = runs[:-1, max(0, -dx):width - max(0, dx)]
+        lower = runs[1:, max(0, dx):width - max(0, -dx)]
+        touching = (upper != -1) & (lower != -1)
+        pairs.append(np.stack([upper[touching], lower[touching]], axis=1))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+
+    # https://en.wikipedia.org/wiki/Disjoint-set_data_structure
+    parents = list(range(int(starts.sum())))
+
+    def find(run: int) -> int:
+        while parents[run] != run:
+            parents[run] = parents[parents[run]]
+            run = parents[run]
+        return run
+
+    for upper_run, lower_run in pairs.tolist():
+        upper_root, lower_root = find(upper_run), find(lower_run)
+        if upper_root != lower_root:
+            parents[max(upper_root, lower_root)] = min(upper_root, lower_root)
+
+    # number the components of the runs from 0
+    _, run_components = np.unique([find(run) for run in range(len(parents))], return_inverse=True)
+    return np.where(walkable, run_components.astype(np.int32)[runs], -1).astype(np.int32)
+
+def set_components(maze: np.ndarray, labels: np.ndarray) -> None:
+    """
+    Keeps the component labels beside a maze array until the array is freed, e.g. labels updated incrementally after a conversion.
+
+    Inputs:
+        maze: np.ndarray - The maze array.
+        labels: np.ndarray - The labels as returned by label_components.
+    """
+    key = id(maze)
+    if key not in loaded_components:
+        # the entry is removed with its array, so a new array reusing the id never gets stale labels
+        weakref.finalize(maze, loaded_components.pop, key, None)
+    loaded_components[key] = labels
+
+def maze_components(maze: np.ndarray) -> np.ndarray:
+    """
+    Returns the component labels of a maze array. The labels are computed at the first query of the array and kept beside it, so every later query is a dictionary lookup.
+    The mazes are never changed in place, a changed network is a new array.
+
+    Inputs:
+        maze: np.ndarray - The maze array.
+
+    Outputs:
+        _: The labels as returned by label_components.
+    """
+    labels = loaded_components.get(id(maze))
+    if labels is None:
+        labels = label_components(maze)
+        set_components(maze, labels)
+    return labels
+
+def are_connected(start: NodePos, end: NodePos, maze: np.ndarray) -> bool:
+    """
+    Checks in O(1) with the component labels if a path exists between two walkable positions.
+
+    Inputs:
+        start: NodePos - The start position.
+        end: NodePos - The end position.
+        maze: np.ndarray - The maze array.
+
+    Outputs:
+        _: True if both positions lie in the same component.
+    """
+    labels = maze_components(maze)
+    return labels[start.y, start.x] == labels[end.y, end.x]
+
 def check_node(pos: NodePos, pos_name: str, maze: np.ndarray) -> bool:
     """
     Checks if the given position in the maze is walkable (not an obstacle).
@@ -153,6 +317,19 @@ def check_nodes(start: NodePos, end: NodePos, maze: np.ndarray) -> None:
     check_node(start, "Start", maze)
     check_node(end, "End", maze)
 
+def node_fields(nodes) -> np.ndarray:
+    """
+    Views a contiguous array of Node structures as a numpy array of its int fields, without copying, so all nodes can be read and written at once.
+
+    Inputs:
+        nodes - A contiguous array of Node structures.
+
+    Outputs:
+        _: An int array with a row per node, the columns of a field start at its offset divided by the size of c_int.
+    """
+    # https://numpy.org/doc/stable/reference/generated/numpy.frombuffer.html
+    return np.frombuffer(nodes, dtype=np.intc).reshape(len(nodes), sizeof(Node) // sizeof(c_int))
+
 def createNodes(maze: np.ndarray):
     """
     Creates a contiguous array of Node structures based on the maze array.
@@ -164,14 +341,16 @@ def createNodes(maze: np.ndarray):
         A contiguous array of Node structures corresponding to the maze layout.
     """
     x_dim = maze.shape[1]
-    y_dim = maze.shape[0]
     n = maze.size
 
+    # all fields start zeroed, so the parents are NULL and the costs 0
     nodes = (Node * n)()
+    fields = node_fields(nodes)
 
-    for i in range(y_dim):
-        for j in range(x_dim):
-            nodes[i * x_dim + j] = Node(j, i, maze[i, j])
+    y, x = np.divmod(np.arange(n), x_dim)
+    fields[:, (Node.pos.offset + Pos.x.offset) // sizeof(c_int)] = x
+    fields[:, (Node.pos.offset + Pos.y.offset) // sizeof(c_int)] = y
+    fields[:, Node.walkState.offset // sizeof(c_int)] = np.asarray(maze).ravel()
 
     return nodes
 
@@ -187,12 +366,11 @@ def mazeFromNodes(nodes, shape) -> np.ndarray:
         np.ndarray: A numpy array representing the maze with updated node states.
     """
     maze = np.full(shape, np.nan)
+    fields = node_fields(nodes)
 
-    for i in range(len(nodes)):
-        x = nodes[i].pos.x
-        y = nodes[i].pos.y
-        walkState = nodes[i].walkState
-        maze[y, x] = walkState
+    x = fields[:, (Node.pos.offset + Pos.x.offset) // sizeof(c_int)]
+    y = fields[:, (Node.pos.offset + Pos.y.offset) // sizeof(c_int)]
+    maze[y, x] = fields[:, Node.walkState.offset // sizeof(c_int)]
     return maze
 
 # function to initialize the shared library from the C code
@@ -204,7 +382,7 @@ def load_library():
         FileNotFoundError: If the library file does not exist.
     """
     # modify global variable
-    global run_astar
+    global run_astar, run_astar_cutoff, run_bounded_astar
 
     # for UNIX users
     # lib_path = ROOT.joinpath(LIB_NAME + ".so")
@@ -222,8 +400,18 @@ def load_library():
     # returns distance covered
     run_astar.restype = c_float
 
+    run_astar_cutoff = c_lib.run_astar_cutoff
+    # same arguments as run_astar, the cutoff distance, a pointer receiving the number of skipped nodes and an optional trace
+    run_astar_cutoff.argtypes = [POINTER(Pos), POINTER(Pos), POINTER(Node), POINTER(Pos), c_float, POINTER(c_int), POINTER(SearchTrace)]
+    run_astar_cutoff.restype = c_float
+
+    run_bounded_astar = c_lib.run_bounded_astar
+    # same arguments as run_astar and the control of the search
+    run_bounded_astar.argtypes = [POINTER(Pos), POINTER(Pos), POINTER(Node), POINTER(Pos), POINTER(SearchControl)]
+    run_bounded_astar.restype = c_float
+
 # function to run the astar algorithm written in C
-def py_run_astar(start: NodePos, end: NodePos, maze: np.ndarray) -> tuple[float, np.ndarray]:    
+def py_run_astar(start: NodePos, end: NodePos, maze: np.ndarray, cutoff: float | None = None, stats: dict | None = None, trace: SearchTrace | None = None) -> tuple[float, np.ndarray]:    
     """
     Executes the ``A* pathfinding algorithm`` to find the shortest path through a given maze from a start point to an end point. This function is a Python wrapper that calls the A* algorithm implemented in C. The detailed process includes:
 
@@ -238,15 +426,22 @@ def py_run_astar(start: NodePos, end: NodePos, maze: np.ndarray) -> tuple[float,
         start - The starting position for the A* algorithm.
         end - The ending position for the A* algorithm.
         maze - The maze array in which the algorithm will run.
+        cutoff - An optional upper bound of the distance, e.g. the length of a known path. Nodes which cannot lie on a path within it are skipped instead of being added to the border.
+        stats - An optional dictionary which receives the number of expanded nodes and the number of nodes skipped because of the cutoff.
+        trace - An optional trace which receives the expanded cells in the order of their expansion.
 
     Outputs:
-        A tuple containing the success distance and the maze array with updated node states.
+        A tuple containing the success distance (infinite if no path within the cutoff exists) and the maze array with updated node states.
     """
     if run_astar == None:
         raise ValueError("The library was not loaded correctly!")
     
     # check the nodes, that they are in the bounds 
     check_nodes(start, end, maze)
+
+    # positions in different components would make the search exhaust the whole component of the start
+    if not are_connected(start, end, maze):
+        raise Exception("No valid path found!")
     
     # https://www.geeksforgeeks.org/using-pointers-in-python-using-ctypes/
     # https://docs.python.org/3/library/ctypes.html#ctypes-pointers
@@ -255,14 +450,102 @@ def py_run_astar(start: NodePos, end: NodePos, maze: np.ndarray) -> tuple[float,
     dims = pointer(Pos(maze.shape[1], maze.shape[0]))
 
     nodes = createNodes(maze)
-    success_distance = float(run_astar(startPos, endPos, nodes, dims))
+    skipped = c_int(0)
+    # a negative cutoff disables it
+    success_distance = float(run_astar_cutoff(startPos, endPos, nodes, dims, -1 if cutoff is None else cutoff, pointer(skipped), None if trace is None else pointer(trace)))
 
     # check if distance is -1, which means there was a memory allocation error
     if(success_distance == -1):
         raise MemoryError("The memory for border nodes could not be allocated!")
 
+    solved_maze = mazeFromNodes(nodes, maze.shape)
+    if stats is not None:
+        stats.update(expanded=int(np.count_nonzero(solved_maze == VISITED) + np.count_nonzero(solved_maze == SOL_PATH)), skipped=skipped.value)
+
     # check if distance is not 0
     if(not success_distance):
+        # start and end are connected, so only the cutoff can prevent a path
+        if cutoff is not None:
+            return float("inf"), solved_maze
         raise Exception("No valid path found!")
 
-    return success_distance, mazeFromNodes(nodes, maze.shape)
\ No newline at end of file
+    return success_distance, solved_maze
+
+# function to run the bounded suboptimal search written in C
+def py_run_bounded_astar(start: NodePos, end: NodePos, maze: np.ndarray, epsilon: float = 1.0, weight: float | None = None, max_expansions: int = 0, deadline: float | None = None, control: SearchControl | None = None) -> tuple[float, np.ndarray, dict]:
+    """
+    Executes the ``anytime weighted A* algorithm``: the nodes are expanded in the order of G + weight * H, so a first path is found after few expansions, then the search keeps improving the path until it is proven to be at most epsilon times longer than the shortest path.
+    The search also stops when the expansion budget is used up, the deadline passed or the cancel flag of the control was set, and returns the best path found so far with its proven bound.
+    ctypes releases the GIL during the search, so several searches can run in parallel Python threads, each with its own control.
+
+    Inputs:
+        start - The starting position.
+        end - The ending position.
+        maze - The maze array in which the algorithm will run.
+        epsilon - The accepted ratio between the returned path and the shortest path, at least 1.
+        weight - The factor of the heuristic, at least 1. Defaults to epsilon, so the first path found is already good enough.
+        max_expansions - The highest number of expanded nodes, 0 for no limit.
+        deadline - The highest number of seconds the search may run, None for no limit.
+        control - An optional control to cancel the search from another thread by setting its cancel attribute to 1. A cancel set before the search starts stops it at once. The deadline only clears the cancel flag it set itself, so a control can be reused after a deadline.
+
+    Outputs:
+        A tuple containing the distance of the best path found (infinite if none was found), the maze array with updated node states and a dictionary with the status ('bounded', 'cancelled', 'deadline' or 'budget'), the number of expansions and the proven bound.
+
+    Raises:
+        ValueError: If epsilon or weight are smaller than 1.
+    """
+    if run_bounded_astar == None:
+        raise ValueError("The library was not loaded correctly!")
+    if epsilon < 1 or (weight is not None and weight < 1):
+        raise ValueError("Epsilon and the weight have to be at least 1!")
+
+    check_nodes(start, end, maze)
+    if not are_connected(start, end, maze):
+        raise Exception("No valid path found!")
+
+    startPos = pointer(Pos(*start.get_pos()))
+    endPos = pointer(Pos(*end.get_pos()))
+    dims = pointer(Pos(maze.shape[1], maze.shape[0]))
+
+    control = control if control is not None else SearchControl()
+    control.weight = epsilon if weight is None else weight
+    control.epsilon = epsilon
+    control.maxExpansions = max_expansions
+    control.status = 0
+
+    # https://docs.python.org/3/library/threading.html#timer-objects
+    # the timer thread sets the cancel flag, which the C loop polls before each expansion
+    # a flag already set by the caller stays a cancellation of the caller
+    expired = threading.Event()
+    def expire() -> None:
+        if not control.cancel:
+            expired.set()
+            control.cancel = 1
+
+    timer = threading.Timer(deadline, expire) if deadline is not None else None
+    if timer is not None:
+        timer.start()
+
+    try:
+        nodes = createNodes(maze)
+        distance = float(run_bounded_astar(startPos, endPos, nodes, dims, control))
+    finally:
+        if timer is not None:
+            # joined, so an expiry running right now cannot set the flag after it was cleared
+            timer.cancel()
+            timer.join()
+        # only the deadline's own cancel is cleared, so the control can be reused
+        if expired.is_set():
+            control.cancel = 0
+
+    if distance == -1:
+        raise MemoryError("The memory for border nodes could not be allocated!")
+    if control.status == SEARCH_NO_PATH:
+        raise Exception("No valid path found!")
+
+    statuses = {SEARCH_BOUNDED: "bounded", SEARCH_CANCELLED: "deadline" if expired.is_set() else "cancelled", SEARCH_BUDGET: "budget"}
+    # without a path the bound is infinite
+    if control.bound == float("inf"):
+        distance = float("inf")
+
+    return distance, mazeFromNodes(nodes, maze.shape), {"status": statuses[control.status], "expansions": control.expansions, "bound": control.bound}
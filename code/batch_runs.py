@@ -0,0 +1,247 @@
+import sys
+import json
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import astar_lib
+import file_cache
+import investement_calculator
+import result_store
+import train_car_comparison as comparison
+from parameters import NodePos, params_dir
+
+# folder shared by all shards of a batch job, e.g. on a network drive for shards on several hosts
+batch_dir = comparison.output_dir.joinpath("batch")
+
+default_shard_count = 4
+cities_file = "cities.json"
+
+class BatchJob():
+    """
+    A batch of independent tasks, which is split into deterministic shards.
+    Each task is identified by a key and returns a list of result records as dictionaries.
+
+    Attributes:
+        name (str): The name of the job, also the name of its folder in the batch directory.
+        tasks (dict): The arguments of the task function for each task key.
+        task_function (callable): A module level function computing the records of a task from its arguments.
+        sources (dict): The digests of the files the results depend on, checkpoints of other sources are discarded.
+
+    Methods:
+        __init__: Initializes the job.
+        shard_tasks: Returns the task keys of a shard.
+    """
+    def __init__(self, name: str, tasks: dict[str, tuple], task_function, sources: list[Path]) -> None:
+        """
+        Initializes a new BatchJob instance.
+
+        Inputs:
+            name: The name of the job.
+            tasks: The arguments of the task function for each task key.
+            task_function: A module level function, so worker processes can receive it.
+            sources: The paths of the files the results depend on.
+        """
+        self.name = name
+        self.tasks = tasks
+        self.task_function = task_function
+        self.sources = file_cache.source_digests(sources)
+
+    def shard_tasks(self, shard: int, shard_count: int) -> list[str]:
+        """
+        Returns the task keys of a shard. A task belongs to the shard given by the digest of its key, so every process and host agrees on the split without communicating, and adding a task does not move the others.
+
+        Inputs:
+            shard: The number of the shard, from 0 to shard_count - 1.
+            shard_count: The number of shards.
+
+        Outputs:
+            _: The sorted task keys of the shard.
+        """
+        return sorted(key for key in self.tasks if shard_of(key, shard_count) == shard)
+
+def shard_of(key: str, shard_count: int) -> int:
+    """
+    Assigns a task key to a shard. The digest does not depend on the process like the built-in hash of strings.
+
+    Inputs:
+        key: The task key.
+        shard_count: The number of shards.
+
+    Outputs:
+        _: The number of the shard.
+    """
+    return int(hashlib.sha1(key.encode()).hexdigest(), 16) % shard_count
+
+def checkpoint_path(job: BatchJob, shard: int, shard_count: int, directory: Path = batch_dir) -> Path:
+    """
+    Returns the path of the checkpoint of a shard.
+
+    Inputs:
+        job: The batch job.
+        shard: The number of the shard.
+        shard_count: The number of shards.
+        directory: The batch directory.
+
+    Outputs:
+        _: The path of the checkpoint file.
+    """
+    return directory.joinpath(job.name, f"shard-{shard}-of-{shard_count}.json")
+
+def read_checkpoint(job: BatchJob, shard: int, shard_count: int, directory: Path = batch_dir) -> dict[str, list[dict]]:
+    """
+    Reads the finished tasks of a shard from its checkpoint.
+
+    Inputs:
+        job: The batch job.
+        shard: The number of the shard.
+        shard_count: The number of shards.
+        directory: The batch directory.
+
+    Outputs:
+        _: The records of each finished task, empty if there is no checkpoint or it was written for other sources.
+    """
+    try:
+        with open(checkpoint_path(job, shard, shard_count, directory), 'r') as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return checkpoint["results"] if checkpoint.get("sources") == job.sources else {}
+
+def run_shard(job: BatchJob, shard: int, shard_count: int, directory: Path = batch_dir) -> dict:
+    """
+    Runs the unfinished tasks of a shard. After each task the checkpoint of the shard is replaced atomically, so a crashed or preempted shard continues with the next unfinished task when it is started again.
+    Failed tasks are not checkpointed and are tried again by the next run.
+
+    Inputs:
+        job: The batch job.
+        shard: The number of the shard.
+        shard_count: The number of shards.
+        directory: The batch directory.
+
+    Outputs:
+        _: A dictionary with the shard number and the number of tasks, skipped (already finished) tasks, newly finished tasks and the failures {task key: error}.
+    """
+    if astar_lib.run_astar is None:
+        astar_lib.load_library()
+
+    path = checkpoint_path(job, shard, shard_count, directory)
+    keys = job.shard_tasks(shard, shard_count)
+    results = read_checkpoint(job, shard, shard_count, directory)
+    # results of tasks no longer part of the shard are dropped
+    results = {key: records for key, records in results.items() if key in keys}
+    stats = {"shard": shard, "tasks": len(keys), "skipped": len(results), "finished": 0, "failed": {}}
+
+    for key in keys:
+        if key in results:
+            continue
+        try:
+            results[key] = job.task_function(*job.tasks[key])
+        except Exception as e:
+            stats["failed"][key] = str(e)
+            continue
+
+        checkpoint = {"job": job.name, "shard": shard, "shard_count": shard_count, "sources": job.sources, "results": results}
+        file_cache.atomic_write(path, lambda f: f.write(json.dumps(checkpoint).encode()))
+        stats["finished"] += 1
+
+    return stats
+
+def merge_shards(job: BatchJob, shard_count: int, directory: Path = batch_dir, store: result_store.ResultStore | None = None) -> list[result_store.ResultRecord]:
+    """
+    Merges the checkpoints of all shards into the result store, once every task is finished.
+    The records replace the store shard of the job as a whole, so merging again does not duplicate them.
+
+    Inputs:
+        job: The batch job.
+        shard_count: The number of shards.
+        directory: The batch directory.
+        store: The result store, defaults to a store in the default directory writing as 'batch-<job name>'.
+
+    Outputs:
+        records: The merged records in the order of the task keys.
+
+    Raises:
+        Exception: If a task of any shard is not finished.
+    """
+    results = {}
+    for shard in range(shard_count):
+        results.update(read_checkpoint(job, shard, shard_count, directory))
+
+    missing = [key for key in job.tasks if key not in results]
+    if missing:
+        raise Exception(f"{len(missing)} tasks are not finished yet, e.g. {missing[0]}! Run their shards again before merging.")
+
+    records = [result_store.ResultRecord.from_dict(values) for key in sorted(job.tasks) for values in results[key]]
+    store = store or result_store.ResultStore(writer_id=f"batch-{job.name}")
+    store.replace(records)
+    return records
+
+def run_batch(job: BatchJob, shard_count: int = default_shard_count, workers: int | None = None, directory: Path = batch_dir) -> tuple[list[dict], list[result_store.ResultRecord]]:
+    """
+    Runs all shards of a job as independent local processes, then merges them into the result store.
+    Shards on other hosts run the same job with run_shard on the shared batch directory instead.
+
+    Inputs:
+        job: The batch job.
+        shard_count: The number of shards.
+        workers: The number of worker processes. Defaults to the number of CPUs.
+        directory: The batch directory.
+
+    Outputs:
+        stats, records: The statistics of each shard as returned by run_shard and the merged records.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        stats = list(executor.map(run_shard, [job] * shard_count, range(shard_count), [shard_count] * shard_count, [directory] * shard_count))
+
+    return stats, merge_shards(job, shard_count, directory)
+
+""" jobs """
+
+def comparison_records(start_name: str, end_name: str, start: NodePos, end: NodePos) -> list[dict]:
+    """
+    Runs the train car comparison of a city pair and returns its result records, like the comparison mode stores them.
+
+    Inputs:
+        start_name: The name of the departure city.
+        end_name: The name of the arrival city.
+        start: The position of the departure city.
+        end: The position of the arrival city.
+
+    Outputs:
+        _: The records of every vehicle as dictionaries.
+    """
+    rail_title, _, rail_distance, rail_hours, rail_minutes, _ = comparison.rail_analysis(start, end, show_plot=False)
+    car_title, _, car_distance, car_hours, car_minutes, _ = comparison.car_analysis(start, end, show_plot=False)
+
+    rates_per_vehicle, _ = investement_calculator.load_vehicle_rates_and_units()
+    calculated_rates = investement_calculator.calculate_rates(rates_per_vehicle, rail_distance, car_distance)
+    records = result_store.build_comparison_records(start_name, end_name, rail_title, rail_distance, rail_hours * 60 + rail_minutes, car_title, car_distance, car_hours * 60 + car_minutes, calculated_rates, rates_per_vehicle)
+    return [record.jsonable() for record in records]
+
+def comparison_job(cities: dict[str, NodePos]) -> BatchJob:
+    """
+    Creates the job comparing train and car for every city pair.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects.
+
+    Outputs:
+        _: The batch job, with a task per city pair.
+    """
+    tasks = {f"{start_name}-{end_name}": (start_name, end_name, cities[start_name], cities[end_name]) for start_name, end_name in comparison.city_pairs(cities)}
+    maze_files = [maze_file for networks in comparison.vehicle_networks.values() for maze_file in networks[:2]]
+    sources = [astar_lib.maze_dir.joinpath(maze_file) for maze_file in maze_files]
+    # the speeds and the rates are defined in these files
+    sources += [params_dir.joinpath(cities_file), params_dir.joinpath(investement_calculator.rates_comparison_file), astar_lib.code_dir.joinpath("train_car_comparison.py")]
+    return BatchJob("comparison", tasks, comparison_records, sources)
+
+# a shard on another host is run with: python code/batch_runs.py <shard> <shard count>
+# and all shards are merged with: python code/batch_runs.py merge <shard count>
+if __name__ == '__main__':
+    job = comparison_job(comparison.load_maze_locations(cities_file))
+    if sys.argv[1] == "merge":
+        print(f"Merged {len(merge_shards(job, int(sys.argv[2])))} records")
+    else:
+        print(run_shard(job, int(sys.argv[1]), int(sys.argv[2])))
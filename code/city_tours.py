@@ -0,0 +1,342 @@
+import numpy as np
+
+import astar_lib
+import alternative_routes
+import distance_fields
+import file_cache
+import network_graph
+import network_snapping
+import network_vulnerability
+import parameters
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST, PRECISION_FACTOR
+from parameters import NodePos, params_dir
+
+# https://en.wikipedia.org/wiki/Travelling_salesman_problem
+# https://en.wikipedia.org/wiki/Held%E2%80%93Karp_algorithm
+# https://en.wikipedia.org/wiki/2-opt
+# Or: Traveling salesman-type combinatorial problems and their relation to the logistics of regional blood banks, Northwestern University (1976)
+
+# parameter file name and its keys
+tour_parameter_file = "tour.json"
+# the cities of the round trip, the first one is the start and end of the tour
+tour_cities_name = "cities"
+# the largest number of cities solved exactly, larger tours are improved heuristically
+exact_limit_name = "exact_limit"
+
+# Held-Karp needs 2^(n-1) * (n-1) states, 12 cities take a few hundred milliseconds
+default_exact_limit = 12
+
+# the travel time fields of a network are saved in a folder beside the slow maze, e.g. maze/railnetwork-time-fields/
+time_fields_suffix = "-time-fields"
+
+# the longest segment Or-opt moves to another position of the tour
+OR_OPT_SEGMENT_LENGTH = 3
+# smallest improvement in minutes accepted by the local search, smaller ones are rounding errors
+IMPROVEMENT_EPSILON = 1e-9
+
+class CityTours():
+    """
+    Finds the fastest round trip through a set of cities on the network of a vehicle type.
+    The travel time matrix is filled from one Dijkstra expansion per city, which reaches all other cities at once, instead of a search per pair. The expansion yields the travel time field of the city, which is cached beside the maze, so later tours only expand the cities without a valid field.
+
+    Attributes:
+        vehicle_type (str): The vehicle type, 'train' or 'car'.
+        network (VulnerableNetwork): The network with its adjacency and pace.
+        directory (Path): The folder containing the travel time fields.
+        sources (dict): The digests of the mazes and the speeds, fields of other sources are rebuilt.
+        city_cells (dict): The snapped cell of each city, cities too far away from the network are missing.
+        fields (dict): The loaded flat travel time fields in minutes, key: city name.
+        built (list): The names of the cities whose field was (re)built by this instance.
+
+    Methods:
+        __init__: Loads the network and snaps the cities.
+        time_field: Returns the travel time field of a city.
+        matrix: Fills the travel time matrix of cities.
+        tour: Finds the fastest round trip through cities and stitches its legs.
+    """
+    def __init__(self, vehicle_type: str, cities: dict[str, NodePos], networks: dict[str, np.ndarray] | None = None) -> None:
+        """
+        Initializes a new CityTours instance.
+
+        Inputs:
+            vehicle_type: The vehicle type as defined in comparison.vehicle_networks, 'train' or 'car'.
+            cities: A dictionary mapping city names to their NodePos objects, measurement nodes are skipped.
+            networks: Optional networks already loaded with comparison.load_networks.
+        """
+        self.vehicle_type = vehicle_type
+        self.network = network_vulnerability.VulnerableNetwork(vehicle_type, networks)
+
+        slow_maze_file, fast_maze_file, *_ = comparison.vehicle_networks[vehicle_type]
+        self.directory = astar_lib.maze_dir.joinpath(slow_maze_file.rsplit(".", 1)[0] + time_fields_suffix)
+        # the speeds are defined in train_car_comparison.py
+        self.sources = file_cache.source_digests([astar_lib.maze_dir.joinpath(slow_maze_file), astar_lib.maze_dir.joinpath(fast_maze_file), astar_lib.code_dir.joinpath("train_car_comparison.py")])
+
+        self.city_cells = {}
+        for name, pos in cities.items():
+            if name.startswith(comparison.measurement_node_prefix):
+                continue
+            snapped_pos, distance = network_snapping.index_for(self.network.maze, slow_maze_file).snap(pos)
+            if distance <= network_snapping.max_snap_distance:
+                self.city_cells[name] = network_graph.cell_index(snapped_pos.x, snapped_pos.y, self.network.maze.shape)
+
+        self.fields = {}
+        self.built = []
+
+    def time_field(self, city_name: str) -> np.ndarray:
+        """
+        Returns the travel time from a city to every cell, loaded from the cache or calculated with a single Dijkstra expansion.
+
+        Inputs:
+            city_name: The name of the city.
+
+        Outputs:
+            _: The flat float32 array of minutes, infinite for unreachable cells.
+        """
+        if city_name in self.fields:
+            return self.fields[city_name]
+
+        cell = comparison.check_destination(city_name, self.city_cells)
+        manifest = file_cache.read_manifest(self.directory)
+        if manifest.get("sources") != self.sources:
+            # changed mazes or speeds invalidate every field
+            manifest = {"sources": self.sources, "cities": {}}
+        entry = manifest["cities"].get(city_name)
+        path = self.directory.joinpath(distance_fields.field_file_name(city_name))
+
+        if entry is not None and entry["cell"] == cell and path.exists():
+            self.fields[city_name] = np.load(path)
+            return self.fields[city_name]
+
+        costs = network_graph.distance_field(self.network.adjacency, cell, cell_weights=self.network.pace)
+        minutes = np.where(costs < INFINITE_COST, costs / PRECISION_FACTOR, np.inf).astype(np.float32)
+        file_cache.save_array(path, minutes)
+
+        manifest["cities"][city_name] = {"cell": cell, "file": path.name}
+        file_cache.write_manifest(self.directory, manifest)
+        self.fields[city_name] = minutes
+        self.built.append(city_name)
+        return minutes
+
+    def matrix(self, city_names: list[str]) -> np.ndarray:
+        """
+        Fills the travel time matrix of cities, each row is read from the travel time field of its city.
+
+        Inputs:
+            city_names: The names of the cities.
+
+        Outputs:
+            _: The minutes from each city (row) to each city (column).
+        """
+        cells = [comparison.check_destination(name, self.city_cells) for name in city_names]
+        return np.array([self.time_field(name)[cells] for name in city_names], dtype=np.float64)
+
+    def tour(self, city_names: list[str], exact_limit: int = default_exact_limit) -> dict:
+        """
+        Finds the fastest round trip through cities, starting and ending at the first city, and stitches the routes of its legs into one path.
+
+        Inputs:
+            city_names: The names of the cities, each visited once.
+            exact_limit: The largest number of cities solved exactly with Held-Karp, larger tours are solved with 2-opt and Or-opt.
+
+        Outputs:
+            _: A dictionary with the cities in the order of the tour (the first city repeated at the end), the minutes, the distance in km, whether the tour is exact, the legs as route dictionaries of alternative_routes.route_details with their start and end city, and the stitched path.
+
+        Raises:
+            Exception: If a city cannot be reached from another one.
+        """
+        matrix = self.matrix(city_names)
+        if not np.isfinite(matrix).all():
+            start, end = np.argwhere(~np.isfinite(matrix))[0]
+            raise Exception(f"No valid path found from {city_names[start]} to {city_names[end]}!")
+
+        order, exact = solve_tour(matrix, exact_limit)
+        tour_names = [city_names[i] for i in order + order[:1]]
+
+        legs = []
+        path = []
+        for start_name, end_name in zip(tour_names, tour_names[1:]):
+            _, leg_path = self.network.travel_time(self.city_cells[start_name], self.city_cells[end_name])
+            leg = alternative_routes.route_details(self.network, self.vehicle_type, leg_path)
+            leg.update(start_city=start_name, end_city=end_name)
+            legs.append(leg)
+            # the first cell of a leg is the last cell of the previous leg
+            path += leg_path if not path else leg_path[1:]
+
+        return {
+            "cities": tour_names,
+            "minutes": round(tour_minutes(matrix, order)),
+            "distance": sum(leg["distance"] for leg in legs),
+            "exact": exact,
+            "legs": legs,
+            "path": path
+        }
+
+""" solvers """
+
+def tour_minutes(matrix: np.ndarray, order: list[int]) -> float:
+    """
+    Calculates the travel time of a round trip.
+
+    Inputs:
+        matrix: The travel time matrix.
+        order: The indices of the cities in the order of the tour, the tour returns to the first one.
+
+    Outputs:
+        _: The minutes of all legs including the return to the first city.
+    """
+    return float(matrix[order, np.roll(order, -1)].sum())
+
+def held_karp(matrix: np.ndarray) -> list[int]:
+    """
+    Finds the fastest round trip exactly with the dynamic program of Held and Karp.
+    A state is a set of visited cities (a bit mask without the start city) and the last visited city, it holds the fastest path from the start city through the set ending at that city.
+    The states of a set are updated at once with numpy, because the fastest path through the set without the last city is known for every city it could end at.
+
+    Inputs:
+        matrix: The travel time matrix of n cities.
+
+    Outputs:
+        order: The indices of the cities in the order of the fastest tour, starting with 0.
+    """
+    n = len(matrix)
+    if n <= 3:
+        # every order is the same round trip in one or the other direction
+        return list(range(n))
+
+    others = n - 1
+    inner = matrix[1:, 1:]
+    # times[mask, j]: fastest path from city 0 through the cities of mask ending at city j + 1, infinite if j is not in mask
+    times = np.full((1 << others, others), np.inf)
+    parents = np.full((1 << others, others), -1, dtype=np.int32)
+    for j in range(others):
+        times[1 << j, j] = matrix[0, j + 1]
+
+    for mask in range(1, 1 << others):
+        for j in range(others):
+            previous_mask = mask ^ (1 << j)
+            if not mask & (1 << j) or not previous_mask:
+                continue
+            candidates = times[previous_mask] + inner[:, j]
+            k = int(np.argmin(candidates))
+            times[mask, j] = candidates[k]
+            parents[mask, j] = k
+
+    mask = (1 << others) - 1
+    last = int(np.argmin(times[mask] + matrix[1:, 0]))
+    order = []
+    while last != -1:
+        order.append(last + 1)
+        mask, last = mask ^ (1 << last), int(parents[mask, last])
+    return [0] + order[::-1]
+
+def nearest_neighbor_tour(matrix: np.ndarray) -> list[int]:
+    """
+    Builds a round trip by always travelling to the nearest unvisited city, the start of the local search.
+
+    Inputs:
+        matrix: The travel time matrix.
+
+    Outputs:
+        order: The indices of the cities in the order of the tour, starting with 0.
+    """
+    order = [0]
+    unvisited = set(range(1, len(matrix)))
+    while unvisited:
+        nearest = min(unvisited, key=lambda city: matrix[order[-1], city])
+        order.append(nearest)
+        unvisited.remove(nearest)
+    return order
+
+def two_opt(matrix: np.ndarray, order: list[int]) -> bool:
+    """
+    Applies the first improving 2-opt move: two legs are replaced by reconnecting their ends, which reverses the cities between them.
+    The network has no one-way legs, so the reversed part takes the same time.
+
+    Inputs:
+        matrix: The travel time matrix.
+        order: The tour, changed in place. The first city stays in place.
+
+    Outputs:
+        _: True if the tour was improved.
+    """
+    n = len(order)
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            a, b, c, d = order[i - 1], order[i], order[j], order[(j + 1) % n]
+            if matrix[a, c] + matrix[b, d] - matrix[a, b] - matrix[c, d] < -IMPROVEMENT_EPSILON:
+                order[i:j + 1] = order[i:j + 1][::-1]
+                return True
+    return False
+
+def or_opt(matrix: np.ndarray, order: list[int]) -> bool:
+    """
+    Applies the first improving Or-opt move: a segment of up to OR_OPT_SEGMENT_LENGTH consecutive cities is moved to another position of the tour.
+
+    Inputs:
+        matrix: The travel time matrix.
+        order: The tour, changed in place. The first city stays in place.
+
+    Outputs:
+        _: True if the tour was improved.
+    """
+    n = len(order)
+    for length in range(1, min(OR_OPT_SEGMENT_LENGTH, n - 2) + 1):
+        for i in range(1, n - length + 1):
+            segment = order[i:i + length]
+            before, after = order[i - 1], order[(i + length) % n]
+            removal_gain = matrix[before, segment[0]] + matrix[segment[-1], after] - matrix[before, after]
+
+            rest = order[:i] + order[i + length:]
+            for p in range(len(rest)):
+                a, b = rest[p], rest[(p + 1) % len(rest)]
+                if p == i - 1:
+                    continue
+                if matrix[a, segment[0]] + matrix[segment[-1], b] - matrix[a, b] - removal_gain < -IMPROVEMENT_EPSILON:
+                    order[:] = rest[:p + 1] + segment + rest[p + 1:]
+                    return True
+    return False
+
+def heuristic_tour(matrix: np.ndarray) -> list[int]:
+    """
+    Finds a fast round trip with a nearest neighbor tour improved by 2-opt and Or-opt moves until neither finds an improvement.
+
+    Inputs:
+        matrix: The travel time matrix.
+
+    Outputs:
+        order: The indices of the cities in the order of the tour, starting with 0.
+    """
+    order = nearest_neighbor_tour(matrix)
+    while two_opt(matrix, order) or or_opt(matrix, order):
+        pass
+    return order
+
+def solve_tour(matrix: np.ndarray, exact_limit: int = default_exact_limit) -> tuple[list[int], bool]:
+    """
+    Finds the fastest round trip exactly for small sets of cities and heuristically for larger ones.
+
+    Inputs:
+        matrix: The travel time matrix.
+        exact_limit: The largest number of cities solved exactly.
+
+    Outputs:
+        order, exact: The indices of the cities in the order of the tour starting with 0, and True if the tour is optimal.
+    """
+    if len(matrix) <= exact_limit:
+        return held_karp(matrix), True
+    return heuristic_tour(matrix), False
+
+def load_tour(filename: str) -> tuple[list[str], int]:
+    """
+    Loads the cities of the round trip from a JSON file.
+
+    Inputs:
+        filename: The name of the parameter file.
+
+    Outputs:
+        city_names, exact_limit: The cities of the tour, starting with its start city, and the largest number of cities solved exactly.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+    return params[tour_cities_name], params.get(exact_limit_name, default_exact_limit)
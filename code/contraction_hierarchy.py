@@ -0,0 +1,405 @@
+import heapq
+import time
+import numpy as np
+
+import astar_lib
+import file_cache
+import network_graph
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST
+from parameters import NodePos
+
+# https://en.wikipedia.org/wiki/Contraction_hierarchies
+# Geisberger, Sanders, Schultes, Delling: Contraction Hierarchies, WEA 2008
+
+# the hierarchy of a maze is saved in a folder beside the maze, e.g. maze/railnetwork-hierarchy/
+hierarchy_suffix = "-hierarchy"
+hierarchy_file = "hierarchy.npz"
+
+# the witness search stops after settling this many nodes, an unfinished search only adds an unnecessary shortcut
+witness_settle_limit = 60
+
+# middle node of an edge of the original grid
+NO_MIDDLE = -1
+
+def hierarchy_dir(maze_file: str):
+    """
+    Returns the folder containing the contraction hierarchy of a maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: The path of the folder beside the maze file.
+    """
+    return astar_lib.maze_dir.joinpath(maze_file.rsplit(".", 1)[0] + hierarchy_suffix)
+
+""" preprocessing """
+
+def witness_costs(graph: dict[int, dict[int, int]], source: int, excluded: int, limit: int) -> dict[int, int]:
+    """
+    Searches the remaining graph from a neighbor of the node to contract, without passing this node.
+
+    Inputs:
+        graph: The remaining graph, mapping each node to its neighbors and edge costs.
+        source: The node to search from.
+        excluded: The node to contract.
+        limit: The highest cost of interest, the cost of the longest path via the contracted node.
+
+    Outputs:
+        costs: The costs of the reached nodes, upper bounds for nodes that were not settled.
+    """
+    costs = {source: 0}
+    border = [(0, source)]
+    settled = 0
+
+    while border:
+        cost, node = heapq.heappop(border)
+        if cost > costs[node]:
+            continue
+        if cost > limit or settled >= witness_settle_limit:
+            break
+        settled += 1
+
+        for neighbor, edge_cost in graph[node].items():
+            if neighbor == excluded:
+                continue
+            new_cost = cost + edge_cost
+            if new_cost < costs.get(neighbor, INFINITE_COST):
+                costs[neighbor] = new_cost
+                heapq.heappush(border, (new_cost, neighbor))
+
+    return costs
+
+def required_shortcuts(graph: dict[int, dict[int, int]], node: int) -> list[tuple[int, int, int]]:
+    """
+    Finds the shortcuts needed to keep all shortest paths through a node when it gets contracted.
+
+    Inputs:
+        graph: The remaining graph.
+        node: The node to contract.
+
+    Outputs:
+        shortcuts: A list of (neighbor, other neighbor, cost) for each pair of neighbors without a witness path of at most the same cost.
+    """
+    neighbors = list(graph[node].items())
+    shortcuts = []
+
+    for i, (u, u_cost) in enumerate(neighbors[:-1]):
+        others = neighbors[i + 1:]
+        costs = witness_costs(graph, u, node, u_cost + max(w_cost for _, w_cost in others))
+        for w, w_cost in others:
+            if costs.get(w, INFINITE_COST) > u_cost + w_cost:
+                shortcuts.append((u, w, u_cost + w_cost))
+
+    return shortcuts
+
+def build_hierarchy(walkable: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Contracts the nodes of the 8-connected graph of a network one by one, ordered by their edge difference and the number of contracted neighbors.
+    The priorities are updated lazily: a node is only contracted if its recomputed priority is still the smallest.
+
+    Inputs:
+        walkable: A boolean array of the walkable cells.
+
+    Outputs:
+        _: The hierarchy as flat arrays, see ContractionHierarchy.
+            rank: The contraction order of each cell, -1 for obstacles.
+            offsets, targets, costs, middles: The upward edges of each cell in compressed sparse row format, middles holds the contracted node of a shortcut or NO_MIDDLE.
+    """
+    shape = walkable.shape
+    flat = walkable.ravel()
+    nodes = np.flatnonzero(flat).tolist()
+
+    graph = {node: {n: cost for n, cost in network_graph.grid_neighbors(node, shape) if flat[n]} for node in nodes}
+    middles = {}
+    contracted_neighbors = dict.fromkeys(nodes, 0)
+
+    def priority(node: int) -> int:
+        return len(required_shortcuts(graph, node)) - len(graph[node]) + contracted_neighbors[node]
+
+    queue = [(priority(node), node) for node in nodes]
+    heapq.heapify(queue)
+
+    rank = np.full(flat.size, -1, dtype=np.int32)
+    upward = {}
+
+    while queue:
+        _, node = heapq.heappop(queue)
+        new_priority = priority(node)
+        if queue and new_priority > queue[0][0]:
+            heapq.heappush(queue, (new_priority, node))
+            continue
+
+        for u, w, cost in required_shortcuts(graph, node):
+            if cost < graph[u].get(w, INFINITE_COST):
+                graph[u][w] = graph[w][u] = cost
+                middles[min(u, w), max(u, w)] = node
+
+        # the remaining neighbors get contracted later, so they are higher in the hierarchy
+        rank[node] = len(upward)
+        upward[node] = graph.pop(node)
+        for neighbor in upward[node]:
+            del graph[neighbor][node]
+            contracted_neighbors[neighbor] += 1
+
+    offsets = np.zeros(flat.size + 1, dtype=np.int32)
+    for node, edges in upward.items():
+        offsets[node + 1] = len(edges)
+    offsets = np.cumsum(offsets, dtype=np.int32)
+
+    targets = np.zeros(offsets[-1], dtype=np.int32)
+    costs = np.zeros(offsets[-1], dtype=np.int32)
+    edge_middles = np.full(offsets[-1], NO_MIDDLE, dtype=np.int32)
+    for node, edges in upward.items():
+        for i, (neighbor, cost) in enumerate(edges.items()):
+            targets[offsets[node] + i] = neighbor
+            costs[offsets[node] + i] = cost
+            edge_middles[offsets[node] + i] = middles.get((min(node, neighbor), max(node, neighbor)), NO_MIDDLE)
+
+    return {"rank": rank, "offsets": offsets, "targets": targets, "costs": costs, "middles": edge_middles}
+
+class ContractionHierarchy():
+    """
+    Contraction hierarchy of a network for fast exact shortest path queries.
+    Every node gets a rank by the order it was contracted in, shortcuts keep the shortest paths between the remaining nodes.
+    A query only relaxes the upward edges from both ends (to nodes of higher rank) and meets in the middle, the shortcuts are unpacked back to the cells of the maze.
+    The hierarchy is saved beside the maze and rebuilt when the digest of the maze changes.
+
+    Attributes:
+        maze_file (str): The file name of the maze.
+        maze (np.ndarray): The maze array.
+        arrays (dict): The hierarchy as flat arrays, as returned by build_hierarchy.
+        upward (list): The upward edges of each cell as lists of (neighbor, cost).
+        middles (dict): The contracted node of each shortcut, key: (lower cell index, higher cell index).
+        build_time (float): The seconds needed to build the hierarchy, 0 if it was loaded.
+        shortcut_count (int): The number of shortcuts.
+
+    Methods:
+        __init__: Loads the hierarchy or builds it.
+        memory: Returns the size of the hierarchy arrays in bytes.
+        search: Finds the shortest path between two cells in the hierarchy.
+        query: Finds the shortest path between two cells of the maze.
+        unpack_edge: Replaces a shortcut by the cells it stands for.
+        solved_maze: Finds the shortest path between two positions, returned like py_run_astar.
+    """
+    def __init__(self, maze_file: str) -> None:
+        """
+        Initializes a new ContractionHierarchy instance.
+
+        Inputs:
+            maze_file: The file name of the maze in the maze folder.
+        """
+        self.maze_file = maze_file
+        self.maze = astar_lib.load_maze(maze_file)
+        self.build_time = 0
+
+        directory = hierarchy_dir(maze_file)
+        maze_digest = file_cache.file_digest(astar_lib.maze_dir.joinpath(maze_file))
+        path = directory.joinpath(hierarchy_file)
+
+        if file_cache.read_manifest(directory).get("maze") == maze_digest and path.exists():
+            with np.load(path) as stored:
+                self.arrays = {name: stored[name] for name in stored.files}
+        else:
+            start_time = time.perf_counter()
+            self.arrays = build_hierarchy(network_graph.walkable_mask(self.maze))
+            self.build_time = time.perf_counter() - start_time
+
+            file_cache.atomic_write(path, lambda f: np.savez(f, **self.arrays))
+            file_cache.write_manifest(directory, {"maze": maze_digest})
+
+        # python lists are much faster to traverse than numpy arrays
+        offsets = self.arrays["offsets"].tolist()
+        targets = self.arrays["targets"].tolist()
+        costs = self.arrays["costs"].tolist()
+        middles = self.arrays["middles"].tolist()
+
+        self.upward = [list(zip(targets[offsets[i]:offsets[i + 1]], costs[offsets[i]:offsets[i + 1]])) for i in range(self.maze.size)]
+        self.middles = {}
+        for node in range(self.maze.size):
+            for i in range(offsets[node], offsets[node + 1]):
+                if middles[i] != NO_MIDDLE:
+                    self.middles[min(node, targets[i]), max(node, targets[i])] = middles[i]
+        self.shortcut_count = len(self.middles)
+
+    def memory(self) -> int:
+        """
+        Returns the size of the hierarchy arrays.
+
+        Outputs:
+            _: The number of bytes of all arrays of the hierarchy.
+        """
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def search(self, start: int, end: int) -> tuple[int, list[int]]:
+        """
+        Finds the shortest path between two cells in the hierarchy with a bidirectional search on the upward edges.
+        Nodes reached with a higher cost than via a node of higher rank cannot lie on a shortest path and are not expanded (stall-on-demand).
+
+        Inputs:
+            start: The flat index of the start cell.
+            end: The flat index of the end cell.
+
+        Outputs:
+            cost, nodes: The cost of the shortest path and the nodes of the hierarchy from start to end, consecutive nodes may be joined by a shortcut. INFINITE_COST and an empty list if no path exists.
+        """
+        costs = ({start: 0}, {end: 0})
+        parents = ({start: -1}, {end: -1})
+        borders = ([(0, start)], [(0, end)])
+        best_cost, meeting_node = (0, start) if start == end else (INFINITE_COST, -1)
+        side = 0
+
+        while True:
+            # a direction is finished once its smallest cost reaches the best path found
+            open_sides = [i for i in (0, 1) if borders[i] and borders[i][0][0] < best_cost]
+            if not open_sides:
+                break
+            # alternate between both directions
+            if side not in open_sides:
+                side = open_sides[0]
+
+            cost, node = heapq.heappop(borders[side])
+            own_costs, other_costs = costs[side], costs[1 - side]
+
+            if cost == own_costs[node]:
+                if node in other_costs and cost + other_costs[node] < best_cost:
+                    best_cost, meeting_node = cost + other_costs[node], node
+
+                edges = self.upward[node]
+                if not any(own_costs.get(neighbor, INFINITE_COST) + edge_cost < cost for neighbor, edge_cost in edges):
+                    for neighbor, edge_cost in edges:
+                        new_cost = cost + edge_cost
+                        if new_cost < own_costs.get(neighbor, INFINITE_COST):
+                            own_costs[neighbor] = new_cost
+                            parents[side][neighbor] = node
+                            heapq.heappush(borders[side], (new_cost, neighbor))
+            side = 1 - side
+
+        if meeting_node == -1:
+            return INFINITE_COST, []
+
+        forward = network_graph.trace_parents(parents[0], meeting_node)
+        backward = network_graph.trace_parents(parents[1], meeting_node)
+        return best_cost, forward + backward[::-1][1:]
+
+    def query(self, start: int, end: int) -> tuple[int, list[int]]:
+        """
+        Finds the shortest path between two cells and unpacks its shortcuts.
+
+        Inputs:
+            start: The flat index of the start cell.
+            end: The flat index of the end cell.
+
+        Outputs:
+            cost, path: The cost of the shortest path and the flat indices of the cells from start to end. INFINITE_COST and an empty list if no path exists.
+        """
+        cost, nodes = self.search(start, end)
+        if not nodes:
+            return cost, []
+
+        path = [start]
+        for a, b in zip(nodes, nodes[1:]):
+            path += self.unpack_edge(a, b)[1:]
+        return cost, path
+
+    def unpack_edge(self, a: int, b: int) -> list[int]:
+        """
+        Replaces an edge of the hierarchy by the cells of the original grid it stands for.
+
+        Inputs:
+            a: The flat index of the first cell of the edge.
+            b: The flat index of the second cell of the edge.
+
+        Outputs:
+            path: The flat indices from a to b.
+        """
+        path = [a]
+        stack = [(a, b)]
+
+        while stack:
+            u, w = stack.pop()
+            middle = self.middles.get((min(u, w), max(u, w)))
+            if middle is None:
+                path.append(w)
+            else:
+                # the second half gets unpacked after the first one
+                stack.append((middle, w))
+                stack.append((u, middle))
+
+        return path
+
+    def solved_maze(self, start: NodePos, end: NodePos) -> tuple[float, np.ndarray]:
+        """
+        Finds the shortest path between two positions, returned like py_run_astar returns its solution.
+
+        Inputs:
+            start: The start position.
+            end: The end position.
+
+        Outputs:
+            distance, solved_maze: The distance in maze units and a copy of the maze with the path marked as SOL_PATH.
+
+        Raises:
+            Exception: If no path exists.
+        """
+        astar_lib.check_nodes(start, end, self.maze)
+        cost, path = self.query(network_graph.cell_index(start.x, start.y, self.maze.shape), network_graph.cell_index(end.x, end.y, self.maze.shape))
+        if cost >= INFINITE_COST:
+            raise Exception("No valid path found!")
+        return network_graph.cost_to_distance(cost), network_graph.path_to_maze(self.maze, path)
+
+""" benchmark """
+
+def benchmark(maze_file: str, cities: dict[str, NodePos], repetitions: int = 100) -> dict[str, float]:
+    """
+    Compares the contraction hierarchy of a network with the A* algorithm written in C on all city pairs.
+    Every distance of the hierarchy is checked against an exact Dijkstra search.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+        cities: A dictionary mapping city names to their NodePos objects.
+        repetitions: How many times each hierarchy query is repeated to measure its latency.
+
+    Outputs:
+        _: A dictionary with the build time (s), the memory of the hierarchy and of the maze (bytes), the number of shortcuts and the mean latency of a query with the hierarchy without and with unpacking the path and of A* (µs).
+    """
+    hierarchy = ContractionHierarchy(maze_file)
+    maze = hierarchy.maze
+    adjacency = network_graph.build_adjacency(network_graph.walkable_mask(maze))
+
+    pairs = [(cities[a], cities[b]) for a, b in comparison.city_pairs(cities) if astar_lib.is_walkable(cities[a], maze) and astar_lib.is_walkable(cities[b], maze)]
+    cells = [(network_graph.cell_index(a.x, a.y, maze.shape), network_graph.cell_index(b.x, b.y, maze.shape)) for a, b in pairs]
+
+    for start, end in cells:
+        exact_cost = network_graph.distance_field(adjacency, start)[end]
+        cost, path = hierarchy.query(start, end)
+        if cost != exact_cost or len(path) != len(set(path)) or path[0] != start or path[-1] != end:
+            raise AssertionError(f"The hierarchy of {maze_file} found a wrong path between cells {start} and {end}!")
+
+    start_time = time.perf_counter()
+    for _ in range(repetitions):
+        for start, end in cells:
+            hierarchy.search(start, end)
+    search_time = (time.perf_counter() - start_time) / (repetitions * len(cells))
+
+    start_time = time.perf_counter()
+    for _ in range(repetitions):
+        for start, end in cells:
+            hierarchy.query(start, end)
+    query_time = (time.perf_counter() - start_time) / (repetitions * len(cells))
+
+    start_time = time.perf_counter()
+    for start, end in pairs:
+        astar_lib.py_run_astar(start, end, maze)
+    astar_time = (time.perf_counter() - start_time) / len(pairs)
+
+    return {
+        "build_time": hierarchy.build_time,
+        "hierarchy_bytes": hierarchy.memory(),
+        "maze_bytes": maze.nbytes,
+        "shortcuts": hierarchy.shortcut_count,
+        "search_us": search_time * 1e6,
+        "query_us": query_time * 1e6,
+        "astar_us": astar_time * 1e6
+    }
@@ -0,0 +1,272 @@
+import re
+import numpy as np
+
+import astar_lib
+import file_cache
+import incremental_conversion
+import network_graph
+from network_graph import INFINITE_COST
+from parameters import NodePos
+
+# the fields of a maze are saved in a folder beside the maze, e.g. maze/railnetwork-fields/
+fields_suffix = "-fields"
+
+# compact storage of the integer costs, the largest value marks unreachable cells
+# networks with longer paths fall back to float32 with infinity for unreachable cells
+UNREACHABLE_UINT16 = np.iinfo(np.uint16).max
+
+def fields_dir(maze_file: str):
+    """
+    Returns the folder containing the distance fields of a maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: The path of the folder beside the maze file.
+    """
+    return astar_lib.maze_dir.joinpath(maze_file.rsplit(".", 1)[0] + fields_suffix)
+
+def field_file_name(city_name: str) -> str:
+    """
+    Converts a city name to the file name of its distance field.
+
+    Inputs:
+        city_name: The name of the city.
+
+    Outputs:
+        _: The .npy file name, containing only letters, digits, '_' and '-'.
+    """
+    return re.sub(r"[^\w-]", "_", city_name) + ".npy"
+
+def compress_field(costs: np.ndarray) -> np.ndarray:
+    """
+    Converts the integer costs of a distance field to the smallest exact storage type.
+
+    Inputs:
+        costs: The integer costs as returned by network_graph.distance_field.
+
+    Outputs:
+        _: A uint16 array if all reachable costs fit, otherwise a float32 array with infinity for unreachable cells.
+    """
+    reachable = costs < INFINITE_COST
+    if costs[reachable].max(initial=0) < UNREACHABLE_UINT16:
+        return np.where(reachable, costs, UNREACHABLE_UINT16).astype(np.uint16)
+    return np.where(reachable, costs, np.inf).astype(np.float32)
+
+def expand_field(stored: np.ndarray) -> np.ndarray:
+    """
+    Converts a stored distance field back to integer costs.
+
+    Inputs:
+        stored: The field as saved by compress_field.
+
+    Outputs:
+        _: An int64 array of costs with INFINITE_COST for unreachable cells.
+    """
+    if stored.dtype == np.uint16:
+        unreachable = stored == UNREACHABLE_UINT16
+    else:
+        unreachable = ~np.isfinite(stored)
+    return np.where(unreachable, INFINITE_COST, stored).astype(np.int64)
+
+class DistanceFields():
+    """
+    Exact distance fields of every city of a maze, persisted as .npy files beside the maze.
+    A field holds the cost of the shortest path from its city to every cell, therefore city-to-city distances are lookups, city-to-cell distances are array reads and paths are recovered by descending the field.
+    The manifest of the folder records the digest of the maze and the position of each city: fields are rebuilt when the maze changes, and otherwise validated per city against its position, so a field is rebuilt when its city moves.
+
+    Attributes:
+        maze_file (str): The file name of the maze.
+        maze (np.ndarray): The maze array.
+        cities (dict): The cities with a field, mapped to their NodePos objects. Cities lying on an obstacle are skipped.
+        directory (Path): The folder containing the fields.
+        adjacency (list): The adjacency list of the maze, used to descend the fields.
+        fields (dict): The loaded flat fields as int64 costs, key: city name.
+        built (list): The names of the cities whose field was (re)built by this instance.
+
+    Methods:
+        __init__: Loads the valid fields and builds the missing or outdated ones.
+        distance: Returns the distance from a city to a cell.
+        city_distance: Returns the distance between two cities.
+        field: Returns the distance field of a city as a 2D array in maze units.
+        path: Recovers the shortest path from a city to a cell.
+        solved_maze: Marks the shortest path from a city to a cell in a copy of the maze.
+    """
+    def __init__(self, maze_file: str, cities: dict[str, NodePos]) -> None:
+        """
+        Initializes a new DistanceFields instance.
+
+        Inputs:
+            maze_file: The file name of the maze in the maze folder.
+            cities: A dictionary mapping city names to their NodePos objects.
+        """
+        self.maze_file = maze_file
+        self.maze = astar_lib.load_maze(maze_file)
+        self.directory = fields_dir(maze_file)
+        self.cities = {name: pos for name, pos in cities.items() if astar_lib.is_in_bounds(pos, self.maze) and astar_lib.is_walkable(pos, self.maze)}
+
+        self.adjacency = network_graph.build_adjacency(network_graph.walkable_mask(self.maze))
+        self.fields = {}
+        self.built = []
+
+        maze_digest = file_cache.file_digest(astar_lib.maze_dir.joinpath(maze_file))
+
+        manifest = file_cache.read_manifest(self.directory)
+        if manifest.get("maze") != maze_digest:
+            # a changed maze invalidates every field
+            manifest = {"maze": maze_digest, "cities": {}}
+        city_entries = manifest["cities"]
+
+        for name, pos in self.cities.items():
+            entry = city_entries.get(name)
+            path = self.directory.joinpath(field_file_name(name))
+
+            if entry is not None and entry["x"] == pos.x and entry["y"] == pos.y and path.exists():
+                self.fields[name] = expand_field(np.load(path))
+                continue
+
+            costs = network_graph.distance_field(self.adjacency, network_graph.cell_index(pos.x, pos.y, self.maze.shape))
+            stored = compress_field(costs)
+            file_cache.save_array(path, stored)
+
+            self.fields[name] = costs
+            city_entries[name] = {"x": pos.x, "y": pos.y, "file": path.name, "dtype": stored.dtype.name}
+            self.built.append(name)
+
+        # forget removed cities
+        for name in set(city_entries) - set(self.cities):
+            self.directory.joinpath(city_entries.pop(name)["file"]).unlink(missing_ok=True)
+
+        file_cache.write_manifest(self.directory, manifest)
+
+    def cost(self, city_name: str, x: int, y: int) -> int:
+        """
+        Returns the integer cost from a city to a cell.
+
+        Inputs:
+            city_name: The name of the city.
+            x: The x-coordinate of the cell.
+            y: The y-coordinate of the cell.
+
+        Outputs:
+            _: The cost, INFINITE_COST if the cell is not reachable.
+        """
+        try:
+            field = self.fields[city_name]
+        except KeyError:
+            raise KeyError(f'The city "{city_name}" has no distance field on {self.maze_file}!')
+        return int(field[network_graph.cell_index(x, y, self.maze.shape)])
+
+    def distance(self, city_name: str, x: int, y: int) -> float:
+        """
+        Returns the length of the shortest path from a city to a cell.
+
+        Inputs:
+            city_name: The name of the city.
+            x: The x-coordinate of the cell.
+            y: The y-coordinate of the cell.
+
+        Outputs:
+            _: The distance in maze units like returned by py_run_astar, infinite if the cell is not reachable.
+        """
+        cost = self.cost(city_name, x, y)
+        return float("inf") if cost >= INFINITE_COST else network_graph.cost_to_distance(cost)
+
+    def city_distance(self, start_name: str, end_name: str) -> float:
+        """
+        Returns the length of the shortest path between two cities.
+
+        Inputs:
+            start_name: The name of the departure city.
+            end_name: The name of the arrival city.
+
+        Outputs:
+            _: The distance in maze units, infinite if the cities are not connected.
+        """
+        end = self.cities[end_name]
+        return self.distance(start_name, end.x, end.y)
+
+    def field(self, city_name: str) -> np.ndarray:
+        """
+        Returns the distance field of a city.
+
+        Inputs:
+            city_name: The name of the city.
+
+        Outputs:
+            _: A float array of the maze shape with the distance in maze units to each cell, infinite for unreachable cells.
+        """
+        costs = self.fields[city_name]
+        return np.where(costs < INFINITE_COST, costs / network_graph.PRECISION_FACTOR, np.inf).reshape(self.maze.shape)
+
+    def path(self, city_name: str, x: int, y: int) -> list[int]:
+        """
+        Recovers the shortest path from a city to a cell by descending the field of the city.
+
+        Inputs:
+            city_name: The name of the city.
+            x: The x-coordinate of the target cell.
+            y: The y-coordinate of the target cell.
+
+        Outputs:
+            _: The flat indices from the city to the cell, empty if the cell is not reachable.
+        """
+        return network_graph.descend_field(self.adjacency, self.fields[city_name], network_graph.cell_index(x, y, self.maze.shape))
+
+    def solved_maze(self, city_name: str, x: int, y: int) -> tuple[float, np.ndarray]:
+        """
+        Finds the shortest path from a city to a cell, returned like py_run_astar returns its solution.
+
+        Inputs:
+            city_name: The name of the city.
+            x: The x-coordinate of the target cell.
+            y: The y-coordinate of the target cell.
+
+        Outputs:
+            distance, solved_maze: The distance in maze units and a copy of the maze with the path marked as SOL_PATH.
+        """
+        return self.distance(city_name, x, y), network_graph.path_to_maze(self.maze, self.path(city_name, x, y))
+
+def repair_fields(changes: incremental_conversion.MazeChanges) -> dict[str, list[str]] | None:
+    """
+    Repairs the saved fields of a maze after its map was converted again, instead of expanding every city on the whole maze.
+    Fields whose city became an obstacle are removed, DistanceFields skips the city from now on.
+
+    Inputs:
+        changes: The changes of the maze as returned by incremental_conversion.update_maze.
+
+    Outputs:
+        _: The names of the "repaired" and the "removed" cities. None if the fields were saved for another version of the maze or the maze was rewritten as a whole, DistanceFields rebuilds them then.
+    """
+    directory = fields_dir(changes.maze_file)
+    manifest = file_cache.read_manifest(directory)
+    if changes.full_rewrite or manifest.get("maze") != changes.previous_digest:
+        return None
+    result = {"repaired": [], "removed": []}
+    if changes.cells().size == 0:
+        return result
+
+    maze = astar_lib.load_maze(changes.maze_file)
+    adjacency = network_graph.build_adjacency(network_graph.walkable_mask(maze))
+    opened, closed = changes.opened.tolist(), changes.closed.tolist()
+    closed_cells = set(closed)
+
+    for name, entry in list(manifest["cities"].items()):
+        path = directory.joinpath(entry["file"])
+        source = network_graph.cell_index(entry["x"], entry["y"], maze.shape)
+        if source in closed_cells or not path.exists():
+            path.unlink(missing_ok=True)
+            del manifest["cities"][name]
+            result["removed"].append(name)
+            continue
+
+        costs = network_graph.repair_field(adjacency, maze.shape, expand_field(np.load(path)), source, opened, closed)
+        stored = compress_field(costs)
+        file_cache.save_array(path, stored)
+        entry["dtype"] = stored.dtype.name
+        result["repaired"].append(name)
+
+    manifest["maze"] = changes.digest
+    file_cache.write_manifest(directory, manifest)
+    return result
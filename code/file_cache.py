@@ -0,0 +1,94 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from pathlib import Path
+
+# name of the file describing the content of a cache directory
+manifest_name = "manifest.json"
+
+# https://docs.python.org/3/library/hashlib.html#hashlib.file_digest
+def file_digest(path: Path | str) -> str:
+    """
+    Calculates the SHA-1 digest of a file, used to notice when a source file of cached data changed.
+
+    Inputs:
+        path: The path of the file.
+
+    Outputs:
+        _: The hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_digests(sources: list[Path | str]) -> dict[str, str]:
+    """
+    Calculates the digests of all source files of cached data.
+
+    Inputs:
+        sources: The paths of the source files.
+
+    Outputs:
+        _: A dictionary mapping each file name to its digest.
+    """
+    return {Path(source).name: file_digest(source) for source in sources}
+
+def read_manifest(directory: Path) -> dict:
+    """
+    Reads the manifest of a cache directory.
+
+    Inputs:
+        directory: The cache directory.
+
+    Outputs:
+        _: The manifest as a dictionary, empty if the cache does not exist yet or the manifest is unreadable.
+    """
+    try:
+        with open(directory.joinpath(manifest_name), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def atomic_write(path: Path, write) -> None:
+    """
+    Writes a file through a temporary file which replaces the target at once, so a reader never sees a half written file, even if the writer crashes.
+
+    Inputs:
+        path: The path of the target file.
+        write: A function writing the content into the open binary file it receives.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+    try:
+        with open(temporary_path, 'wb') as f:
+            write(f)
+        # https://docs.python.org/3/library/os.html#os.replace
+        os.replace(temporary_path, path)
+    finally:
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+def write_manifest(directory: Path, manifest: dict) -> None:
+    """
+    Writes the manifest of a cache directory atomically.
+
+    Inputs:
+        directory: The cache directory.
+        manifest: The manifest as a JSON serializable dictionary.
+    """
+    atomic_write(directory.joinpath(manifest_name), lambda f: f.write(json.dumps(manifest, indent=4).encode()))
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    """
+    Saves an array as .npy file atomically.
+
+    Inputs:
+        path: The path of the .npy file.
+        array: The array to save.
+    """
+    atomic_write(path, lambda f: np.save(f, array))
@@ -5,9 +5,20 @@ from os.path import exists
 from pathlib import Path
 from PIL import Image
 
+from parameters import params_dir, read_params
+
 ROOT = Path(sys.path[0]).parent
 maze_path = ROOT.joinpath('maze')
 
+# parameter file with the palettes of the colored maps and its keys
+palette_parameter_file = "network_palette.json"
+# the palette of each map, {image path from the root folder: {"crop": [left, upper, right, lower], "layers": {maze file: layer}}}
+# a layer has the "colors" [[r, g, b]] of its lines, the "tolerance" as distance in RGB and optionally the maze files it "contains"
+palette_images_name = "images"
+# the number of matching pixels a cell needs to be walkable, so single antialiased pixels of other lines do not become cells
+min_pixels_name = "min_pixels"
+default_min_pixels = 1
+
 def get_csv_name(img_name: str) -> str:
     """
     Generates a CSV file name by replacing the extension of an image file name with '.csv'.
@@ -32,6 +43,29 @@ def convertImageToCSV(path: Path | str, shrinking_factor: float) -> None:
         path - The path to the image file.
         shrinking_factor - The factor by which the image dimensions are shrunk.
 
+    Raises:
+        FileNotFoundError: If the specified image file does not exist.
+    """
+    path = ROOT.joinpath(path)
+    non_black_pixels_arr = image_walkable(path, shrinking_factor)
+
+    # store new file as csv in /maze directory
+    new_path = maze_path.joinpath(get_csv_name(path.name))
+    # https://stackoverflow.com/questions/6081008/dump-a-numpy-array-into-a-csv-file
+    np.savetxt(new_path, non_black_pixels_arr, delimiter=",", fmt="%0d")
+    # return non_black_pixels_arr[:10, :10]
+
+def image_walkable(path: Path | str, shrinking_factor: float) -> np.ndarray:
+    """
+    Resizes a black and white image and classifies its pixels, like convertImageToCSV without saving the result.
+
+    Inputs:
+        path - The path to the image file.
+        shrinking_factor - The factor by which the image dimensions are shrunk.
+
+    Outputs:
+        non_black_pixels_arr - True for the walkable (non-black) pixels of the resized image.
+
     Raises:
         FileNotFoundError: If the specified image file does not exist.
     """
@@ -52,13 +86,158 @@ def convertImageToCSV(path: Path | str, shrinking_factor: float) -> None:
 
     # https://stackoverflow.com/questions/42150110/comparing-subarrays-in-numpy
     # True when pixel is black False otherwise to determine if pixel is an obstacle
-    non_black_pixels_arr = np.logical_and.reduce(rgba_arr != [0, 0, 0], axis = -1)
+    return np.logical_and.reduce(rgba_arr != [0, 0, 0], axis = -1)
 
-    # store new file as csv in /maze directory
-    new_path = maze_path.joinpath(get_csv_name(path.name))
-    # https://stackoverflow.com/questions/6081008/dump-a-numpy-array-into-a-csv-file
-    np.savetxt(new_path, non_black_pixels_arr, delimiter=",", fmt="%0d")
-    # return non_black_pixels_arr[:10, :10]
+def load_palette(filename: str, path: Path | str) -> tuple[dict, int]:
+    """
+    Loads the palette of a colored map from a JSON file.
+
+    Inputs:
+        filename - The name of the parameter file.
+        path - The path to the image file from the root folder.
+
+    Outputs:
+        palette, min_pixels - The crop box and layers of the map and the number of matching pixels a cell needs.
+
+    Raises:
+        ValueError: If the parameter file defines no palette for the image.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = read_params(f)
+
+    palettes = {Path(image): palette for image, palette in params.get(palette_images_name, {}).items()}
+    if Path(path) not in palettes:
+        raise ValueError(f'No palette is defined for "{path}" in {filename}!')
+    return palettes[Path(path)], params.get(min_pixels_name, default_min_pixels)
+
+def classify_palette(pixels: np.ndarray, layers: dict) -> dict[str, np.ndarray]:
+    """
+    Classifies every pixel against the colors of each layer, a pixel belongs to a layer if its distance in RGB to any color of the layer is at most the tolerance of the layer.
+
+    Inputs:
+        pixels - The RGB values of the image with shape (height, width, 3).
+        layers - The colors and the tolerance of each layer.
+
+    Outputs:
+        masks - True for the pixels of each layer.
+    """
+    pixels = pixels.astype(np.int32)
+    masks = {}
+    for name, layer in layers.items():
+        colors = np.array(layer["colors"], dtype=np.int32)
+        # squared distances of all pixels to all colors of the layer at once, shape (height, width, colors)
+        distances = ((pixels[:, :, np.newaxis, :] - colors) ** 2).sum(axis=-1)
+        masks[name] = np.logical_or.reduce(distances <= layer["tolerance"] ** 2, axis=-1)
+    return masks
+
+def shrink_mask(mask: np.ndarray, shape: tuple[int, int], min_pixels: int) -> np.ndarray:
+    """
+    Shrinks a pixel mask to the cells of a maze by counting the set pixels of each cell. Unlike resizing the image first, no colors are blended and lines thinner than a cell are kept.
+
+    Inputs:
+        mask - True for the pixels of a layer.
+        shape - The (rows, columns) of the maze.
+        min_pixels - The number of set pixels a cell needs to be set.
+
+    Outputs:
+        cells - True for the cells of the layer.
+    """
+    height, width = mask.shape
+    # the row and column of the cell of each pixel row and column
+    rows = np.arange(height) * shape[0] // height
+    cols = np.arange(width) * shape[1] // width
+    ys, xs = np.nonzero(mask)
+    counts = np.bincount(rows[ys] * shape[1] + cols[xs], minlength=shape[0] * shape[1])
+    return counts.reshape(shape) >= min_pixels
+
+def include_contained(cells: dict[str, np.ndarray], layers: dict) -> dict[str, np.ndarray]:
+    """
+    Adds the cells of the contained layers to each layer, e.g. the highways to the roads, so a fast network is always a subset of its slow network, also where their lines overlap on the map.
+
+    Inputs:
+        cells - The cells of each layer from its own colors.
+        layers - The layers with the names of the layers they contain.
+
+    Outputs:
+        resolved - The cells of each layer including all (also indirectly) contained layers.
+
+    Raises:
+        ValueError: If a contained layer is not defined or layers contain each other.
+    """
+    resolved = {}
+
+    def resolve(name: str, chain: list[str]) -> np.ndarray:
+        if name in chain:
+            raise ValueError(f'The layers {" -> ".join(chain + [name])} contain each other!')
+        if name not in resolved:
+            layer_cells = cells[name].copy()
+            for contained in layers[name].get("contains", []):
+                if contained not in layers:
+                    raise ValueError(f'The layer "{contained}" contained in "{name}" is not defined!')
+                layer_cells |= resolve(contained, chain + [name])
+            resolved[name] = layer_cells
+        return resolved[name]
+
+    for name in layers:
+        resolve(name, [])
+    return resolved
+
+def convertPaletteImageToCSVs(path: Path | str, shrinking_factor: float, palette: dict, min_pixels: int = default_min_pixels, output_path: Path = maze_path) -> dict[str, np.ndarray]:
+    """
+    Converts a colored map to a CSV file per network layer in a single pass, the image is decoded once and every pixel is classified against the palette at full resolution before it is shrunk.
+    The cells of a layer are walkable (1) and all other cells are obstacles (0) like in the black and white conversion.
+
+    Inputs:
+        path - The path to the image file.
+        shrinking_factor - The factor by which the image dimensions are shrunk.
+        palette - The optional crop box of the map and the colors, tolerance and contained layers of each layer, which is named after its CSV file.
+        min_pixels - The number of matching pixels a cell needs to be walkable.
+        output_path - The folder of the CSV files.
+
+    Outputs:
+        cells - True for the walkable cells of each layer.
+
+    Raises:
+        FileNotFoundError: If the specified image file does not exist.
+    """
+    cells = palette_cells(path, shrinking_factor, palette, min_pixels)
+    for name, layer_cells in cells.items():
+        np.savetxt(output_path.joinpath(name), layer_cells, delimiter=",", fmt="%0d")
+    return cells
+
+def palette_cells(path: Path | str, shrinking_factor: float, palette: dict, min_pixels: int = default_min_pixels) -> dict[str, np.ndarray]:
+    """
+    Classifies a colored map into the cells of each network layer, like convertPaletteImageToCSVs without saving the layers.
+
+    Inputs:
+        path - The path to the image file.
+        shrinking_factor - The factor by which the image dimensions are shrunk.
+        palette - The optional crop box of the map and the layers.
+        min_pixels - The number of matching pixels a cell needs to be walkable.
+
+    Outputs:
+        cells - True for the walkable cells of each layer, including the cells of the layers it contains.
+
+    Raises:
+        FileNotFoundError: If the specified image file does not exist.
+    """
+    path = ROOT.joinpath(path)
+
+    if not exists(path):
+        raise FileNotFoundError(f'The file with path "{path}" does not exist!')
+
+    im = Image.open(path).convert('RGB')
+    # https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.crop
+    if "crop" in palette:
+        im = im.crop(tuple(palette["crop"]))
+    pixels = np.asarray(im)
+
+    resized_dimensions = np.maximum(np.array(im.size) // shrinking_factor, 1).astype(int)
+    shape = (resized_dimensions[1], resized_dimensions[0])
+
+    layers = palette["layers"]
+    masks = classify_palette(pixels, layers)
+    return include_contained({name: shrink_mask(mask, shape, min_pixels) for name, mask in masks.items()}, layers)
 
 
 def test():
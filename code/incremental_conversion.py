@@ -0,0 +1,244 @@
+import hashlib
+import numpy as np
+
+from pathlib import Path
+
+import astar_lib
+import file_cache
+import image_maze_conversion
+from astar_lib import OBSTACLE, WALKABLE
+
+# the tile digests of a converted maze are saved in a folder beside the maze, e.g. maze/roadnetwork-conversion/
+conversion_suffix = "-conversion"
+
+# edge length of a tile in cells, the unit in which edits of a map are detected and written
+default_tile_size = 16
+
+# np.savetxt writes every cell as one digit followed by a comma, or a newline at the end of a row
+OBSTACLE_BYTE = ord("0")
+WALKABLE_BYTE = ord("1")
+SEPARATOR_BYTE = ord(",")
+
+class MazeChanges():
+    """
+    The cells of a maze changed by converting its map again, the input of all incremental updates of the data derived from the maze.
+
+    Attributes:
+        maze_file (str): The file name of the maze.
+        shape (tuple): The shape of the maze.
+        tile_size (int): The edge length of a tile in cells.
+        tiles (list): The "row,col" keys of the tiles which changed.
+        opened (np.ndarray): The flat indices of the cells which became walkable.
+        closed (np.ndarray): The flat indices of the cells which became obstacles.
+        previous_digest (str): The digest of the maze file before the conversion, None if it did not exist.
+        digest (str): The digest of the maze file after the conversion.
+        full_rewrite (bool): True if the whole file was written, because it did not exist or had another shape. Opened and closed are empty then and derived data has to be rebuilt.
+
+    Methods:
+        __init__: Initializes the changes.
+        cells: Returns all changed cells.
+    """
+    def __init__(self, maze_file: str, shape: tuple[int, int], tile_size: int, tiles: list[str], opened: np.ndarray, closed: np.ndarray, previous_digest: str | None, digest: str, full_rewrite: bool) -> None:
+        """
+        Initializes a new MazeChanges instance.
+
+        Inputs:
+            maze_file: The file name of the maze.
+            shape: The shape of the maze.
+            tile_size: The edge length of a tile in cells.
+            tiles: The keys of the changed tiles.
+            opened: The flat indices of the opened cells.
+            closed: The flat indices of the closed cells.
+            previous_digest: The digest of the maze file before the conversion.
+            digest: The digest of the maze file after the conversion.
+            full_rewrite: True if the whole file was written.
+        """
+        self.maze_file = maze_file
+        self.shape = shape
+        self.tile_size = tile_size
+        self.tiles = tiles
+        self.opened = opened
+        self.closed = closed
+        self.previous_digest = previous_digest
+        self.digest = digest
+        self.full_rewrite = full_rewrite
+
+    def cells(self) -> np.ndarray:
+        """
+        Returns all changed cells.
+
+        Outputs:
+            _: The sorted flat indices of the opened and closed cells.
+        """
+        return np.sort(np.concatenate([self.opened, self.closed]))
+
+def conversion_dir(maze_file: str) -> Path:
+    """
+    Returns the folder containing the tile digests of a maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: The path of the folder beside the maze file.
+    """
+    return astar_lib.maze_dir.joinpath(maze_file.rsplit(".", 1)[0] + conversion_suffix)
+
+def tile_digests(walkable: np.ndarray, tile_size: int) -> dict[str, str]:
+    """
+    Calculates a digest of the cells of every tile of a maze, tiles at the right and bottom border may be smaller.
+
+    Inputs:
+        walkable: True for the walkable cells of the maze.
+        tile_size: The edge length of a tile in cells.
+
+    Outputs:
+        _: A dictionary mapping "row,col" of each tile to its digest.
+    """
+    walkable = np.asarray(walkable, dtype=bool)
+    height, width = walkable.shape
+    return {
+        f"{row},{col}": hashlib.sha1(walkable[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size].tobytes()).hexdigest()
+        for row in range(-(-height // tile_size)) for col in range(-(-width // tile_size))
+    }
+
+def is_fixed_width(path: Path, shape: tuple[int, int]) -> bool:
+    """
+    Checks if a maze file was written by np.savetxt with one digit per cell, so each cell is at a known byte offset and can be rewritten in place.
+
+    Inputs:
+        path: The path of the maze file.
+        shape: The shape of the new maze.
+
+    Outputs:
+        _: True if the file has the shape and the layout, False otherwise.
+    """
+    height, width = shape
+    if path.stat().st_size != height * 2 * width:
+        return False
+    with open(path, 'rb') as f:
+        return len(f.readline()) == 2 * width
+
+def update_maze(maze_file: str, walkable: np.ndarray, tile_size: int = default_tile_size) -> MazeChanges:
+    """
+    Writes a converted maze, rewriting only the tiles which changed since the last conversion.
+    The digests of the tiles are kept in a manifest beside the maze, if the maze was edited by hand since then they are calculated from the file.
+    The rows of a changed tile are read before they are overwritten in place, so the opened and closed cells are known without loading the whole maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+        walkable: True for the walkable cells of the new maze.
+        tile_size: The edge length of a tile in cells.
+
+    Outputs:
+        _: The changes of the maze.
+    """
+    path = astar_lib.maze_dir.joinpath(maze_file)
+    directory = conversion_dir(maze_file)
+    walkable = np.asarray(walkable, dtype=bool)
+    height, width = walkable.shape
+    digests = tile_digests(walkable, tile_size)
+
+    previous_digest = file_cache.file_digest(path) if path.exists() else None
+    if previous_digest is None or not is_fixed_width(path, walkable.shape):
+        # https://stackoverflow.com/questions/6081008/dump-a-numpy-array-into-a-csv-file
+        np.savetxt(path, walkable, delimiter=",", fmt="%0d")
+        changes = MazeChanges(maze_file, walkable.shape, tile_size, list(digests), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), previous_digest, file_cache.file_digest(path), True)
+        file_cache.write_manifest(directory, {"maze": changes.digest, "shape": [height, width], "tile_size": tile_size, "tiles": digests})
+        return changes
+
+    manifest = file_cache.read_manifest(directory)
+    if manifest.get("maze") == previous_digest and manifest.get("tile_size") == tile_size:
+        previous_digests = manifest["tiles"]
+    else:
+        previous_digests = tile_digests(astar_lib.load_maze(maze_file) != OBSTACLE, tile_size)
+    tiles = [key for key, digest in digests.items() if previous_digests.get(key) != digest]
+
+    opened, closed = [], []
+    with open(path, 'r+b') as f:
+        for key in tiles:
+            row, col = map(int, key.split(","))
+            x_min, x_max = col * tile_size, min((col + 1) * tile_size, width)
+            # the digits of the tile row and the commas between them, the last digit is followed by a comma or the newline
+            line = np.full(2 * (x_max - x_min) - 1, SEPARATOR_BYTE, dtype=np.uint8)
+            for y in range(row * tile_size, min((row + 1) * tile_size, height)):
+                offset = y * 2 * width + 2 * x_min
+                f.seek(offset)
+                old_cells = np.frombuffer(f.read(line.size), dtype=np.uint8)[::2] != OBSTACLE_BYTE
+                new_cells = walkable[y, x_min:x_max]
+
+                flat = y * width + np.arange(x_min, x_max)
+                opened.append(flat[new_cells & ~old_cells])
+                closed.append(flat[old_cells & ~new_cells])
+
+                line[::2] = np.where(new_cells, WALKABLE_BYTE, OBSTACLE_BYTE)
+                f.seek(offset)
+                f.write(line.tobytes())
+
+    changes = MazeChanges(maze_file, walkable.shape, tile_size, tiles, np.concatenate(opened or [np.empty(0, dtype=np.int64)]), np.concatenate(closed or [np.empty(0, dtype=np.int64)]), previous_digest, file_cache.file_digest(path), False)
+    file_cache.write_manifest(directory, {"maze": changes.digest, "shape": [height, width], "tile_size": tile_size, "tiles": digests})
+    return changes
+
+def convert_image(path: Path | str, shrinking_factor: float, tile_size: int = default_tile_size) -> list[MazeChanges]:
+    """
+    Converts a map again and writes only the changed tiles of its mazes. A colored map with a palette in "network_palette.json" updates all its layers, any other image is converted like image_maze_conversion.convertImageToCSV.
+
+    Inputs:
+        path: The path to the image file from the root folder.
+        shrinking_factor: The factor by which the image dimensions are shrunk.
+        tile_size: The edge length of a tile in cells.
+
+    Outputs:
+        _: The changes of each maze.
+
+    Raises:
+        FileNotFoundError: If the specified image file does not exist.
+    """
+    try:
+        palette, min_pixels = image_maze_conversion.load_palette(image_maze_conversion.palette_parameter_file, path)
+        cells = image_maze_conversion.palette_cells(path, shrinking_factor, palette, min_pixels)
+    except ValueError:
+        cells = {image_maze_conversion.get_csv_name(Path(path).name): image_maze_conversion.image_walkable(path, shrinking_factor)}
+    return [update_maze(maze_file, walkable, tile_size) for maze_file, walkable in cells.items()]
+
+""" component labels """
+
+def update_components(old_maze: np.ndarray, maze: np.ndarray, changes: MazeChanges) -> np.ndarray | None:
+    """
+    Updates the component labels of a maze loaded before the conversion, instead of labelling the whole maze again.
+    Only the components containing a closed cell or touching an opened cell can split or merge, so only their cells and the opened cells are labelled again, all other components keep their labels.
+
+    Inputs:
+        old_maze: The maze array loaded before the conversion.
+        maze: The maze array after the conversion.
+        changes: The changes of the maze.
+
+    Outputs:
+        labels: The labels as returned by astar_lib.label_components, which astar_lib.maze_components returns for the new maze array. None if the old maze array was not labelled yet.
+    """
+    walkable = np.asarray(maze) != OBSTACLE
+    old_labels = astar_lib.loaded_components.get(id(old_maze))
+    if old_labels is None or changes.full_rewrite:
+        return None
+
+    # the labels around each opened cell, padded so the 3x3 neighborhood of border cells stays inside
+    padded = np.pad(old_labels, 1, constant_values=-1)
+    ys, xs = np.unravel_index(changes.opened, maze.shape)
+    neighbors = np.stack([padded[ys + 1 + dy, xs + 1 + dx] for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+    affected = np.union1d(old_labels.flat[changes.closed], neighbors.ravel())
+    affected = affected[affected >= 0]
+
+    region = np.isin(old_labels, affected)
+    region.flat[changes.opened] = True
+    region &= walkable
+    labels = np.where(walkable, old_labels, -1)
+    # an empty region is left if only single cells were closed
+    if region.any():
+        labels = np.where(region, astar_lib.label_components(region * WALKABLE) + old_labels.max() + 1, labels)
+    # numbered from 0 again like label_components
+    _, numbers = np.unique(labels[walkable], return_inverse=True)
+    labels[walkable] = numbers
+    labels = labels.astype(np.int32)
+
+    astar_lib.set_components(maze, labels)
+    return labels
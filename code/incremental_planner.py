@@ -0,0 +1,410 @@
+import heapq
+import time
+import numpy as np
+
+import network_graph
+import parameters
+from network_graph import INFINITE_COST
+from parameters import NodePos, params_dir
+
+# parameter file with the network and the closed sections, each given as a rectangle of two corners
+disruption_parameter_file = "disruption.json"
+
+# https://en.wikipedia.org/wiki/Lifelong_Planning_A*
+# Koenig, Likhachev, Furcy: Lifelong Planning A*, Artificial Intelligence 155 (2004)
+
+class IncrementalPlanner():
+    """
+    Lifelong Planning A* (LPA*) between a fixed start and end cell of a network.
+    The search state is kept between queries, therefore after closing or reopening cells only the part of the shortest-path tree affected by the change is repaired instead of searching from scratch.
+
+    Attributes:
+        walkable (np.ndarray): The flat boolean mask of the cells of the unchanged network.
+        closed (np.ndarray): The flat boolean mask of the currently closed cells.
+        adjacency (list): The adjacency list of the unchanged network, closed cells are skipped while searching.
+        shape (tuple[int, int]): The shape of the maze.
+        start (int): The flat index of the start cell.
+        end (int): The flat index of the end cell.
+        g_costs (list[int]): The cost of each cell found by the last expansion.
+        rhs_costs (list[int]): The one-step lookahead cost of each cell.
+        expansions (int): The number of expansions of the last call of compute.
+
+    Methods:
+        __init__: Initializes a new instance of IncrementalPlanner.
+        compute: Repairs the search state and returns the shortest path.
+        update_cells: Closes or reopens cells and marks the affected cells as inconsistent.
+        close_cells: Closes cells, e.g. a closed rail section.
+        reopen_cells: Reopens previously closed cells.
+    """
+    def __init__(self, maze: np.ndarray, start: NodePos, end: NodePos, closed: np.ndarray | None = None, adjacency: list[list[tuple[int, int]]] | None = None) -> None:
+        """
+        Initializes a new IncrementalPlanner instance.
+
+        Inputs:
+            maze: The maze array of the network.
+            start: The start position.
+            end: The end position.
+            closed: An optional boolean mask of closed cells, shared by all planners of a ReplanningSession.
+            adjacency: The optional adjacency list of the unchanged network, shared by all planners of a ReplanningSession.
+        """
+        self.shape = maze.shape
+        self.walkable = network_graph.walkable_mask(maze).ravel()
+        self.closed = closed if closed is not None else np.zeros(maze.size, dtype=bool)
+        self.adjacency = adjacency if adjacency is not None else network_graph.build_adjacency(network_graph.walkable_mask(maze))
+
+        self.start = network_graph.cell_index(start.x, start.y, self.shape)
+        self.end = network_graph.cell_index(end.x, end.y, self.shape)
+
+        self.g_costs = [INFINITE_COST] * maze.size
+        self.rhs_costs = [INFINITE_COST] * maze.size
+        self.rhs_costs[self.start] = 0
+
+        # priority queue with lazy deletion, queued_keys stores the valid key of each queued cell
+        self.queue = []
+        self.queued_keys = {}
+        self.push(self.start)
+
+        self.expansions = 0
+
+    def is_open(self, idx: int) -> bool:
+        """
+        Checks if a cell can be passed.
+
+        Inputs:
+            idx: The flat index of the cell.
+
+        Outputs:
+            _: True if the cell belongs to the network and is not closed.
+        """
+        return self.walkable[idx] and not self.closed[idx]
+
+    def calculate_key(self, idx: int) -> tuple[int, int]:
+        """
+        Calculates the priority of a cell.
+
+        Inputs:
+            idx: The flat index of the cell.
+
+        Outputs:
+            _: The key (min(g, rhs) + h, min(g, rhs)).
+        """
+        cost = min(self.g_costs[idx], self.rhs_costs[idx])
+        if cost >= INFINITE_COST:
+            return INFINITE_COST, INFINITE_COST
+        return cost + network_graph.octile_cost(idx, self.end, self.shape[1]), cost
+
+    def push(self, idx: int) -> None:
+        """
+        Inserts or reinserts a cell into the priority queue.
+
+        Inputs:
+            idx: The flat index of the cell.
+        """
+        key = self.calculate_key(idx)
+        self.queued_keys[idx] = key
+        heapq.heappush(self.queue, (key, idx))
+
+    def top_key(self) -> tuple[int, int]:
+        """
+        Returns the smallest valid key of the priority queue, dropping outdated entries.
+
+        Outputs:
+            _: The smallest key, or an infinite key if the queue is empty.
+        """
+        while self.queue:
+            key, idx = self.queue[0]
+            if self.queued_keys.get(idx) == key:
+                return key
+            heapq.heappop(self.queue)
+        return INFINITE_COST, INFINITE_COST
+
+    def update_vertex(self, idx: int) -> None:
+        """
+        Recalculates the lookahead cost of a cell and (re)queues it if it is inconsistent.
+
+        Inputs:
+            idx: The flat index of the cell.
+        """
+        if idx != self.start:
+            best = INFINITE_COST
+            if self.is_open(idx):
+                for neighbor, step_cost in self.adjacency[idx]:
+                    if self.g_costs[neighbor] + step_cost < best and not self.closed[neighbor]:
+                        best = self.g_costs[neighbor] + step_cost
+            self.rhs_costs[idx] = best
+
+        self.requeue(idx)
+
+    def requeue(self, idx: int) -> None:
+        """
+        Removes a cell from the priority queue and queues it again with its new key if it is inconsistent.
+
+        Inputs:
+            idx: The flat index of the cell.
+        """
+        self.queued_keys.pop(idx, None)
+
+        if self.g_costs[idx] != self.rhs_costs[idx]:
+            self.push(idx)
+
+    def compute(self) -> tuple[float, list[int]]:
+        """
+        Expands inconsistent cells until the shortest path to the end cell is known again.
+
+        Outputs:
+            distance, path: The distance in maze units and the flat indices of the path from start to end. If no path exists, the distance is 0 and the path is empty, like a failed run of the C algorithm.
+        """
+        self.expansions = 0
+
+        while self.top_key() < self.calculate_key(self.end) or self.rhs_costs[self.end] != self.g_costs[self.end]:
+            _, idx = heapq.heappop(self.queue)
+            del self.queued_keys[idx]
+            self.expansions += 1
+
+            if self.g_costs[idx] > self.rhs_costs[idx]:
+                # overconsistent: the cell got cheaper, which can only lower the lookahead cost of its neighbors
+                self.g_costs[idx] = self.rhs_costs[idx]
+                for neighbor, step_cost in self.adjacency[idx]:
+                    if self.g_costs[idx] + step_cost < self.rhs_costs[neighbor] and neighbor != self.start and not self.closed[neighbor]:
+                        self.rhs_costs[neighbor] = self.g_costs[idx] + step_cost
+                        self.requeue(neighbor)
+            else:
+                # underconsistent: the cell got more expensive, only the cells whose lookahead cost depended on it are reevaluated
+                old_cost = self.g_costs[idx]
+                self.g_costs[idx] = INFINITE_COST
+                self.update_vertex(idx)
+                for neighbor, step_cost in self.adjacency[idx]:
+                    if self.rhs_costs[neighbor] == old_cost + step_cost:
+                        self.update_vertex(neighbor)
+
+        if self.g_costs[self.end] >= INFINITE_COST:
+            return 0, []
+
+        return network_graph.cost_to_distance(self.g_costs[self.end]), self.extract_path()
+
+    def extract_path(self) -> list[int]:
+        """
+        Follows the cheapest predecessors from the end cell back to the start cell.
+
+        Outputs:
+            path: The flat indices from start to end.
+        """
+        path = [self.end]
+        idx = self.end
+
+        while idx != self.start:
+            # the predecessor is the open neighbor through which the cell got its cost
+            _, idx = min((self.g_costs[neighbor] + step_cost, neighbor) for neighbor, step_cost in self.adjacency[idx] if not self.closed[neighbor])
+            path.append(idx)
+
+        return path[::-1]
+
+    def update_cells(self, cells: list[int], closed: bool) -> None:
+        """
+        Closes or reopens cells. The planner only marks the affected cells, the repair happens in the next call of compute.
+
+        Inputs:
+            cells: The flat indices of the cells.
+            closed: True to close the cells, False to reopen them.
+        """
+        self.closed[cells] = closed
+        self.notify_changed(cells)
+
+    def notify_changed(self, cells: list[int]) -> None:
+        """
+        Marks the changed cells and their neighbors as possibly inconsistent.
+
+        Inputs:
+            cells: The flat indices of the cells that were closed or reopened.
+        """
+        affected = set(cells)
+        for idx in cells:
+            affected.update(neighbor for neighbor, _ in network_graph.grid_neighbors(idx, self.shape))
+
+        for idx in affected:
+            if self.walkable[idx]:
+                self.update_vertex(idx)
+
+    def close_cells(self, cells: list[int]) -> None:
+        """
+        Closes cells, e.g. a closed rail section.
+
+        Inputs:
+            cells: The flat indices of the cells to close.
+        """
+        self.update_cells(cells, True)
+
+    def reopen_cells(self, cells: list[int]) -> None:
+        """
+        Reopens previously closed cells.
+
+        Inputs:
+            cells: The flat indices of the cells to reopen.
+        """
+        self.update_cells(cells, False)
+
+class ReplanningSession():
+    """
+    Keeps one IncrementalPlanner per city pair on a loaded network, which all share the same closures.
+
+    Attributes:
+        maze (np.ndarray): The maze array of the network.
+        closed (np.ndarray): The flat boolean mask of the closed cells shared by all planners.
+        adjacency (list): The adjacency list of the unchanged network shared by all planners.
+        planners (dict[str, IncrementalPlanner]): The planner of each pair.
+        last_routes (dict[str, tuple[float, list[int]]]): The last computed route of each pair.
+        outdated (set[str]): The pairs whose route may have changed since it was last computed.
+
+    Methods:
+        __init__: Initializes a new instance of ReplanningSession.
+        add_pair: Adds a pair and computes its initial route.
+        close_cells: Closes cells for all pairs.
+        reopen_cells: Reopens cells for all pairs.
+        routes: Repairs and returns the routes of all pairs.
+    """
+    def __init__(self, maze: np.ndarray) -> None:
+        """
+        Initializes a new ReplanningSession instance.
+
+        Inputs:
+            maze: The maze array of the network.
+        """
+        self.maze = maze
+        self.closed = np.zeros(maze.size, dtype=bool)
+        self.adjacency = network_graph.build_adjacency(network_graph.walkable_mask(maze))
+        self.planners = {}
+        self.last_routes = {}
+        self.outdated = set()
+
+    def add_pair(self, name: str, start: NodePos, end: NodePos) -> tuple[float, list[int]]:
+        """
+        Adds a pair to the session and computes its route.
+
+        Inputs:
+            name: The name of the pair.
+            start: The start position.
+            end: The end position.
+
+        Outputs:
+            _: The distance and path as returned by IncrementalPlanner.compute.
+        """
+        self.planners[name] = IncrementalPlanner(self.maze, start, end, self.closed, self.adjacency)
+        self.last_routes[name] = self.planners[name].compute()
+        return self.last_routes[name]
+
+    def close_cells(self, cells: list[int]) -> None:
+        """
+        Closes cells for all pairs of the session.
+
+        Inputs:
+            cells: The flat indices of the cells to close.
+        """
+        self.closed[cells] = True
+        for planner in self.planners.values():
+            planner.notify_changed(cells)
+
+        # closures only make cells more expensive, a route that does not pass through them stays the shortest one
+        closed_cells = set(cells)
+        for name, (distance, path) in self.last_routes.items():
+            if closed_cells.intersection(path):
+                self.outdated.add(name)
+
+    def reopen_cells(self, cells: list[int]) -> None:
+        """
+        Reopens cells for all pairs of the session.
+
+        Inputs:
+            cells: The flat indices of the cells to reopen.
+        """
+        self.closed[cells] = False
+        for planner in self.planners.values():
+            planner.notify_changed(cells)
+
+        # reopened cells can shorten any route
+        self.outdated.update(self.planners.keys())
+
+    def routes(self) -> dict[str, tuple[float, list[int]]]:
+        """
+        Repairs the routes of the pairs affected by the changes since the last call, the other routes are returned unchanged.
+
+        Outputs:
+            _: A dictionary mapping each pair name to its distance and path.
+        """
+        for name in self.outdated:
+            self.last_routes[name] = self.planners[name].compute()
+        self.outdated.clear()
+
+        return dict(self.last_routes)
+
+def cells_in_rectangle(corner1: NodePos, corner2: NodePos, maze: np.ndarray) -> list[int]:
+    """
+    Lists the walkable cells of a rectangle, e.g. to close a rail section.
+
+    Inputs:
+        corner1: One corner of the rectangle.
+        corner2: The opposite corner of the rectangle, inclusive.
+        maze: The maze array of the network.
+
+    Outputs:
+        _: The flat indices of the walkable cells inside of the rectangle.
+    """
+    x0, x1 = sorted((corner1.x, corner2.x))
+    y0, y1 = sorted((corner1.y, corner2.y))
+
+    mask = np.zeros(maze.shape, dtype=bool)
+    mask[y0:y1 + 1, x0:x1 + 1] = True
+    return np.flatnonzero(mask & network_graph.walkable_mask(maze)).tolist()
+
+def load_disruption(filename: str) -> tuple[str, list[tuple[NodePos, NodePos]]]:
+    """
+    Loads the network and the closed sections of a disruption from a JSON file.
+
+    Inputs:
+        filename: The name of the parameter file.
+
+    Outputs:
+        maze_name, sections: The file name of the maze and a list of the (corner1, corner2) rectangles of the closed sections.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+
+    try:
+        sections = [(NodePos(*section["corner1"].values()), NodePos(*section["corner2"].values())) for section in params["closed_sections"]]
+        return params["maze_name"], sections
+    except KeyError as e:
+        raise KeyError(f"The disruption parameter {e} does not exist!")
+
+def verify_against_scratch(session: ReplanningSession) -> tuple[float, dict[str, tuple[float, float, float]]]:
+    """
+    Compares the repaired routes of a session with exact searches from scratch on the changed network and measures both.
+
+    Inputs:
+        session: The session whose closures were changed since its last call of routes.
+
+    Outputs:
+        replanning_time: The time in seconds to repair the routes of all pairs.
+        results: A dictionary mapping each pair name to (replanned distance, scratch distance, scratch time) with the time in seconds.
+        Raises an AssertionError if any replanned distance differs from the distance searched from scratch.
+    """
+    walkable = network_graph.walkable_mask(session.maze) & ~session.closed.reshape(session.maze.shape)
+    adjacency = network_graph.build_adjacency(walkable)
+    width = session.maze.shape[1]
+    results = {}
+
+    t0 = time.perf_counter()
+    routes = session.routes()
+    replanning_time = time.perf_counter() - t0
+
+    for name, (replanned_distance, _) in routes.items():
+        planner = session.planners[name]
+        t1 = time.perf_counter()
+        scratch_cost, _ = network_graph.shortest_path(adjacency, planner.start, planner.end, width)
+        scratch_time = time.perf_counter() - t1
+
+        scratch_distance = network_graph.cost_to_distance(scratch_cost) if scratch_cost < INFINITE_COST else 0
+        if replanned_distance != scratch_distance:
+            raise AssertionError(f"The replanned distance {replanned_distance} of {name} differs from the distance {scratch_distance} searched from scratch!")
+
+        results[name] = (replanned_distance, scratch_distance, scratch_time)
+
+    return replanning_time, results
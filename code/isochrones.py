@@ -0,0 +1,238 @@
+import math
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import network_graph
+import network_snapping
+import shared_networks
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST, PRECISION_FACTOR
+from parameters import NodePos
+
+# https://en.wikipedia.org/wiki/Isochrone_map
+
+isochrone_dir = comparison.output_dir.joinpath("isochrones")
+
+# minutes of the cells which are not reached within the limit, the largest value of the uint16 grid
+UNREACHED = np.iinfo(np.uint16).max
+# band of the cells which are not reached within the limit
+UNREACHED_BAND = np.iinfo(np.uint8).max
+
+default_max_minutes = 60
+default_band_minutes = 15
+
+# state of each worker process, filled once by init_worker
+worker_state = {}
+
+def network_speeds() -> dict[str, tuple[str, float]]:
+    """
+    Collects the title and the average speed of every network of comparison.vehicle_networks.
+
+    Outputs:
+        speeds: A dictionary mapping each maze file to its (title, speed in km/h).
+    """
+    speeds = {}
+    for vehicle_type, (slow_maze_file, fast_maze_file, slow_speed, fast_speed) in comparison.vehicle_networks.items():
+        slow_title, fast_title = comparison.network_titles[vehicle_type]
+        speeds[slow_maze_file] = (slow_title, slow_speed)
+        speeds[fast_maze_file] = (fast_title, fast_speed)
+    return speeds
+
+def cost_minutes(speed: float) -> float:
+    """
+    Calculates the real travel time of one unit of the integer search cost on a network.
+
+    Inputs:
+        speed: The average speed on the network in km/h.
+
+    Outputs:
+        _: The minutes per cost unit.
+    """
+    return 60 * comparison.DISTANCE_SCALE_FACTOR / speed / PRECISION_FACTOR
+
+def isochrone(adjacency: list[list[tuple[int, int]]], shape: tuple[int, int], source: int, speed: float, max_minutes: int = default_max_minutes) -> np.ndarray:
+    """
+    Calculates the travel time from a cell to every cell reachable within a limit, with a single Dijkstra expansion which stops at the limit.
+
+    Inputs:
+        adjacency: The adjacency list of the network.
+        shape: The shape of the maze.
+        source: The flat index of the source cell.
+        speed: The average speed on the network in km/h.
+        max_minutes: The limit of the travel time, less than UNREACHED.
+
+    Outputs:
+        minutes: A uint16 array of the maze shape with the minutes to each cell, rounded up, UNREACHED beyond the limit and for obstacles.
+    """
+    if not 0 <= max_minutes < UNREACHED:
+        raise ValueError(f"The limit of an isochrone has to be between 0 and {UNREACHED - 1} minutes!")
+
+    costs = network_graph.distance_field(adjacency, source, int(max_minutes / cost_minutes(speed)))
+    reached = costs < INFINITE_COST
+
+    minutes = np.full(costs.size, UNREACHED, dtype=np.uint16)
+    # rounding errors could otherwise lift a cell right at the limit above it
+    minutes[reached] = np.minimum(np.ceil(costs[reached] * cost_minutes(speed)), max_minutes)
+    return minutes.reshape(shape)
+
+def contour_bands(minutes: np.ndarray, band_minutes: int = default_band_minutes) -> tuple[np.ndarray, list[dict]]:
+    """
+    Splits an isochrone into bands of equal travel time, e.g. (0, 15], (15, 30] minutes and so on.
+
+    Inputs:
+        minutes: The minutes grid of an isochrone.
+        band_minutes: The width of a band in minutes.
+
+    Outputs:
+        bands: A uint8 array with the band number of each cell, UNREACHED_BAND for cells beyond the limit and obstacles.
+        summary: A dictionary per band with its lower and upper minutes, the cells of the band and the cells reachable up to its upper minutes.
+    """
+    reached = minutes != UNREACHED
+    # the source is part of the first band
+    band_numbers = np.maximum(minutes[reached].astype(np.int32) - 1, 0) // band_minutes
+    bands = np.full(minutes.shape, UNREACHED_BAND, dtype=np.uint8)
+    bands[reached] = band_numbers
+
+    counts = np.bincount(band_numbers, minlength=1)
+    summary = []
+    for band, (cells, reachable_cells) in enumerate(zip(counts.tolist(), np.cumsum(counts).tolist())):
+        summary.append({"from": band * band_minutes, "to": (band + 1) * band_minutes, "cells": cells, "reachable_cells": reachable_cells})
+    return bands, summary
+
+def band_heatmap(bands: np.ndarray, band_minutes: int = default_band_minutes) -> np.ndarray:
+    """
+    Converts the bands of an isochrone into a heatmap for maze_plot.show_heatmap.
+
+    Inputs:
+        bands: The band number of each cell as returned by contour_bands.
+        band_minutes: The width of a band in minutes.
+
+    Outputs:
+        _: A float array with the upper minutes of the band of each cell, NaN beyond the limit and for obstacles.
+    """
+    return np.where(bands != UNREACHED_BAND, (bands.astype(np.float64) + 1) * band_minutes, np.nan)
+
+""" parallel isochrones """
+
+def init_worker(descriptor: dict, maze_files: list[str]) -> None:
+    """
+    Attaches the adjacency of every network once in each worker process from shared memory, instead of building an adjacency list per worker.
+
+    Inputs:
+        descriptor: The descriptor of the SharedNetworks holding the mazes and their adjacency.
+        maze_files: The maze files of the networks.
+    """
+    networks = shared_networks.attach_networks(descriptor)
+    worker_state["adjacency"] = {maze_file: shared_networks.attached_adjacency(networks, maze_file) for maze_file in maze_files}
+    worker_state["shapes"] = {maze_file: networks[maze_file].shape for maze_file in maze_files}
+
+def compute_isochrone(task: tuple[str, str, int, float, int]) -> tuple[str, str, np.ndarray]:
+    """
+    Calculates the isochrone of a city on a network in a worker process.
+
+    Inputs:
+        task: A tuple (city name, maze file, source cell, speed, max minutes).
+
+    Outputs:
+        city_name, maze_file, minutes: The city, the network and the minutes grid.
+    """
+    city_name, maze_file, source, speed, max_minutes = task
+    return city_name, maze_file, isochrone(worker_state["adjacency"][maze_file], worker_state["shapes"][maze_file], source, speed, max_minutes)
+
+def city_isochrones(cities: dict[str, NodePos], maze_files: list[str], max_minutes: int = default_max_minutes, workers: int | None = None) -> tuple[dict[str, dict[str, np.ndarray]], dict[str, dict[str, int]]]:
+    """
+    Calculates the isochrone of every city on every network in parallel worker processes, which attach the networks and their adjacency from shared memory.
+    Cities lying off a network are snapped to it first, cities further than network_snapping.max_snap_distance away are skipped.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects, measurement nodes are skipped.
+        maze_files: The networks, maze files of comparison.vehicle_networks.
+        max_minutes: The limit of the travel time.
+        workers: The number of worker processes. Defaults to the number of CPUs.
+
+    Outputs:
+        isochrones: The minutes grid of each city on each network, {maze file: {city name: minutes}}.
+        city_cells: The snapped cell of each city on each network, {maze file: {city name: flat index}}.
+    """
+    networks = comparison.load_networks()
+    speeds = network_speeds()
+
+    tasks = []
+    city_cells = {}
+    for maze_file in maze_files:
+        maze = networks[maze_file]
+        city_cells[maze_file] = {}
+        for name, pos in cities.items():
+            if name.startswith(comparison.measurement_node_prefix):
+                continue
+            snapped_pos, distance = network_snapping.index_for(maze, maze_file).snap(pos)
+            if distance <= network_snapping.max_snap_distance:
+                city_cells[maze_file][name] = network_graph.cell_index(snapped_pos.x, snapped_pos.y, maze.shape)
+                tasks.append((name, maze_file, city_cells[maze_file][name], speeds[maze_file][1], max_minutes))
+
+    isochrones = {maze_file: {} for maze_file in maze_files}
+    with shared_networks.SharedNetworks() as shared:
+        for maze_file in maze_files:
+            shared.publish(maze_file, networks[maze_file])
+            shared.publish_adjacency(maze_file, networks[maze_file])
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared.descriptor, maze_files)) as executor:
+            for city_name, maze_file, minutes in executor.map(compute_isochrone, tasks):
+                isochrones[maze_file][city_name] = minutes
+
+    return isochrones, city_cells
+
+def reachable_cities(minutes: np.ndarray, city_cells: dict[str, int], band_minutes: int = default_band_minutes) -> dict[int, list[str]]:
+    """
+    Groups the cities reached by an isochrone by the upper minutes of their band.
+
+    Inputs:
+        minutes: The minutes grid of an isochrone.
+        city_cells: The cell of each city on the network of the isochrone.
+        band_minutes: The width of a band in minutes.
+
+    Outputs:
+        _: The names of the cities of each band, {upper minutes: [city name]}, in the order of their travel time.
+    """
+    flat_minutes = minutes.ravel()
+    reached = sorted((int(flat_minutes[cell]), name) for name, cell in city_cells.items() if flat_minutes[cell] != UNREACHED)
+
+    bands = {}
+    for city_minutes, name in reached:
+        bands.setdefault(max(math.ceil(city_minutes / band_minutes), 1) * band_minutes, []).append(name)
+    return bands
+
+def heatmap_file(city_name: str, maze_file: str, directory: Path = isochrone_dir) -> Path:
+    """
+    Returns the path of the heatmap of an isochrone.
+
+    Inputs:
+        city_name: The name of the city.
+        maze_file: The maze file of the network.
+        directory: The output folder.
+
+    Outputs:
+        _: The path of the image, named after the city and the maze file.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory.joinpath(f"{city_name}-{Path(maze_file).stem}.png")
+
+def save_isochrones(maze_file: str, isochrones: dict[str, np.ndarray], directory: Path = isochrone_dir) -> Path:
+    """
+    Saves the minutes grids of all cities on a network as one compressed numpy archive.
+
+    Inputs:
+        maze_file: The maze file of the network.
+        isochrones: The minutes grid of each city.
+        directory: The output folder.
+
+    Outputs:
+        path: The path of the archive, named after the maze file.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory.joinpath(Path(maze_file).stem + ".npz")
+    # https://numpy.org/doc/stable/reference/generated/numpy.savez_compressed.html
+    np.savez_compressed(path, **isochrones)
+    return path
@@ -1,3 +1,5 @@
+import os
+import time
 import maze_cli
 import parameters as params
 import astar_lib
@@ -5,6 +7,25 @@ import image_maze_conversion
 import train_car_comparison as comparison
 import maze_plot
 import investement_calculator
+import result_store
+import incremental_planner
+import network_vulnerability
+import route_service
+import contraction_hierarchy
+import alternative_routes
+import network_snapping
+import tiled_maze
+import pareto_routes
+import parameter_sweep
+import multimodal_routes
+import time_dependent
+import timetable_routes
+import batch_runs
+import isochrones
+import city_tours
+import network_graph
+import incremental_conversion
+import distance_fields
 
 from maze_cli import Mode
 
@@ -16,6 +37,9 @@ cities_file = "cities.json"
 # parameters file for the maze solving algorithm
 maze_parameter_file = "maze.json"
 
+# folder of the search replay animations
+search_replay_dir = comparison.output_dir.joinpath("search-replay")
+
 def print_results(network_name: str, distance: int, hours: int, minutes: int) -> None:
     """
     Prints the results of a network analysis, including the network name, distance covered, and time taken.
@@ -30,6 +54,42 @@ def print_results(network_name: str, distance: int, hours: int, minutes: int) ->
     print(f"The covered distance was {distance} km.")
     print(f"It takes {hours} h {minutes} min to cover this distance.")
 
+def print_snap(pos_name: str, pos: params.NodePos, snapped_pos: params.NodePos, distance: float) -> None:
+    """
+    Prints a position which was snapped to a network, nothing if it already lay on the network.
+
+    Inputs:
+        pos_name - The name of the position, e.g. 'Start'.
+        pos - The given position.
+        snapped_pos - The nearest walkable cell of the network.
+        distance - The distance between both positions in maze units, 0 if the position was not snapped.
+    """
+    if distance > 0:
+        print(f"Snapped the {pos_name} node from x={pos.x}, y={pos.y} to x={snapped_pos.x}, y={snapped_pos.y} ({distance:.1f} maze units)")
+
+def print_cutoff_stats(vehicle_type: str, search_stats: dict, start: params.NodePos, end: params.NodePos, networks: dict) -> None:
+    """
+    Prints the share of the expansions on the slow network of a vehicle type which the fast route skipped as cutoff, measured against one search without cutoff. Nothing is printed if the cutoff skipped no node.
+
+    Inputs:
+        vehicle_type - The vehicle type, 'train' or 'car'.
+        search_stats - The expanded and skipped nodes of the search with cutoff, as returned by comparison.vehicle_analysis.
+        start - The position of the start city.
+        end - The position of the end city.
+        networks - The networks loaded with comparison.load_networks.
+    """
+    if not search_stats["skipped"]:
+        return
+
+    slow_title, fast_title = comparison.network_titles[vehicle_type]
+    slow_maze = networks[comparison.vehicle_networks[vehicle_type][0]]
+    (slow_start, _), (slow_end, _) = network_snapping.snap_to_network(start, "Start", slow_maze), network_snapping.snap_to_network(end, "End", slow_maze)
+
+    uncut_stats = {}
+    astar_lib.py_run_astar(slow_start, slow_end, slow_maze, stats=uncut_stats)
+    skipped_share = 1 - search_stats["expanded"] / uncut_stats["expanded"]
+    print(f"The {fast_title} route as cutoff skipped {skipped_share:.0%} of the {uncut_stats['expanded']} expansions on the {slow_title} ({search_stats['skipped']} nodes never entered the border).")
+
 # function to run the maze solver
 # parameters can be adjusted in the file "maze.json"
 def run_maze_solver():
@@ -42,6 +102,61 @@ def run_maze_solver():
     print(f"The covered distance was {distance:.1f} units.")
     maze_plot.show_maze(solved_maze)
 
+# function to replay the expansions of the maze solver as an animation
+# parameters can be adjusted in the file "maze.json"
+def run_search_replay():
+    """
+    Solves the maze defined in the maze parameter file while recording the expanded cells into a trace, prints the overhead of the trace and renders the expansion order as an animated GIF.
+    """
+    maze_params = params.load_params(maze_parameter_file)
+    maze = astar_lib.load_maze(maze_params.maze_name + maze_params.extension)
+    trace = astar_lib.SearchTrace(maze.size)
+    # the component labels are computed by the first search of a maze, so they are prepared before timing both searches
+    astar_lib.maze_components(maze)
+
+    start_time = time.perf_counter()
+    astar_lib.py_run_astar(maze_params.start_point, maze_params.end_point, maze)
+    plain_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    distance, solved_maze = astar_lib.py_run_astar(maze_params.start_point, maze_params.end_point, maze, trace=trace)
+    traced_time = time.perf_counter() - start_time
+    print(f"The covered distance was {distance:.1f} units after {trace.length} expansions.")
+    print(f"Search without trace: {plain_time * 1e3:.1f} ms, with trace: {traced_time * 1e3:.1f} ms")
+
+    search_replay_dir.mkdir(parents=True, exist_ok=True)
+    output_file = search_replay_dir.joinpath(f"{maze_params.maze_name}.gif")
+    frames = maze_plot.render_search_replay(maze, trace.expansions(), output_file, solved_maze=solved_maze)
+    print(f"Rendered {frames} frames into {output_file}")
+
+# function to compare train and car for all city pairs in shards, which continue from their checkpoints after a crash
+def run_batch_comparison():
+    """
+    Runs the train car comparison of every city pair in deterministic shards as independent processes. Each shard checkpoints its finished pairs and skips them when it runs again, then all shards are merged into the result store.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    job = batch_runs.comparison_job(cities)
+
+    start_time = time.perf_counter()
+    stats, records = batch_runs.run_batch(job)
+    for shard in stats:
+        failed = "".join(f"\n  {key}: {error}" for key, error in shard["failed"].items())
+        print(f"Shard {shard['shard']}: {shard['tasks']} pairs, {shard['skipped']} from the checkpoint, {shard['finished']} computed{failed}")
+    print(f"Merged {len(records)} records of {len(job.tasks)} pairs into the result store in {time.perf_counter() - start_time:.1f} s")
+
+# function to run the maze solver on tiles, which are memory mapped on demand instead of loading the whole maze
+# parameters can be adjusted in the file "maze.json"
+def run_tiled_maze_solver():
+    """
+    Solves the maze defined in the maze parameter file with the tiled search and prints the distance, the tile cache statistics and the memory compared with loading the whole maze.
+    """
+    maze_params = params.load_params(maze_parameter_file)
+    results = tiled_maze.measure_search(maze_params.maze_name + maze_params.extension, maze_params.start_point, maze_params.end_point)
+
+    print(f"The covered distance was {results['distance']:.1f} units ({results['path_cells']} cells).")
+    print(f"Tiles: {results['tile_loads']} mapped, {results['tile_evictions']} unmapped again, at most {results['tile_cache_bytes'] / 1e3:.0f} kB mapped at once")
+    print(f"Search state: {results['search_state_bytes'] / 1e3:.0f} kB, whole maze with its Node array: {results['full_grid_bytes'] / 1e3:.0f} kB")
+
 # function to run the car train comparison to find the least time consuming path
 # parameters can be adjusted in the file "maze.json"
 def run_rail_car_comparison():
@@ -53,9 +168,15 @@ def run_rail_car_comparison():
 
     data = {"Start City": start_name, "End City": end_name}
 
-    rail_title, solved_rail_maze, rail_real_distance, rail_hours, rail_minutes, rail_data = comparison.rail_analysis(start, end)
-    car_title, solved_car_maze, car_real_distance, car_hours, car_minutes, car_data = comparison.car_analysis(start, end)
+    networks = comparison.load_networks()
+    rail_title, solved_rail_maze, rail_real_distance, rail_hours, rail_minutes, rail_data = comparison.rail_analysis(start, end, networks=networks)
+    car_title, solved_car_maze, car_real_distance, car_hours, car_minutes, car_data = comparison.car_analysis(start, end, networks=networks)
     
+    for snap in rail_data.pop(comparison.output_snapped) + car_data.pop(comparison.output_snapped):
+        print_snap(*snap)
+    print_cutoff_stats("train", rail_data.pop(comparison.output_search_stats), start, end, networks)
+    print_cutoff_stats("car", car_data.pop(comparison.output_search_stats), start, end, networks)
+
     # combine rail and car data
     data.update(rail_data)
 
@@ -78,7 +199,15 @@ def run_rail_car_comparison():
     rates_per_vehicle, rates_units = investement_calculator.load_vehicle_rates_and_units()
     combined_calculated_rates = investement_calculator.calculate_rates(rates_per_vehicle, rail_real_distance, car_real_distance)
 
+    # store the typed results before the rates get converted to strings
+    records = result_store.build_comparison_records(start_name, end_name, rail_title, rail_real_distance, rail_hours * 60 + rail_minutes, car_title, car_real_distance, car_hours * 60 + car_minutes, combined_calculated_rates, rates_per_vehicle)
+    result_store.ResultStore().append(records)
+
     investement_calculator.plot_bar_char(combined_calculated_rates, rates_units)
+
+    if not comparison.load_export_option(comparison.train_car_parameter_file):
+        return
+
     # print(combined_calculated_rates, rates_per_vehicle, rates_units)
     output_data = investement_calculator.add_distances_to_calculated_rates(rail_real_distance, car_real_distance, combined_calculated_rates, rates_per_vehicle, rates_units)
 
@@ -88,6 +217,293 @@ def run_rail_car_comparison():
     output_filename = f"{start_name}-{end_name}_data.json"
     comparison.save_outputs(output_filename, data)
 
+# function to render the rail and car routes of every city pair into image files
+def run_route_rendering():
+    """
+    Analyzes the rail and car networks for every pair of cities and renders the comparison of both time efficient routes offscreen into an image file per pair. The images are rendered in parallel worker processes.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    comparison.route_images_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for start_name, end_name in comparison.city_pairs(cities):
+        start, end = cities[start_name], cities[end_name]
+        try:
+            rail_title, solved_rail_maze, *_ = comparison.rail_analysis(start, end, show_plot=False)
+            car_title, solved_car_maze, *_ = comparison.car_analysis(start, end, show_plot=False)
+        except Exception as e:
+            print(f"Skipping {start_name} - {end_name}: {e}")
+            continue
+
+        output_file = comparison.route_images_dir.joinpath(f"{start_name}-{end_name}.png")
+        jobs.append((solved_rail_maze, solved_car_maze, rail_title, car_title, comparison.DISTANCE_SCALE_FACTOR, output_file))
+
+    written_files = maze_plot.render_comparisons(jobs)
+    print(f"Rendered {len(written_files)} route images into {comparison.route_images_dir}")
+
+# function to replan the routes of all city pairs after closing sections of a network
+# parameters can be adjusted in the file "disruption.json"
+def run_disruption_replanning():
+    """
+    Plans the routes of every pair of cities on a network, closes the sections defined in the disruption file and repairs only the affected routes incrementally. The repaired distances are verified against searches from scratch and both times are printed.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    maze_name, sections = incremental_planner.load_disruption(incremental_planner.disruption_parameter_file)
+    maze = astar_lib.load_maze(maze_name)
+
+    session = incremental_planner.ReplanningSession(maze)
+    for start_name, end_name in comparison.city_pairs(cities):
+        session.add_pair(f"{start_name} - {end_name}", cities[start_name], cities[end_name])
+    initial_routes = session.routes()
+
+    closed_cells = [cell for corner1, corner2 in sections for cell in incremental_planner.cells_in_rectangle(corner1, corner2, maze)]
+    session.close_cells(closed_cells)
+    replanning_time, results = incremental_planner.verify_against_scratch(session)
+
+    print(f"Closed {len(closed_cells)} cells of {maze_name}.")
+    for name, (distance, _, _) in results.items():
+        initial_distance = initial_routes[name][0]
+        if distance != initial_distance:
+            print(f"{name}: {initial_distance * comparison.DISTANCE_SCALE_FACTOR:.0f} km -> {distance * comparison.DISTANCE_SCALE_FACTOR:.0f} km")
+
+    scratch_time = sum(scratch_time for _, _, scratch_time in results.values())
+    print(f"Replanning took {replanning_time * 1000:.1f} ms, searching all pairs from scratch {scratch_time * 1000:.1f} ms.")
+
+# function to rank the segments of the rail and road networks by the impact of closing them
+def run_vulnerability_scan():
+    """
+    Closes each segment lying on a fastest route between two cities of the rail and the road network and measures the added travel time of the affected pairs. The ranked segments are printed and saved as a table, the heatmaps are saved as images.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+
+    for vehicle_type in comparison.vehicle_networks.keys():
+        table, heatmap, maze = network_vulnerability.scan_network(vehicle_type, cities)
+        network_vulnerability.save_table(f"{vehicle_type}-segments.csv", table)
+        maze_plot.show_heatmap(heatmap, maze, f"Added minutes when closing a {vehicle_type} segment", "added travel time of all pairs [min]", comparison.DISTANCE_SCALE_FACTOR, network_vulnerability.vulnerability_dir.joinpath(f"{vehicle_type}-heatmap.png"))
+
+        print(f" === Most critical {vehicle_type} segments ===")
+        for row in table[:10]:
+            print(f"{row['rank']:>3}. segment at x={row['x']}, y={row['y']}: +{row['added_minutes']} min over {row['affected_pairs']} pairs, {row['disconnected_pairs']} disconnected, worst: {row['worst_pair']} (+{row['max_added_minutes']} min)")
+        print()
+
+    print(f"The tables and heatmaps were saved in {network_vulnerability.vulnerability_dir}")
+
+    # memory the workers allocate to prepare the network, copied versus attached from shared memory
+    workers = os.cpu_count() or 1
+    print(" === Worker memory for the networks ===")
+    for vehicle_type in comparison.vehicle_networks:
+        for worker_count in sorted({1, workers}):
+            copied = network_vulnerability.worker_memory(vehicle_type, worker_count, shared=False)
+            shared = network_vulnerability.worker_memory(vehicle_type, worker_count, shared=True)
+            print(f"{vehicle_type}, {worker_count} worker(s): {copied / 1e6:.2f} MB copied, {shared / 1e6:.3f} MB shared")
+
+# function to keep the networks loaded and answer route queries until the user stops the service
+def run_route_service():
+    """
+    Starts the local HTTP/JSON route service, which loads the networks once and answers route, compare and matrix queries until Ctrl+C is pressed.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    route_service.run_service(cities)
+
+# function to build the contraction hierarchies and compare their query latency with the A* algorithm
+def run_hierarchy_benchmark():
+    """
+    Builds (or loads) the contraction hierarchy of the rail and the road network, checks every city pair against an exact search and prints the build time, the memory and the query latency compared with A*.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+
+    for maze_file in [comparison.rail_network_maze_file, comparison.road_maze_file]:
+        results = contraction_hierarchy.benchmark(maze_file, cities)
+
+        print(f" === {maze_file} ===")
+        if results["build_time"]:
+            print(f"Build time: {results['build_time']:.1f} s")
+        else:
+            print(f"Build time: loaded from {contraction_hierarchy.hierarchy_dir(maze_file)}")
+        print(f"Memory: {results['hierarchy_bytes'] / 1e3:.0f} kB hierarchy ({results['shortcuts']} shortcuts), {results['maze_bytes'] / 1e3:.0f} kB maze")
+        print(f"Query: {results['search_us']:.0f} µs, {results['query_us']:.0f} µs with the unpacked path, A*: {results['astar_us']:.0f} µs")
+        print()
+
+# function to list alternative routes between the cities defined in "train_car_comparison.json"
+def run_alternative_routes():
+    """
+    Finds up to three meaningfully different rail and car routes between the start and end city of the train car comparison and prints the distance, time and network breakdown of each route.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, start, end = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+
+    for vehicle_type in comparison.vehicle_networks.keys():
+        routes = alternative_routes.AlternativeRoutes(vehicle_type).alternatives(start, end)
+
+        print(f" === {vehicle_type.capitalize()} alternatives {start_name} - {end_name} ===")
+        for i, route in enumerate(routes):
+            hours, minutes = comparison.minutes_to_hours_and_minutes(route["minutes"])
+            breakdown = ", ".join(f"{title}: {part['distance']} km / {part['minutes']} min" for title, part in route["breakdown"].items() if part["distance"])
+            print(f"{i + 1}. {route['distance']} km in {hours}h {minutes}min ({breakdown}), {route['overlap']:.0%} shared with another route")
+        print()
+
+# function to list the pareto optimal trips between the cities defined in "train_car_comparison.json"
+def run_pareto_routes():
+    """
+    Finds the trips between the start and end city of the train car comparison which no other trip beats in time, price and emissions at once, over all vehicles and routes, and prints them with the label counts and runtime of the searches.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, start, end = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+    _, rates_units = investement_calculator.load_vehicle_rates_and_units()
+
+    options, stats = pareto_routes.pareto_options(start, end)
+
+    print(f" === Pareto optimal trips {start_name} - {end_name} ===")
+    for option in options:
+        hours, minutes = comparison.minutes_to_hours_and_minutes(option["minutes"])
+        breakdown = ", ".join(f"{title}: {part['distance']} km" for title, part in option["breakdown"].items() if part["distance"])
+        print(f"{option['vehicle']}: {hours}h {minutes}min, {option['distance']} km ({breakdown}), {option['price']:.2f} {rates_units['Price unit']}, {option['emissions']:.2f} {rates_units['Emissions unit']}")
+    print()
+    for vehicle_type, search in stats.items():
+        print(f"{vehicle_type.capitalize()} search: {search['routes']} routes, {search['created_labels']} labels created, {search['settled_labels']} settled, {search['dropped_labels']} dropped at full cells, at most {search['largest_label_set']} per cell, {search['runtime'] * 1e3:.0f} ms")
+
+# function to evaluate the train car comparison of all city pairs for every combination of the parameters in "parameter_sweep.json"
+def run_parameter_sweep():
+    """
+    Evaluates every city pair for every combination of the distance scale factor, speeds and vehicle rates listed in the sweep parameter file, reusing the cached route lengths. The scenarios are saved as a table and the share of pairs won by the train is printed for each swept value.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+
+    start_time = time.perf_counter()
+    pairs, scenarios, results = parameter_sweep.run_sweep(cities)
+    sweep_time = time.perf_counter() - start_time
+    parameter_sweep.save_table(pairs, scenarios, results)
+
+    scenario_count = len(scenarios["DISTANCE_SCALE_FACTOR"])
+    print(f"Evaluated {len(pairs)} city pairs in {scenario_count} scenarios in {sweep_time:.2f} s.")
+
+    for name, shares in parameter_sweep.train_win_shares(scenarios, results).items():
+        print(f"Pairs won by the train per {name} value: " + ", ".join(f"{value:g}: {share:.0%}" for value, share in shares.items()))
+
+    print(f"The table was saved in {parameter_sweep.sweep_dir.joinpath(parameter_sweep.table_file)}")
+
+# function to compare the bounded suboptimal search with the exact search between the cities defined in "train_car_comparison.json"
+def run_bounded_search():
+    """
+    Searches the route between the start and end city of the train car comparison on the regional rail and the road network with the exact A* algorithm and with the bounded search for several accepted bounds, a small expansion budget and a short deadline, and prints the distance, proven bound, expansions and time of each search.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, start, end = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+
+    for maze_file in [comparison.rail_network_maze_file, comparison.road_maze_file]:
+        maze = astar_lib.load_maze(maze_file)
+        (start_pos, start_distance), (end_pos, end_distance) = network_snapping.snap_to_network(start, "Start", maze), network_snapping.snap_to_network(end, "End", maze)
+        print_snap("Start", start, start_pos, start_distance)
+        print_snap("End", end, end_pos, end_distance)
+
+        start_time = time.perf_counter()
+        distance, _ = astar_lib.py_run_astar(start_pos, end_pos, maze)
+        print(f" === {maze_file}: {start_name} - {end_name} ===")
+        print(f"A*: {distance:.1f} units in {(time.perf_counter() - start_time) * 1e3:.1f} ms")
+
+        for label, options in [("epsilon 1", {"epsilon": 1}), ("epsilon 1.2", {"epsilon": 1.2}), ("epsilon 1.5", {"epsilon": 1.5}), ("epsilon 2", {"epsilon": 2}), ("weight 2, 200 expansions", {"weight": 2, "max_expansions": 200}), ("weight 2, 5 ms deadline", {"weight": 2, "deadline": 0.005})]:
+            start_time = time.perf_counter()
+            distance, _, result = astar_lib.py_run_bounded_astar(start_pos, end_pos, maze, **options)
+            elapsed = (time.perf_counter() - start_time) * 1e3
+            print(f"{label}: {distance:.1f} units, at most {result['bound']:.2f} x the shortest path, {result['expansions']} expansions, stopped: {result['status']}, {elapsed:.1f} ms")
+        print()
+
+# function to find the fastest itinerary combining train and car between the cities defined in "train_car_comparison.json"
+# the transfer penalties can be adjusted in the file "multimodal.json"
+def run_multimodal_routes():
+    """
+    Finds the fastest itinerary between the start and end city of the train car comparison, which may change between car and train at any city, and prints its legs and transfers next to the fastest trips by train only and by car only.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, _, _ = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+    network = multimodal_routes.MultimodalNetwork(cities, multimodal_routes.load_transfer_minutes(multimodal_routes.multimodal_parameter_file))
+
+    print(f" === Fastest itinerary {start_name} - {end_name} ===")
+    for label, vehicle_types in [("Train only", ["train"]), ("Car only", ["car"]), ("Train and car", None)]:
+        itinerary = network.itinerary(start_name, end_name, vehicle_types)
+        hours, minutes = comparison.minutes_to_hours_and_minutes(itinerary["minutes"])
+        print(f"{label}: {itinerary['distance']} km in {hours}h {minutes}min")
+
+    for leg, transfer in zip(itinerary["legs"], itinerary["transfers"] + [None]):
+        print(f"  {leg['vehicle_type'].capitalize()} from {leg['start_city']} to {leg['end_city']}: {leg['distance']} km in {leg['minutes']} min")
+        if transfer is not None:
+            print(f"  Change from {transfer['from']} to {transfer['to']} in {transfer['city']}: {transfer['minutes']} min")
+
+# function to find the fastest routes between the cities defined in "train_car_comparison.json" for several departure times
+# the speed profiles can be adjusted in the file "speed_profiles.json"
+def run_time_dependent_routes():
+    """
+    Searches the fastest train and car route between the start and end city of the train car comparison for several departure times with the time-dependent speed profiles, and prints the travel and arrival times next to the static travel time and the runtime of both searches.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, start, end = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+    profile_params = time_dependent.load_profiles(time_dependent.profile_parameter_file)
+    departures = [time_dependent.clock_minutes(clock) for clock in ["03:00", "07:30", "12:00", "17:30", "23:00"]]
+
+    for vehicle_type in comparison.vehicle_networks.keys():
+        network = time_dependent.TimeDependentNetwork(vehicle_type, profile_params)
+        shape = network.network.maze.shape
+        (start_pos, start_distance), (end_pos, end_distance) = network_snapping.snap_to_network(start, "Start", network.network.maze), network_snapping.snap_to_network(end, "End", network.network.maze)
+        print_snap("Start", start, start_pos, start_distance)
+        print_snap("End", end, end_pos, end_distance)
+        start_cell, end_cell = network_graph.cell_index(start_pos.x, start_pos.y, shape), network_graph.cell_index(end_pos.x, end_pos.y, shape)
+
+        print(f" === {vehicle_type.capitalize()} {start_name} - {end_name} ===")
+        for result in time_dependent.departure_profile(network, start_cell, end_cell, departures):
+            print(f"Departure {result['departure']}: arrival {result['arrival']}, {result['minutes']:.0f} min (constant speeds: {result['static_minutes']:.0f} min), search {result['runtime'] * 1e3:.1f} ms (static: {result['static_runtime'] * 1e3:.1f} ms)")
+        print()
+
+# function to find the earliest train journey between the cities defined in "train_car_comparison.json" from the timetable
+# the departure time can be adjusted in the file "train_car_comparison.json", the timetable is in the folder "maze-parameters/timetable"
+def run_timetable_routes():
+    """
+    Finds the journey arriving first from the start to the end city of the train car comparison for its departure time with the Connection Scan Algorithm and prints its legs next to the estimate of the rail analysis. Then the optimal departures of the whole day are searched for all pairs of stops and the journey is plotted on the rail network.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, end_name, start, end = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+    departure = timetable_routes.load_departure_time(comparison.train_car_parameter_file)
+    timetable = timetable_routes.Timetable()
+
+    start_time = time.perf_counter()
+    journey = timetable.earliest_arrival(timetable.stop(start_name), timetable.stop(end_name), departure)
+    query_time = time.perf_counter() - start_time
+
+    print(f" === Train {start_name} - {end_name}, departure from {timetable_routes.format_time(departure)[:5]} ===")
+    if journey is None:
+        print("No train reaches the destination on this day.")
+        return
+
+    for leg in journey["legs"]:
+        print(f"{leg['line']}: {leg['from']} {timetable_routes.format_time(leg['departure'])[:5]} - {leg['to']} {timetable_routes.format_time(leg['arrival'])[:5]}")
+    hours, minutes = comparison.minutes_to_hours_and_minutes(journey["arrival"] - journey["departure"])
+    _, _, _, estimate_hours, estimate_minutes, _ = comparison.rail_analysis(start, end, show_plot=False)
+    print(f"Travel time: {hours}h {minutes}min with {max(len(journey['legs']) - 1, 0)} changes, found in {query_time * 1e3:.1f} ms (estimate from the speeds: {estimate_hours}h {estimate_minutes}min)")
+
+    start_time = time.perf_counter()
+    profiles = timetable.all_pairs_profiles()
+    profile_time = time.perf_counter() - start_time
+    print(f"{len(profiles[(start_name, end_name)])} optimal departures of the day, all {len(profiles)} pairs of stops searched in {profile_time * 1e3:.0f} ms")
+
+    maze_plot.show_maze(timetable_routes.journey_maze(timetable, journey))
+
+# function to check the positions of the cities in "cities.json" against every network
+def run_city_snapping():
+    """
+    Snaps all cities to each network and prints the cities which do not lie on a walkable cell, with their nearest network cell and the distance to it.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+
+    for maze_file in comparison.load_networks().keys():
+        off_network = [row for row in network_snapping.snap_cities(cities, maze_file) if row["distance"] > 0]
+
+        print(f" === {maze_file} ===")
+        if not off_network:
+            print("All cities lie on the network.")
+        for row in off_network:
+            too_far = " (too far, will not be snapped)" if row["distance"] > network_snapping.max_snap_distance else ""
+            print(f"{row['name']}: x={row['x']}, y={row['y']} -> x={row['snapped_x']}, y={row['snapped_y']}, {row['distance']:.1f} maze units{too_far}")
+        print()
+
 # function to run the conversion from image to csv file usable for the algorithm
 def run_maze_converter():
     """
@@ -107,10 +523,174 @@ def run_maze_converter():
         raise ValueError("Please enter a valid integer shrinking factor!")
     image_maze_conversion.convertImageToCSV(path_from_root, shrinking_factor)
 
+# function to convert a colored map into the csv files of all its networks at once
+def run_palette_converter():
+    """
+    Converts a colored map to a CSV file per network layer, with the palette of the map defined in "network_palette.json". It prompts the user for the path to the image and the shrinking factor, then prints the walkable cells of each layer.
+
+    Raises:
+        ValueError: If the input shrinking factor is invalid or not greater than zero.
+    """
+    path_from_root = input("Please enter the Path to the colored map from the root folder: ")
+    shrinking_factor = input("Please enter the factor by which the image should be shrunken: ")
+
+    try:
+        shrinking_factor = float(shrinking_factor)
+        if shrinking_factor <= 0:
+            raise ValueError("Please enter a number >0!")
+    except:
+        raise ValueError("Please enter a valid shrinking factor!")
+    palette, min_pixels = image_maze_conversion.load_palette(image_maze_conversion.palette_parameter_file, path_from_root)
+
+    start_time = time.perf_counter()
+    cells = image_maze_conversion.convertPaletteImageToCSVs(path_from_root, shrinking_factor, palette, min_pixels)
+    runtime = time.perf_counter() - start_time
+
+    for maze_file, layer_cells in cells.items():
+        print(f"{maze_file}: {layer_cells.shape[0]}x{layer_cells.shape[1]} cells, {layer_cells.sum()} walkable")
+    print(f"Converted {len(cells)} layers in {runtime:.2f} s")
+
+# function to find the area reachable within an hour from every city on each network
+def run_isochrones():
+    """
+    Calculates the isochrone of every city on the four networks in parallel and saves the minutes grids. For the departure city of the train car comparison, the contour bands are saved as heatmaps and the cities reached in each band are printed.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    start_name, *_ = comparison.load_destinations(comparison.train_car_parameter_file, cities)
+    speeds = isochrones.network_speeds()
+    maze_files = list(speeds.keys())
+    networks = comparison.load_networks()
+
+    start_time = time.perf_counter()
+    grids, city_cells = isochrones.city_isochrones(cities, maze_files)
+    runtime = time.perf_counter() - start_time
+    print(f"Calculated {sum(len(network_grids) for network_grids in grids.values())} isochrones of {isochrones.default_max_minutes} min in {runtime:.2f} s\n")
+
+    for maze_file in maze_files:
+        title, speed = speeds[maze_file]
+        isochrones.save_isochrones(maze_file, grids[maze_file])
+        if start_name not in grids[maze_file]:
+            print(f"{start_name} is too far away from the {title}\n")
+            continue
+
+        minutes = grids[maze_file][start_name]
+        bands, summary = isochrones.contour_bands(minutes)
+        maze_plot.show_heatmap(isochrones.band_heatmap(bands), networks[maze_file], f"{title} within {isochrones.default_max_minutes} min from {start_name}", "travel time [min]", comparison.DISTANCE_SCALE_FACTOR, isochrones.heatmap_file(start_name, maze_file))
+
+        reached = isochrones.reachable_cities(minutes, city_cells[maze_file])
+        print(f" === {title} from {start_name} at {speed} km/h ===")
+        for band in summary:
+            print(f"{band['from']}-{band['to']} min: {band['cells']} cells ({band['reachable_cells']} in total), cities: {', '.join(reached.get(band['to'], [])) or '-'}")
+        print()
+
+    print(f"The isochrones and heatmaps were saved in {isochrones.isochrone_dir}")
+
+# function to find the fastest round trip through the cities defined in "tour.json"
+def run_city_tours():
+    """
+    Finds the fastest rail and car round trip through the cities of the tour parameter file. The travel time matrix, the solution and the stitched route of each vehicle type are printed with their runtime, and the routes are saved as images.
+    """
+    cities = comparison.load_maze_locations(cities_file)
+    city_names, exact_limit = city_tours.load_tour(city_tours.tour_parameter_file)
+    networks = comparison.load_networks()
+    comparison.route_images_dir.mkdir(parents=True, exist_ok=True)
+
+    for vehicle_type in comparison.vehicle_networks.keys():
+        tours = city_tours.CityTours(vehicle_type, cities, networks)
+
+        start_time = time.perf_counter()
+        tours.matrix(city_names)
+        matrix_runtime = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        tour = tours.tour(city_names, exact_limit)
+        tour_runtime = time.perf_counter() - start_time
+
+        hours, minutes = comparison.minutes_to_hours_and_minutes(tour["minutes"])
+        print(f" === Fastest {vehicle_type} round trip ({'exact' if tour['exact'] else '2-opt and Or-opt'}) ===")
+        print(f"{' - '.join(tour['cities'])}: {tour['distance']} km in {hours}h {minutes}min")
+        for leg in tour["legs"]:
+            print(f"    {leg['start_city']} - {leg['end_city']}: {leg['distance']} km / {leg['minutes']} min")
+        print(f"Matrix of {len(city_names)} cities in {matrix_runtime:.2f} s ({len(tours.built)} expansions, {len(city_names) - len(tours.built)} cached), tour and legs in {tour_runtime:.2f} s\n")
+
+        tour_file = comparison.route_images_dir.joinpath(f"{vehicle_type}-tour.png")
+        maze_plot.render_maze(network_graph.path_to_maze(tours.network.maze, tour["path"]), tour_file)
+
+    print(f"The tours were saved in {comparison.route_images_dir}")
+
+# function to convert an edited map again and update the mazes and their cached data only where the map changed
+def run_incremental_conversion():
+    """
+    Converts an edited map again like the image and the colored map converters, but only rewrites the tiles of the mazes which changed. The component labels, the distance fields and the cached route lengths of the parameter sweep are then updated for the changed cells instead of being rebuilt. It prompts the user for the path to the image and the shrinking factor, then prints the changes and the updates of each maze.
+
+    Raises:
+        ValueError: If the input shrinking factor is invalid or not greater than zero.
+    """
+    path_from_root = input("Please enter the Path to the edited map from the root folder: ")
+    shrinking_factor = input("Please enter the factor by which the image should be shrunken: ")
+
+    try:
+        shrinking_factor = float(shrinking_factor)
+        if shrinking_factor <= 0:
+            raise ValueError("Please enter a number >0!")
+    except:
+        raise ValueError("Please enter a valid shrinking factor!")
+
+    # the labels of the networks before the conversion, which are updated instead of labelling the converted networks again
+    networks = comparison.load_networks()
+    for maze in networks.values():
+        astar_lib.maze_components(maze)
+
+    start_time = time.perf_counter()
+    changes_list = incremental_conversion.convert_image(path_from_root, shrinking_factor)
+    for changes in changes_list:
+        height, width = changes.shape
+        tile_count = -(-height // changes.tile_size) * -(-width // changes.tile_size)
+        if changes.full_rewrite:
+            print(f"{changes.maze_file}: rewritten as a whole, its cached data is rebuilt on the next use")
+            continue
+        print(f"{changes.maze_file}: {len(changes.tiles)}/{tile_count} tiles rewritten, {changes.opened.size} cells opened, {changes.closed.size} cells closed")
+
+        labels = None
+        if changes.maze_file in networks:
+            labels = incremental_conversion.update_components(networks[changes.maze_file], astar_lib.load_maze(changes.maze_file), changes)
+        if labels is not None:
+            print(f"  {labels.max() + 1} components")
+
+        fields = distance_fields.repair_fields(changes)
+        if fields is not None:
+            print(f"  {len(fields['repaired'])} distance fields repaired, {len(fields['removed'])} removed")
+
+    routes = parameter_sweep.invalidate_route_lengths(changes_list)
+    runtime = time.perf_counter() - start_time
+    if routes is not None:
+        print(f"{routes[0]} cached city pairs kept, {routes[1]} searched again by the next parameter sweep")
+    print(f"Updated {len(changes_list)} mazes in {runtime:.2f} s")
+
 modes = [
     Mode("Maze Solver", "Find the Solution to A Maze defined in a csv file", run_maze_solver), 
     Mode("Train vs. Car Comparison", "Compare Path of Rail and Car Travel", run_rail_car_comparison), 
-    Mode("Load Maze from Image", "Convert a black and white image to a csv file", run_maze_converter)
+    Mode("Load Maze from Image", "Convert a black and white image to a csv file", run_maze_converter),
+    Mode("Render Route Images", "Render the rail and car routes of every city pair into image files", run_route_rendering),
+    Mode("Disruption Replanning", "Close sections of a network and repair the routes of all city pairs incrementally", run_disruption_replanning),
+    Mode("Network Vulnerability Scan", "Rank the segments of the rail and road networks by the impact of closing them", run_vulnerability_scan),
+    Mode("Route Query Service", "Answer route, compare and matrix queries over HTTP on localhost with warm networks", run_route_service),
+    Mode("Contraction Hierarchy Benchmark", "Build contraction hierarchies of the rail and road networks and compare their queries with A*", run_hierarchy_benchmark),
+    Mode("Alternative Routes", "Find meaningfully different alternative rail and car routes between two cities", run_alternative_routes),
+    Mode("Snap Cities to Networks", "Report the nearest network cell of every city which lies off a network", run_city_snapping),
+    Mode("Tiled Maze Solver", "Solve the maze defined in maze.json out-of-core with memory mapped tiles", run_tiled_maze_solver),
+    Mode("Pareto Routes", "Find the trips between two cities which are optimal in time, price and emissions over all vehicles", run_pareto_routes),
+    Mode("Parameter Sweep", "Compare train and car for all city pairs over a grid of speeds, distance scale factors and rates", run_parameter_sweep),
+    Mode("Bounded Search", "Compare the exact A* search with the anytime weighted search, its expansion budget and deadline", run_bounded_search),
+    Mode("Park and Ride", "Find the fastest itinerary combining car and train with transfers at the cities", run_multimodal_routes),
+    Mode("Time-Dependent Routes", "Find the fastest routes for several departure times with rush hour and night speed profiles", run_time_dependent_routes),
+    Mode("Timetable Routes", "Find the earliest train connection and the optimal departures of the day from the timetable", run_timetable_routes),
+    Mode("Search Replay", "Record the expansion order of the maze solver and render it as an animation", run_search_replay),
+    Mode("Batch Comparison", "Compare train and car for all city pairs in resumable shards and merge them into the result store", run_batch_comparison),
+    Mode("Load Networks from Colored Map", "Convert a colored map into the csv files of all its networks in one pass", run_palette_converter),
+    Mode("Isochrones", "Find the area and the cities reachable within an hour from every city on each network", run_isochrones),
+    Mode("City Tour", "Find the fastest rail and car round trip through the cities defined in tour.json", run_city_tours),
+    Mode("Incremental Map Update", "Convert an edited map again and update only the changed parts of the mazes and their cached data", run_incremental_conversion)
 ]
 
 if __name__ == '__main__':
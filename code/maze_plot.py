@@ -1,8 +1,16 @@
 # https://stackoverflow.com/questions/15908371/matplotlib-colorbars-and-its-text-labels
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
+from matplotlib.cm import ScalarMappable
 import matplotlib.colors as mcolors
 import numpy as np
+import hashlib
+import matplotlib
+from PIL import Image
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 from astar_lib import OBSTACLE, WALKABLE, BORDER, VISITED, SOL_PATH
 
@@ -23,6 +31,31 @@ norm = mcolors.BoundaryNorm(colorbar_vals, cMap.N)
 
 tick_count = 4
 
+# search replay parameters
+replay_cmap = "viridis"
+replay_path_color = (255, 0, 0)
+# milliseconds each frame of a replay is shown, the last frame with the path is held longer
+replay_frame_duration = 80
+replay_final_duration = 2000
+
+# offscreen rendering parameters
+# the file format is taken from the extension of the output file, e.g. .png or .svg
+render_dpi = 100
+
+# cache of the offscreen figures of each process, the network base layers are only rasterized once per figure
+# key: (network key of the left maze, network key of the right maze, resize factor)
+offscreen_figures = {}
+
+def label_colorbar(colorbar) -> None:
+    """
+    Writes the state labels into the fields of a horizontal colorbar.
+
+    Inputs:
+        colorbar: The colorbar to label.
+    """
+    for j, lab in enumerate(color_labels):
+        colorbar.ax.text(j * 10, .5, lab, ha='center', va='center')
+
 def calculate_swiss_map_ticks(maze_shape: tuple[int, int], resize_factor: int) -> tuple[np.ndarray, np.ndarray]:
     """
     Calculates the tick marks for the Swiss road and train maps based on the maze shape and a resize factor.
@@ -38,7 +71,7 @@ def calculate_swiss_map_ticks(maze_shape: tuple[int, int], resize_factor: int) -
     y_ticks = np.arange(0, maze_shape[0] + 1) * resize_factor
     return x_ticks, y_ticks
 
-def show_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str, maze2_title: str, resize_factor: int) -> None:
+def show_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str, maze2_title: str, resize_factor: int, output_file: Path | str | None = None) -> None:
     """
     Displays a side-by-side comparison of two mazes with titles and customized tick marks.
 
@@ -48,7 +81,12 @@ def show_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str,
         maze1_title: The title for the first maze.
         maze2_title: The title for the second maze.
         resize_factor: The factor by which the maze dimensions are scaled.
+        output_file: If given, the comparison is rendered offscreen into this file (e.g. .png or .svg) instead of being shown.
     """
+    if output_file is not None:
+        render_maze_comparison(maze1, maze2, maze1_title, maze2_title, resize_factor, output_file)
+        return
+
     fig, axs = plt.subplots(1, 2, figsize=fig_size)
 
     axs[0].set_title(maze1_title)
@@ -69,10 +107,8 @@ def show_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str,
     cbar_pos = [pos1.x0, 0.05, pos2.x1 - pos1.x0, 0.03]
     cbar_ax = fig.add_axes(cbar_pos)
     colorbar = fig.colorbar(mesh1, cax=cbar_ax, orientation='horizontal', ticks=[])
+    label_colorbar(colorbar)
 
-    for j, lab in enumerate(color_labels):
-        colorbar.ax.text(j * 10, .5, lab, ha='center', va='center')
-        
     # print(x_ticks, y_ticks)
     
     # invert y axis to show plot in the same way it is stored in the csv file
@@ -84,22 +120,296 @@ def show_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str,
 
     plt.show()
 
-def show_maze(maze: np.ndarray) -> None:
+def show_maze(maze: np.ndarray, output_file: Path | str | None = None) -> None:
     """
     Displays a single maze with a colorbar indicating different states.
 
     Inputs:
         maze: The maze array to display.
+        output_file: If given, the maze is rendered offscreen into this file (e.g. .png or .svg) instead of being shown.
     """
+    if output_file is not None:
+        render_maze(maze, output_file)
+        return
+
     fig, ax = plt.subplots(1)
     mesh = ax.pcolormesh(maze, cmap=cMap, norm=norm)
 
     colorbar = fig.colorbar(mesh, ticks=[], orientation="horizontal")
+    label_colorbar(colorbar)
 
-    for j, lab in enumerate(color_labels):
-        colorbar.ax.text(j * 10, .5, lab, ha='center', va='center')
-    
     # invert y axis to show plot in the same way it is stored in the csv file
     fig.gca().invert_yaxis()
     fig.gca().set_aspect('equal')
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+def show_heatmap(heatmap: np.ndarray, maze: np.ndarray, title: str, colorbar_label: str, resize_factor: float, output_file: Path | str | None = None) -> None:
+    """
+    Displays a heatmap of values per cell on top of a network, e.g. the added minutes of closing each segment.
+    Cells with the value 0 are shown as part of the network, infinite cells are shown in black and NaN cells are not shown.
+
+    Inputs:
+        heatmap: The float array of the values of each cell.
+        maze: The maze array of the network.
+        title: The title of the plot.
+        colorbar_label: The label of the colorbar.
+        resize_factor: The factor by which the maze dimensions are scaled.
+        output_file: If given, the heatmap is rendered offscreen into this file (e.g. .png or .svg) instead of being shown.
+    """
+    fig = Figure(figsize=fig_size) if output_file is not None else plt.figure(figsize=fig_size)
+    ax = fig.subplots(1)
+
+    x_ticks, y_ticks = calculate_swiss_map_ticks(maze.shape, resize_factor)
+    ax.pcolormesh(x_ticks, y_ticks, np.where(maze != OBSTACLE, 1.0, np.nan), cmap=ListedColormap(['lightgrey']))
+    finite_values = heatmap[np.isfinite(heatmap)]
+    heat_cmap = plt.get_cmap('hot_r').with_extremes(over='black')
+    heat_norm = mcolors.Normalize(0, max(finite_values.max(initial=0), 1))
+    # infinite values would be masked, therefore they are replaced by a value above the maximum of the norm
+    shown_heatmap = np.where(np.isinf(heatmap), 2 * heat_norm.vmax, heatmap)
+    mesh = ax.pcolormesh(x_ticks, y_ticks, np.ma.masked_where(~(shown_heatmap > 0), shown_heatmap), cmap=heat_cmap, norm=heat_norm)
+
+    colorbar = fig.colorbar(mesh, ax=ax, extend='max')
+    colorbar.set_label(colorbar_label)
+
+    ax.set_title(title)
+    ax.set_xlabel('x coordinate [km]')
+    ax.set_ylabel('y coordinate [km]')
+    ax.invert_yaxis()
+    ax.set_aspect('equal')
+
+    if output_file is not None:
+        fig.savefig(output_file, dpi=render_dpi)
+    else:
+        plt.show()
+
+""" offscreen rendering """
+
+def network_key(maze: np.ndarray) -> str:
+    """
+    Identifies the network a (solved) maze belongs to, independent of the route drawn into it.
+
+    Inputs:
+        maze: The maze array, solved or unsolved.
+
+    Outputs:
+        _: A hash of the walkable cells of the maze.
+    """
+    walkable = np.ascontiguousarray(maze != OBSTACLE)
+    return hashlib.sha1(walkable.tobytes() + str(maze.shape).encode()).hexdigest()
+
+def rasterize_states(maze: np.ndarray) -> np.ndarray:
+    """
+    Converts the states of a maze to an RGBA image using the same colormap and norm as the interactive plots.
+
+    Inputs:
+        maze: The maze array to convert.
+
+    Outputs:
+        _: A float RGBA image of shape (y, x, 4).
+    """
+    return cMap(norm(maze))
+
+def network_base_layer(maze: np.ndarray) -> np.ndarray:
+    """
+    Rasterizes the base layer of a network, where every walkable state is shown as walkable.
+
+    Inputs:
+        maze: The maze array, solved or unsolved.
+
+    Outputs:
+        _: A float RGBA image of shape (y, x, 4).
+    """
+    return rasterize_states((maze != OBSTACLE) * WALKABLE)
+
+def route_overlay(maze: np.ndarray) -> np.ndarray:
+    """
+    Rasterizes only the states written by the algorithm (border, visited and solution), everything else stays transparent.
+
+    Inputs:
+        maze: The solved maze array.
+
+    Outputs:
+        _: A float RGBA image of shape (y, x, 4).
+    """
+    overlay = rasterize_states(maze)
+    overlay[(maze == OBSTACLE) | (maze == WALKABLE) | np.isnan(maze), 3] = 0
+    return overlay
+
+class OffscreenComparison():
+    """
+    An offscreen (Agg) figure comparing two mazes side by side, which looks like the figure of show_maze_comparison.
+    The network base layers and the colorbar are drawn once, rendering a route only replaces the overlay images.
+
+    Attributes:
+        fig (Figure): The figure, which is not attached to any GUI backend.
+        axs (np.ndarray): The two axes of the figure.
+        overlays (list): The overlay images of the left and right axes.
+
+    Methods:
+        __init__: Initializes the figure and draws the base layers.
+        render: Draws the routes of two solved mazes and saves the figure.
+    """
+    def __init__(self, maze1: np.ndarray, maze2: np.ndarray, resize_factor: float) -> None:
+        """
+        Initializes a new OffscreenComparison instance.
+
+        Inputs:
+            maze1: A maze array of the left network.
+            maze2: A maze array of the right network.
+            resize_factor: The factor by which the maze dimensions are scaled.
+        """
+        self.fig = Figure(figsize=fig_size)
+        self.axs = self.fig.subplots(1, 2)
+
+        # same extent as the ticks of calculate_swiss_map_ticks, top and bottom swapped to invert the y axis
+        extent = (0, maze1.shape[1] * resize_factor, maze1.shape[0] * resize_factor, 0)
+        self.overlays = []
+
+        for ax, maze in zip(self.axs, (maze1, maze2)):
+            ax.imshow(network_base_layer(maze), extent=extent, interpolation='nearest')
+            empty = np.zeros(maze.shape + (4,))
+            self.overlays.append(ax.imshow(empty, extent=extent, interpolation='nearest'))
+            ax.set_xlabel('x coordinate [km]')
+            ax.set_ylabel('y coordinate [km]')
+            ax.set_aspect('equal')
+
+        self.fig.subplots_adjust(bottom=0.08)
+
+        pos1 = self.axs[0].get_position()
+        pos2 = self.axs[1].get_position()
+        cbar_ax = self.fig.add_axes([pos1.x0, 0.05, pos2.x1 - pos1.x0, 0.03])
+        colorbar = self.fig.colorbar(ScalarMappable(norm=norm, cmap=cMap), cax=cbar_ax, orientation='horizontal', ticks=[])
+        label_colorbar(colorbar)
+
+    def render(self, maze1: np.ndarray, maze2: np.ndarray, maze1_title: str, maze2_title: str, output_file: Path | str) -> None:
+        """
+        Draws the routes of two solved mazes on top of the cached base layers and saves the figure.
+
+        Inputs:
+            maze1: The solved maze of the left network.
+            maze2: The solved maze of the right network.
+            maze1_title: The title for the first maze.
+            maze2_title: The title for the second maze.
+            output_file: The file to save the figure to, the format is defined by its extension.
+        """
+        for ax, overlay, maze, title in zip(self.axs, self.overlays, (maze1, maze2), (maze1_title, maze2_title)):
+            overlay.set_data(route_overlay(maze))
+            ax.set_title(title)
+
+        self.fig.savefig(output_file, dpi=render_dpi)
+
+def render_maze_comparison(maze1: np.ndarray, maze2: np.ndarray, maze1_title: str, maze2_title: str, resize_factor: float, output_file: Path | str) -> None:
+    """
+    Renders a side-by-side comparison of two solved mazes offscreen into a file.
+    The figure of each combination of networks is cached in this process, so only the routes get drawn again.
+
+    Inputs:
+        maze1: The first solved maze.
+        maze2: The second solved maze.
+        maze1_title: The title for the first maze.
+        maze2_title: The title for the second maze.
+        resize_factor: The factor by which the maze dimensions are scaled.
+        output_file: The file to save the figure to, the format is defined by its extension.
+    """
+    key = (network_key(maze1), network_key(maze2), resize_factor)
+
+    if key not in offscreen_figures:
+        offscreen_figures[key] = OffscreenComparison(maze1, maze2, resize_factor)
+
+    offscreen_figures[key].render(maze1, maze2, maze1_title, maze2_title, output_file)
+
+def render_maze(maze: np.ndarray, output_file: Path | str) -> None:
+    """
+    Renders a single maze with a colorbar offscreen into a file.
+
+    Inputs:
+        maze: The maze array to render.
+        output_file: The file to save the figure to, the format is defined by its extension.
+    """
+    fig = Figure()
+    ax = fig.subplots(1)
+    ax.imshow(network_base_layer(maze), interpolation='nearest')
+    ax.imshow(route_overlay(maze), interpolation='nearest')
+
+    colorbar = fig.colorbar(ScalarMappable(norm=norm, cmap=cMap), ax=ax, ticks=[], orientation="horizontal")
+    label_colorbar(colorbar)
+
+    ax.set_aspect('equal')
+    fig.savefig(output_file, dpi=render_dpi)
+
+def render_comparison_job(job: tuple) -> str:
+    """
+    Renders one comparison job, used by the worker processes of render_comparisons.
+
+    Inputs:
+        job: A tuple (maze1, maze2, maze1_title, maze2_title, resize_factor, output_file).
+
+    Outputs:
+        _: The output file as a string.
+    """
+    render_maze_comparison(*job)
+    return str(job[-1])
+
+def render_comparisons(jobs: list[tuple], workers: int | None = None) -> list[str]:
+    """
+    Renders a batch of comparisons offscreen in a process pool.
+    Each worker keeps its own figure cache, therefore the base layers are rasterized once per worker and network combination.
+
+    Inputs:
+        jobs: A list of tuples (maze1, maze2, maze1_title, maze2_title, resize_factor, output_file).
+        workers: The number of worker processes. Defaults to the number of CPUs.
+
+    Outputs:
+        _: The list of the written files.
+    """
+    # jobs with the same networks are handed out together to profit from the cached figures
+    jobs = sorted(jobs, key=lambda job: (network_key(job[0]), network_key(job[1])))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_comparison_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or 4)))))
+
+""" search replay """
+
+def render_search_replay(maze: np.ndarray, expansions: np.ndarray, output_file: Path | str, frame_count: int = 60, scale: int = 3, solved_maze: np.ndarray | None = None) -> int:
+    """
+    Renders the expansion order of a search as an animated image, e.g. a GIF.
+    The frames are built incrementally from the trace: each frame only colors the cells expanded since the previous frame, by their F costs from dark (low) to bright (high), on top of the network.
+
+    Inputs:
+        maze: The maze array of the searched network.
+        expansions: The recorded expansions as returned by astar_lib.SearchTrace.expansions, the flat index and F costs of each expanded cell.
+        output_file: The file to save the animation to, the format is defined by its extension.
+        frame_count: The number of frames showing the expansions.
+        scale: The number of pixels per cell.
+        solved_maze: The optional solved maze, its path is drawn on an additional last frame.
+
+    Outputs:
+        _: The number of frames written.
+    """
+    canvas = (network_base_layer(maze)[..., :3] * 255).astype(np.uint8)
+    pixels = canvas.reshape(-1, 3)
+    cells, f_costs = expansions[:, 0], expansions[:, 1]
+
+    # the start is expanded with F costs 0, it would stretch the color range
+    costs = f_costs[f_costs > 0]
+    low, high = (costs.min(), costs.max()) if costs.size else (0, 1)
+    colors = (matplotlib.colormaps[replay_cmap](np.clip((f_costs - low) / max(high - low, 1), 0, 1))[:, :3] * 255).astype(np.uint8)
+
+    def frame() -> Image.Image:
+        return Image.fromarray(np.repeat(np.repeat(canvas, scale, axis=0), scale, axis=1))
+
+    frames = []
+    bounds = np.linspace(0, len(cells), frame_count + 1).astype(int)
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        pixels[cells[first:last]] = colors[first:last]
+        frames.append(frame())
+
+    if solved_maze is not None:
+        pixels[np.flatnonzero(solved_maze == SOL_PATH)] = replay_path_color
+        frames.append(frame())
+
+    durations = [replay_frame_duration] * len(frames)
+    durations[-1] = replay_final_duration
+    # https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html#saving
+    frames[0].save(output_file, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+    return len(frames)
@@ -0,0 +1,205 @@
+import heapq
+import numpy as np
+
+import alternative_routes
+import network_graph
+import network_snapping
+import network_vulnerability
+import parameters
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST, PRECISION_FACTOR
+from parameters import NodePos, params_dir
+
+# parameter file name
+multimodal_parameter_file = "multimodal.json"
+# key of the transfer penalties in the parameter file, {from vehicle type: {to vehicle type: minutes}}
+transfer_minutes_name = "transfer_minutes"
+
+# minutes to change from one vehicle type to another at a transfer city, e.g. parking the car and walking to the platform
+default_transfer_minutes = {
+    "car": {"train": 5},
+    "train": {"car": 5}
+}
+
+class MultimodalNetwork():
+    """
+    A layered graph with one layer per vehicle type, each layer is the slow network of the vehicle type with the pace of its fast network.
+    The layers are connected at the transfer cities, where changing from one layer to another costs the transfer penalty, so a single search finds the fastest itinerary over all combinations of vehicle types and transfer cities.
+    A state of the search is the flat index of a cell plus the layer number times the number of cells.
+
+    Attributes:
+        layers (list): The vehicle types of the layers.
+        networks (dict): The VulnerableNetwork of each vehicle type.
+        size (int): The number of cells of a layer.
+        city_cells (dict): The snapped cell of each city in each layer, {city name: {vehicle type: flat index}}. Cities too far away from a network are missing in its layer.
+        transfers (dict): The transfer edges of each state, {state: [(state, minutes)]}.
+
+    Methods:
+        __init__: Loads the layers and connects them at the transfer cities.
+        itinerary: Finds the fastest itinerary between two cities.
+    """
+    def __init__(self, cities: dict[str, NodePos], transfer_minutes: dict[str, dict[str, float]] = default_transfer_minutes, networks: dict[str, np.ndarray] | None = None) -> None:
+        """
+        Initializes a new MultimodalNetwork instance.
+
+        Inputs:
+            cities: The cities, every city except the measurement nodes is a transfer city.
+            transfer_minutes: The minutes to change between two vehicle types, {from vehicle type: {to vehicle type: minutes}}. Changes which are not listed are not possible.
+            networks: Optional networks already loaded with comparison.load_networks.
+        """
+        self.layers = list(comparison.vehicle_networks.keys())
+        self.networks = {vehicle_type: network_vulnerability.VulnerableNetwork(vehicle_type, networks) for vehicle_type in self.layers}
+        shapes = {network.maze.shape for network in self.networks.values()}
+        if len(shapes) != 1:
+            raise ValueError("The networks of all vehicle types need the same shape to be layered!")
+        self.size = self.networks[self.layers[0]].maze.size
+
+        self.city_cells = {}
+        for name, pos in cities.items():
+            if name.startswith(comparison.measurement_node_prefix):
+                continue
+            self.city_cells[name] = {}
+            for vehicle_type, network in self.networks.items():
+                snapped_pos, distance = network_snapping.index_for(network.maze, comparison.vehicle_networks[vehicle_type][0]).snap(pos)
+                if distance <= network_snapping.max_snap_distance:
+                    self.city_cells[name][vehicle_type] = network_graph.cell_index(snapped_pos.x, snapped_pos.y, network.maze.shape)
+
+        self.transfers = {}
+        for cells in self.city_cells.values():
+            for from_type, to_types in transfer_minutes.items():
+                for to_type, minutes in to_types.items():
+                    if from_type in cells and to_type in cells:
+                        self.transfers.setdefault(self.state(from_type, cells[from_type]), []).append((self.state(to_type, cells[to_type]), minutes))
+
+    def state(self, vehicle_type: str, cell: int) -> int:
+        """
+        Calculates the state of a cell in a layer.
+
+        Inputs:
+            vehicle_type: The vehicle type of the layer.
+            cell: The flat index of the cell.
+
+        Outputs:
+            _: The state in the layered graph.
+        """
+        return self.layers.index(vehicle_type) * self.size + cell
+
+    def search(self, starts: list[int], ends: list[int], transfers: dict[int, list[tuple[int, float]]]) -> tuple[float, list[int]]:
+        """
+        Finds the fastest path from any start state to any end state with A* on the layered graph.
+        The heuristic is the octile distance to the nearest end cell times the smallest pace of all layers, which never overestimates.
+
+        Inputs:
+            starts: The start states.
+            ends: The end states.
+            transfers: The transfer edges which may be used, like the transfers attribute.
+
+        Outputs:
+            minutes, states: The travel time in minutes including the transfer penalties (infinite if no path exists) and the states from start to end.
+        """
+        width = self.networks[self.layers[0]].maze.shape[1]
+        paces = [network.pace.tolist() for network in self.networks.values()]
+        adjacencies = [network.adjacency for network in self.networks.values()]
+        heuristic_weight = min(float(network.pace.min()) for network in self.networks.values())
+        end_cells = {end % self.size for end in ends}
+        ends = set(ends)
+
+        def heuristic(cell: int) -> float:
+            return min(network_graph.octile_cost(cell, end_cell, width) for end_cell in end_cells) * heuristic_weight
+
+        g_costs = {start: 0 for start in starts}
+        parents = {start: -1 for start in starts}
+        visited = set()
+        border = [(heuristic(start % self.size), 0, start) for start in starts]
+        heapq.heapify(border)
+
+        while border:
+            _, g_cost, state = heapq.heappop(border)
+            if state in visited:
+                continue
+            if state in ends:
+                return g_cost / PRECISION_FACTOR, network_graph.trace_parents(parents, state)
+            visited.add(state)
+
+            layer, cell = divmod(state, self.size)
+            pace = paces[layer]
+            edges = [(layer * self.size + neighbor, step_cost * (pace[cell] + pace[neighbor]) / 2) for neighbor, step_cost in adjacencies[layer][cell]]
+            edges += [(other, minutes * PRECISION_FACTOR) for other, minutes in transfers.get(state, [])]
+
+            for neighbor, edge_cost in edges:
+                new_cost = g_cost + edge_cost
+                if new_cost < g_costs.get(neighbor, INFINITE_COST):
+                    g_costs[neighbor] = new_cost
+                    parents[neighbor] = state
+                    heapq.heappush(border, (new_cost + heuristic(neighbor % self.size), new_cost, neighbor))
+
+        return float("inf"), []
+
+    def itinerary(self, start_name: str, end_name: str, vehicle_types: list[str] | None = None) -> dict:
+        """
+        Finds the fastest itinerary between two cities, which may change the vehicle type at any transfer city.
+
+        Inputs:
+            start_name: The name of the start city.
+            end_name: The name of the end city.
+            vehicle_types: The vehicle types which may be used, all layers if None. A single vehicle type gives the fastest trip without transfers.
+
+        Outputs:
+            _: A dictionary with the total minutes (including the transfers), the distance in km, the legs and the transfers. Each leg is a route dictionary as returned by alternative_routes.route_details with the vehicle type and its start and end city, each transfer a dictionary with the city, both vehicle types and the minutes.
+
+        Raises:
+            Exception: If no itinerary exists with the given vehicle types.
+        """
+        vehicle_types = vehicle_types or self.layers
+        starts = [self.state(vehicle_type, cell) for vehicle_type, cell in comparison.check_destination(start_name, self.city_cells).items() if vehicle_type in vehicle_types]
+        ends = [self.state(vehicle_type, cell) for vehicle_type, cell in comparison.check_destination(end_name, self.city_cells).items() if vehicle_type in vehicle_types]
+
+        # transfers to excluded vehicle types are skipped
+        allowed_transfers = {state: [(other, minutes) for other, minutes in edges if self.layers[other // self.size] in vehicle_types] for state, edges in self.transfers.items()}
+        minutes, states = self.search(starts, ends, allowed_transfers)
+
+        if not states:
+            raise Exception("No valid path found!")
+
+        # the name of the city of each transfer state
+        cities_of_states = {self.state(vehicle_type, cell): name for name, cells in self.city_cells.items() for vehicle_type, cell in cells.items()}
+
+        legs = []
+        transfers = []
+        leg_start = 0
+        for i in range(1, len(states) + 1):
+            if i < len(states) and states[i] // self.size == states[i - 1] // self.size:
+                continue
+
+            vehicle_type = self.layers[states[leg_start] // self.size]
+            path = [state % self.size for state in states[leg_start:i]]
+            leg = alternative_routes.route_details(self.networks[vehicle_type], vehicle_type, path)
+            leg.update(vehicle_type=vehicle_type, start_city=cities_of_states.get(states[leg_start], start_name), end_city=cities_of_states.get(states[i - 1], end_name))
+            legs.append(leg)
+
+            if i < len(states):
+                to_type = self.layers[states[i] // self.size]
+                transfer_minutes = dict(allowed_transfers[states[i - 1]])[states[i]]
+                transfers.append({"city": leg["end_city"], "from": vehicle_type, "to": to_type, "minutes": transfer_minutes})
+            leg_start = i
+
+        return {
+            "minutes": round(minutes),
+            "distance": sum(leg["distance"] for leg in legs),
+            "legs": legs,
+            "transfers": transfers
+        }
+
+def load_transfer_minutes(filename: str) -> dict[str, dict[str, float]]:
+    """
+    Loads the transfer penalties from a JSON file.
+
+    Inputs:
+        filename: The name of the parameter file.
+
+    Outputs:
+        _: The minutes to change between two vehicle types, {from vehicle type: {to vehicle type: minutes}}, the default penalties if the file does not define them.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+    return params.get(transfer_minutes_name, default_transfer_minutes)
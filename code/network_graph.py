@@ -0,0 +1,471 @@
+import heapq
+import numpy as np
+
+from math import sqrt
+from astar_lib import OBSTACLE, SOL_PATH
+
+# the same integer costs as used by the A* algorithm written in C
+# log10(PRECISION_FACTOR) = how many digits after the comma get preserved
+PRECISION_FACTOR = 10
+STRAIGHT_COST = PRECISION_FACTOR
+DIAGONAL_COST = int(sqrt(2) * PRECISION_FACTOR)
+
+# cost of an unreachable node
+INFINITE_COST = np.iinfo(np.int32).max
+
+# the 8 neighbors of a node as (y offset, x offset, cost)
+NEIGHBOR_STEPS = [(dy, dx, DIAGONAL_COST if dy and dx else STRAIGHT_COST) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+
+""" grid helpers """
+
+def cell_index(x: int, y: int, shape: tuple[int, int]) -> int:
+    """
+    Calculates the index of a cell in the flattened maze.
+
+    Inputs:
+        x: The x-coordinate of the cell.
+        y: The y-coordinate of the cell.
+        shape: The shape of the maze (height, width).
+
+    Outputs:
+        _: The flat index of the cell.
+    """
+    return y * shape[1] + x
+
+def cell_position(idx: int, shape: tuple[int, int]) -> tuple[int, int]:
+    """
+    Calculates the coordinates of a cell from its flat index.
+
+    Inputs:
+        idx: The flat index of the cell.
+        shape: The shape of the maze (height, width).
+
+    Outputs:
+        x, y: The coordinates of the cell.
+    """
+    y, x = divmod(idx, shape[1])
+    return x, y
+
+def walkable_mask(maze: np.ndarray) -> np.ndarray:
+    """
+    Converts a maze to a boolean mask of its walkable cells.
+
+    Inputs:
+        maze: The maze array, where obstacles are 0.
+
+    Outputs:
+        _: A boolean array, True where the cell is walkable.
+    """
+    return np.asarray(maze) != OBSTACLE
+
+def grid_neighbors(idx: int, shape: tuple[int, int]):
+    """
+    Iterates over the cells around a cell which lie inside of the maze, regardless of their walkability.
+
+    Inputs:
+        idx: The flat index of the cell.
+        shape: The shape of the maze (height, width).
+
+    Outputs:
+        _: A generator yielding (flat index, cost) of each neighbor.
+    """
+    y, x = divmod(idx, shape[1])
+    for dy, dx, cost in NEIGHBOR_STEPS:
+        ny, nx = y + dy, x + dx
+        if 0 <= ny < shape[0] and 0 <= nx < shape[1]:
+            yield ny * shape[1] + nx, cost
+
+def build_adjacency(walkable: np.ndarray) -> list[list[tuple[int, int]]]:
+    """
+    Builds the adjacency list of the 8-connected graph of the walkable cells.
+
+    Inputs:
+        walkable: A boolean array of the walkable cells.
+
+    Outputs:
+        adjacency: A list with an entry for each flat index, containing the (neighbor index, cost) tuples. Obstacles have no neighbors.
+    """
+    shape = walkable.shape
+    flat = walkable.ravel()
+    adjacency = [[] for _ in range(flat.size)]
+
+    for idx in np.flatnonzero(flat).tolist():
+        adjacency[idx] = [(n, cost) for n, cost in grid_neighbors(idx, shape) if flat[n]]
+
+    return adjacency
+
+def octile_cost(a: int, b: int, width: int) -> int:
+    """
+    Calculates the cost of the cheapest path between two cells when there are no obstacles.
+    It never overestimates and is consistent with the step costs, therefore it is a good heuristic for exact searches.
+
+    Inputs:
+        a: The flat index of the first cell.
+        b: The flat index of the second cell.
+        width: The width of the maze.
+
+    Outputs:
+        _: The octile distance with the integer step costs.
+    """
+    ay, ax = divmod(a, width)
+    by, bx = divmod(b, width)
+    dx = abs(ax - bx)
+    dy = abs(ay - by)
+    return STRAIGHT_COST * max(dx, dy) + (DIAGONAL_COST - STRAIGHT_COST) * min(dx, dy)
+
+def build_csr_adjacency(walkable: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds the adjacency of the 8-connected graph of the walkable cells as compressed sparse row arrays, which can be shared between processes unlike the lists of build_adjacency.
+    The neighbors of each cell are in the same order as in build_adjacency.
+
+    Inputs:
+        walkable: A boolean array of the walkable cells.
+
+    Outputs:
+        indptr, indices, costs: int32 arrays, the neighbors of cell i are indices[indptr[i]:indptr[i + 1]] with the costs at the same positions.
+    """
+    height, width = walkable.shape
+    flat = walkable.ravel()
+    cells = np.arange(flat.size).reshape(walkable.shape)
+
+    sources, targets, costs = [], [], []
+    for dy, dx, cost in NEIGHBOR_STEPS:
+        # the cells whose neighbor at this offset lies inside of the maze
+        source = cells[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)].ravel()
+        target = source + dy * width + dx
+        valid = flat[source] & flat[target]
+        sources.append(source[valid])
+        targets.append(target[valid])
+        costs.append(np.full(np.count_nonzero(valid), cost))
+
+    sources = np.concatenate(sources)
+    # a stable sort keeps the order of NEIGHBOR_STEPS within each cell
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(flat.size + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=flat.size))
+    return indptr, np.concatenate(targets)[order].astype(np.int32), np.concatenate(costs)[order].astype(np.int32)
+
+class CsrAdjacency():
+    """
+    An adjacency read from compressed sparse row arrays, e.g. attached from shared memory, which every search accepts in place of the lists of build_adjacency.
+    Indexing a cell yields its (neighbor index, cost) tuples, the arrays are read through memoryviews, which slice faster than numpy arrays and return Python integers.
+
+    Attributes:
+        indptr (memoryview): The start of the neighbors of each cell, with the end of the last cell appended.
+        indices (memoryview): The neighbors of all cells.
+        costs (memoryview): The step cost to each neighbor.
+
+    Methods:
+        __init__: Wraps the arrays.
+        __getitem__: Returns the neighbors of a cell.
+        __len__: Returns the number of cells.
+    """
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, costs: np.ndarray) -> None:
+        """
+        Initializes a new CsrAdjacency instance without copying the arrays.
+
+        Inputs:
+            indptr, indices, costs: The int32 arrays as returned by build_csr_adjacency.
+        """
+        self.indptr = memoryview(indptr)
+        self.indices = memoryview(indices)
+        self.costs = memoryview(costs)
+
+    def __getitem__(self, idx: int):
+        """
+        Returns the neighbors of a cell.
+
+        Inputs:
+            idx: The flat index of the cell.
+
+        Outputs:
+            _: An iterator over the (neighbor index, cost) tuples, obstacles have no neighbors.
+        """
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        return zip(self.indices[start:end].tolist(), self.costs[start:end].tolist())
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+def cost_to_distance(cost: int) -> float:
+    """
+    Converts an integer path cost to the distance in maze units, like the distance returned by py_run_astar.
+
+    Inputs:
+        cost: The integer cost.
+
+    Outputs:
+        _: The distance in maze units.
+    """
+    return cost / PRECISION_FACTOR
+
+""" searches """
+
+def shortest_path(adjacency: list[list[tuple[int, int]]], start: int, end: int, width: int, cell_weights: np.ndarray | None = None, closed: np.ndarray | None = None) -> tuple[float, list[int]]:
+    """
+    Finds the exact shortest path between two cells using A* with the octile heuristic.
+
+    Inputs:
+        adjacency: The adjacency list of the network.
+        start: The flat index of the start cell.
+        end: The flat index of the end cell.
+        width: The width of the maze.
+        cell_weights: Optional flat array of weights per cell, e.g. minutes per maze unit. A step costs its length times the mean weight of both cells.
+        closed: Optional flat boolean array of closed cells, which cannot be passed.
+
+    Outputs:
+        cost, path: The cost of the path and the flat indices from start to end. INFINITE_COST and an empty list if no path exists.
+    """
+    # the heuristic has to be scaled by the smallest weight to stay admissible
+    heuristic_weight = 1 if cell_weights is None else float(np.min(cell_weights))
+    weights = None if cell_weights is None else cell_weights.tolist()
+
+    g_costs = {start: 0}
+    parents = {start: -1}
+    visited = set()
+    border = [(octile_cost(start, end, width) * heuristic_weight, 0, start)]
+
+    while border:
+        _, g_cost, node = heapq.heappop(border)
+        if node in visited:
+            continue
+        if node == end:
+            return g_cost, trace_parents(parents, end)
+        visited.add(node)
+
+        for neighbor, step_cost in adjacency[node]:
+            if closed is not None and closed[neighbor]:
+                continue
+            new_cost = g_cost + (step_cost if weights is None else step_cost * (weights[node] + weights[neighbor]) / 2)
+            if new_cost < g_costs.get(neighbor, INFINITE_COST):
+                g_costs[neighbor] = new_cost
+                parents[neighbor] = node
+                heapq.heappush(border, (new_cost + octile_cost(neighbor, end, width) * heuristic_weight, new_cost, neighbor))
+
+    return INFINITE_COST, []
+
+def distance_field(adjacency: list[list[tuple[int, int]]], source: int, max_cost: int = INFINITE_COST, cell_weights: np.ndarray | None = None) -> np.ndarray:
+    """
+    Calculates the exact cost from one cell to every cell of the network with Dijkstra's algorithm.
+    With a maximum cost the expansion stops at the cells costing more, e.g. for an isochrone.
+
+    Inputs:
+        adjacency: The adjacency list of the network.
+        source: The flat index of the source cell.
+        max_cost: The highest cost of a cell still reached.
+        cell_weights: Optional flat array of weights per cell, e.g. minutes per maze unit. A step costs its length times the mean weight of both cells, like in shortest_path.
+
+    Outputs:
+        costs: A flat int64 array (float64 with cell weights) with the cost of each cell, INFINITE_COST for unreachable cells, cells costing more than max_cost and obstacles.
+    """
+    weights = None if cell_weights is None else cell_weights.tolist()
+    costs = [INFINITE_COST] * len(adjacency)
+    costs[source] = 0
+    border = [(0, source)]
+
+    while border:
+        cost, node = heapq.heappop(border)
+        if cost > costs[node]:
+            continue
+        for neighbor, step_cost in adjacency[node]:
+            new_cost = cost + (step_cost if weights is None else step_cost * (weights[node] + weights[neighbor]) / 2)
+            if new_cost < costs[neighbor] and new_cost <= max_cost:
+                costs[neighbor] = new_cost
+                heapq.heappush(border, (new_cost, neighbor))
+
+    return np.array(costs, dtype=np.int64 if weights is None else np.float64)
+
+def repair_field(adjacency: list[list[tuple[int, int]]], shape: tuple[int, int], costs: np.ndarray, source: int, opened: list[int], closed: list[int]) -> np.ndarray:
+    """
+    Updates an exact distance field after cells of the network were opened or closed, without expanding the whole network again.
+    Closing cells can only raise costs: the cells whose every shortest path led through a closed cell are found in the order of their old cost, starting at the neighbors of the closed cells, and reset.
+    Opening cells can only lower costs: the reset and the opened cells are seeded from their neighbors with a valid cost, and Dijkstra's algorithm spreads the new costs from there, also into the rest of the field where they are lower.
+
+    Inputs:
+        adjacency: The adjacency list of the changed network.
+        shape: The shape of the maze.
+        costs: The flat int64 distance field of the source before the change, as returned by distance_field.
+        source: The flat index of the source cell, it has to stay walkable.
+        opened: The flat indices of the cells which became walkable.
+        closed: The flat indices of the cells which became obstacles.
+
+    Outputs:
+        costs: The distance field of the changed network, equal to distance_field(adjacency, source).
+    """
+    costs = costs.tolist()
+    invalid = set(closed)
+    for cell in closed:
+        costs[cell] = INFINITE_COST
+
+    # the cells whose parent in the shortest path tree might have been closed, in the order of their old cost
+    border = [(costs[neighbor], neighbor) for cell in closed for neighbor, _ in grid_neighbors(cell, shape)]
+    heapq.heapify(border)
+    while border:
+        cost, cell = heapq.heappop(border)
+        if cell in invalid or cell == source or cost >= INFINITE_COST:
+            continue
+        # a cell keeps its cost if a valid neighbor still leads to it with that cost
+        if any(neighbor not in invalid and costs[neighbor] + step_cost == cost for neighbor, step_cost in adjacency[cell]):
+            continue
+        invalid.add(cell)
+        for neighbor, _ in adjacency[cell]:
+            if costs[neighbor] > cost:
+                heapq.heappush(border, (costs[neighbor], neighbor))
+
+    seeds = list(invalid) + list(opened)
+    for cell in seeds:
+        costs[cell] = INFINITE_COST
+    for cell in seeds:
+        costs[cell] = min([costs[neighbor] + step_cost for neighbor, step_cost in adjacency[cell] if costs[neighbor] < INFINITE_COST], default=INFINITE_COST)
+
+    border = [(costs[cell], cell) for cell in seeds if costs[cell] < INFINITE_COST]
+    heapq.heapify(border)
+    while border:
+        cost, node = heapq.heappop(border)
+        if cost > costs[node]:
+            continue
+        for neighbor, step_cost in adjacency[node]:
+            new_cost = cost + step_cost
+            if new_cost < costs[neighbor]:
+                costs[neighbor] = new_cost
+                heapq.heappush(border, (new_cost, neighbor))
+
+    return np.array(costs, dtype=np.int64)
+
+def descend_field(adjacency: list[list[tuple[int, int]]], costs: np.ndarray, target: int) -> list[int]:
+    """
+    Recovers a shortest path by descending an exact distance field from a target cell back to its source.
+    Each step moves to a neighbor whose cost plus the step cost equals the cost of the current cell.
+
+    Inputs:
+        adjacency: The adjacency list of the network.
+        costs: The flat distance field as returned by distance_field.
+        target: The flat index of the target cell.
+
+    Outputs:
+        path: The flat indices from the source to the target, empty if the target is unreachable.
+    """
+    if costs[target] >= INFINITE_COST:
+        return []
+
+    path = [target]
+    node = target
+    while costs[node] != 0:
+        node = next(neighbor for neighbor, step_cost in adjacency[node] if costs[neighbor] + step_cost == costs[node])
+        path.append(node)
+
+    return path[::-1]
+
+def trace_parents(parents: dict[int, int], end: int) -> list[int]:
+    """
+    Follows the parents from the end cell back to the start cell.
+
+    Inputs:
+        parents: A dictionary mapping each cell to its parent, the start cell has the parent -1.
+        end: The flat index of the end cell.
+
+    Outputs:
+        path: The flat indices from start to end.
+    """
+    path = []
+    node = end
+    while node != -1:
+        path.append(node)
+        node = parents[node]
+    return path[::-1]
+
+""" segments """
+
+def network_segments(walkable: np.ndarray, segment_size: int) -> tuple[np.ndarray, int]:
+    """
+    Splits a network into segments: each connected piece of the network inside of a square block of segment_size cells is one segment.
+    The lines of the networks are several cells wide, so closing all cells of a segment cuts every line passing through its block.
+
+    Inputs:
+        walkable: A boolean array of the walkable cells.
+        segment_size: The side length of the blocks in cells.
+
+    Outputs:
+        labels, segment_count: An int32 array with the segment number of each cell (-1 for obstacles) and the number of segments.
+    """
+    shape = walkable.shape
+    flat = walkable.ravel()
+    ys, xs = np.indices(shape)
+    blocks = ((ys // segment_size) * (shape[1] // segment_size + 1) + xs // segment_size).ravel()
+
+    labels = np.full(flat.size, -1, dtype=np.int32)
+    segment_count = 0
+
+    # flood fill each piece without leaving its block
+    for idx in np.flatnonzero(flat).tolist():
+        if labels[idx] != -1:
+            continue
+        labels[idx] = segment_count
+        stack = [idx]
+        while stack:
+            node = stack.pop()
+            for neighbor, _ in grid_neighbors(node, shape):
+                if flat[neighbor] and labels[neighbor] == -1 and blocks[neighbor] == blocks[idx]:
+                    labels[neighbor] = segment_count
+                    stack.append(neighbor)
+        segment_count += 1
+
+    return labels.reshape(shape), segment_count
+
+def segment_graph(labels: np.ndarray, segment_count: int, cell_weights: np.ndarray) -> tuple[np.ndarray, list[dict[int, float]]]:
+    """
+    Compresses a network to the graph of its segments: each segment is a node at the centroid of its cells, adjacent segments are connected.
+    An edge costs the distance between both centroids times the mean weight of both segments, which approximates the cost of the cells in between.
+
+    Inputs:
+        labels: The segment number of each cell as returned by network_segments, -1 for obstacles.
+        segment_count: The number of segments.
+        cell_weights: The flat array of weights per cell, e.g. minutes per maze unit.
+
+    Outputs:
+        centroids, adjacency: A (segment_count, 2) array with the mean (x, y) of the cells of each segment and a list with a dictionary {neighbor segment: cost} for each segment.
+    """
+    flat_labels = labels.ravel()
+    cells = flat_labels >= 0
+    ys, xs = np.indices(labels.shape)
+
+    sizes = np.bincount(flat_labels[cells], minlength=segment_count)
+    centroids = np.stack([
+        np.bincount(flat_labels[cells], xs.ravel()[cells], segment_count) / sizes,
+        np.bincount(flat_labels[cells], ys.ravel()[cells], segment_count) / sizes
+    ], axis=1)
+    weights = np.bincount(flat_labels[cells], cell_weights[cells], segment_count) / sizes
+
+    # compare each cell with its right, lower left, lower and lower right neighbor, the other 4 directions are the same pairs
+    height, width = labels.shape
+    pairs = []
+    for dy, dx in [(0, 1), (1, -1), (1, 0), (1, 1)]:
+        a = labels[:height - dy, max(0, -dx):width - max(0, dx)]
+        b = labels[dy:, max(0, dx):width - max(0, -dx)]
+        connected = (a >= 0) & (b >= 0) & (a != b)
+        pairs.append(np.stack([a[connected], b[connected]], axis=1))
+    pairs = np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+
+    adjacency = [{} for _ in range(segment_count)]
+    for a, b in pairs.tolist():
+        cost = float(np.hypot(*(centroids[a] - centroids[b]))) * (weights[a] + weights[b]) / 2
+        adjacency[a][b] = adjacency[b][a] = cost
+
+    return centroids, adjacency
+
+""" outputs """
+
+def path_to_maze(maze: np.ndarray, path: list[int]) -> np.ndarray:
+    """
+    Marks a path in a copy of the maze, so it can be plotted like a maze solved by py_run_astar.
+
+    Inputs:
+        maze: The maze array.
+        path: The flat indices of the path.
+
+    Outputs:
+        solved_maze: A float copy of the maze with the path cells set to SOL_PATH.
+    """
+    solved_maze = np.array(maze, dtype=float)
+    solved_maze.ravel()[path] = SOL_PATH
+    return solved_maze
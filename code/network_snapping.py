@@ -0,0 +1,244 @@
+import weakref
+import numpy as np
+
+import astar_lib
+import file_cache
+from parameters import NodePos
+
+# https://cs.brown.edu/people/pfelzens/papers/dt-final.pdf
+# Felzenszwalb, Huttenlocher: Distance Transforms of Sampled Functions, Theory of Computing 8 (2012)
+
+# the index of a maze is saved in a folder beside the maze, e.g. maze/railnetwork-snapping/
+snapping_suffix = "-snapping"
+snapping_file = "nearest.npy"
+
+# positions further away from the network are not snapped, they are most likely wrong coordinates
+# 5 maze units are about 9 km
+max_snap_distance = 5
+
+# snapping indices of the maze arrays used by this process, key: id of the maze array
+loaded_indices = {}
+
+def snapping_dir(maze_file: str):
+    """
+    Returns the folder containing the snapping index of a maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: The path of the folder beside the maze file.
+    """
+    return astar_lib.maze_dir.joinpath(maze_file.rsplit(".", 1)[0] + snapping_suffix)
+
+""" feature transform """
+
+def lower_envelope_argmin(costs: list[float]) -> list[int]:
+    """
+    Finds for each position x the site q minimizing (x - q)^2 + costs[q], using the lower envelope of the parabolas rooted at the sites.
+
+    Inputs:
+        costs: The cost of each site, infinite for positions which are no site.
+
+    Outputs:
+        nearest: The minimizing site of each position, -1 if there is no site at all.
+    """
+    sites = [q for q, cost in enumerate(costs) if cost != float("inf")]
+    if not sites:
+        return [-1] * len(costs)
+
+    # parabolas of the envelope and the boundaries between them
+    parabolas = [sites[0]]
+    boundaries = [float("-inf"), float("inf")]
+
+    for q in sites[1:]:
+        while True:
+            p = parabolas[-1]
+            intersection = ((costs[q] + q * q) - (costs[p] + p * p)) / (2 * q - 2 * p)
+            if intersection > boundaries[-2]:
+                break
+            parabolas.pop()
+            boundaries.pop()
+        parabolas.append(q)
+        boundaries[-1] = intersection
+        boundaries.append(float("inf"))
+
+    nearest = []
+    k = 0
+    for x in range(len(costs)):
+        while boundaries[k + 1] < x:
+            k += 1
+        nearest.append(parabolas[k])
+    return nearest
+
+def feature_transform(walkable: np.ndarray) -> np.ndarray:
+    """
+    Calculates the exact Euclidean feature transform: the nearest walkable cell of every cell.
+    First the nearest walkable cell in the same column is found, then the rows combine the columns with the lower envelope of parabolas.
+
+    Inputs:
+        walkable: A boolean array of the walkable cells.
+
+    Outputs:
+        nearest: An int32 array of the maze shape with the flat index of the nearest walkable cell, -1 if the maze has no walkable cell.
+    """
+    height, width = walkable.shape
+    ys = np.arange(height)[:, None].repeat(width, axis=1)
+
+    # nearest walkable cell above and below in each column
+    above = np.maximum.accumulate(np.where(walkable, ys, -height), axis=0)
+    below = np.minimum.accumulate(np.where(walkable, ys, 2 * height)[::-1], axis=0)[::-1]
+    column_nearest = np.where(ys - above <= below - ys, above, below)
+    column_costs = np.where((column_nearest >= 0) & (column_nearest < height), (ys - column_nearest) ** 2, np.inf).astype(float)
+
+    nearest = np.full((height, width), -1, dtype=np.int32)
+    for y in range(height):
+        nearest_x = np.array(lower_envelope_argmin(column_costs[y].tolist()))
+        if nearest_x[0] == -1:
+            continue
+        nearest[y] = column_nearest[y, nearest_x] * width + nearest_x
+
+    return nearest
+
+class SnappingIndex():
+    """
+    Index of the nearest walkable cell of every cell of a maze, so any position can be snapped to the network in O(1).
+    If the maze file is given, the index is saved beside the maze and rebuilt when the digest of the maze changes.
+
+    Attributes:
+        shape (tuple): The shape of the maze.
+        nearest (np.ndarray): The flat index of the nearest walkable cell of each cell.
+
+    Methods:
+        __init__: Loads or builds the index.
+        snap: Snaps a single position.
+        snap_many: Snaps arrays of coordinates at once.
+    """
+    def __init__(self, maze: np.ndarray, maze_file: str | None = None) -> None:
+        """
+        Initializes a new SnappingIndex instance.
+
+        Inputs:
+            maze: The maze array.
+            maze_file: The optional file name of the maze, to save the index beside it.
+        """
+        self.shape = maze.shape
+        walkable = np.asarray(maze) != astar_lib.OBSTACLE
+
+        if maze_file is None:
+            self.nearest = feature_transform(walkable).ravel()
+            return
+
+        directory = snapping_dir(maze_file)
+        path = directory.joinpath(snapping_file)
+        maze_digest = file_cache.file_digest(astar_lib.maze_dir.joinpath(maze_file))
+
+        if file_cache.read_manifest(directory).get("maze") == maze_digest and path.exists():
+            self.nearest = np.load(path).ravel()
+        else:
+            nearest = feature_transform(walkable)
+            file_cache.save_array(path, nearest)
+            file_cache.write_manifest(directory, {"maze": maze_digest})
+            self.nearest = nearest.ravel()
+
+    def snap_many(self, xs: np.ndarray, ys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Snaps arrays of coordinates to their nearest walkable cells. Coordinates outside of the maze are first moved to the nearest border cell.
+
+        Inputs:
+            xs: The x-coordinates.
+            ys: The y-coordinates.
+
+        Outputs:
+            snapped_xs, snapped_ys, distances: The coordinates of the nearest walkable cells and their Euclidean distances to the given coordinates in maze units.
+        """
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        height, width = self.shape
+
+        cells = self.nearest[np.clip(ys, 0, height - 1) * width + np.clip(xs, 0, width - 1)]
+        if np.any(cells == -1):
+            raise ValueError("The maze does not contain any walkable cell!")
+
+        snapped_ys, snapped_xs = np.divmod(cells, width)
+        return snapped_xs, snapped_ys, np.hypot(snapped_xs - xs, snapped_ys - ys)
+
+    def snap(self, pos: NodePos) -> tuple[NodePos, float]:
+        """
+        Snaps a position to its nearest walkable cell.
+
+        Inputs:
+            pos: The position to snap.
+
+        Outputs:
+            snapped_pos, distance: The position of the nearest walkable cell and its distance to the given position in maze units, 0 if the position is walkable.
+        """
+        xs, ys, distances = self.snap_many(np.array([pos.x]), np.array([pos.y]))
+        return NodePos(int(xs[0]), int(ys[0])), float(distances[0])
+
+def index_for(maze: np.ndarray, maze_file: str | None = None) -> SnappingIndex:
+    """
+    Returns the snapping index of a maze array. The index is built or loaded at the first query of the array and kept beside it until the array is freed, so every later query is a dictionary lookup.
+    The mazes are never changed in place, a changed network is a new array.
+
+    Inputs:
+        maze: The maze array.
+        maze_file: The optional file name of the maze, to load the index saved beside it instead of building it.
+
+    Outputs:
+        _: The SnappingIndex of the maze.
+    """
+    key = id(maze)
+    index = loaded_indices.get(key)
+    if index is None:
+        index = SnappingIndex(maze, maze_file)
+        # the entry is removed with its array, so a new array reusing the id never gets a stale index
+        weakref.finalize(maze, loaded_indices.pop, key, None)
+        loaded_indices[key] = index
+    return index
+
+def snap_to_network(pos: NodePos, pos_name: str, maze: np.ndarray) -> tuple[NodePos, float]:
+    """
+    Snaps a position to the network if it is not walkable but close enough to it.
+
+    Inputs:
+        pos: The position to snap.
+        pos_name: The name of the position, for the error message.
+        maze: The maze array of the network.
+
+    Outputs:
+        snapped_pos, distance: The given position and 0 if it is walkable, otherwise the nearest walkable cell and its distance to the given position in maze units.
+
+    Raises:
+        Exception: If the position is further than max_snap_distance away from the network.
+    """
+    if astar_lib.is_in_bounds(pos, maze) and astar_lib.is_walkable(pos, maze):
+        return pos, 0.0
+
+    snapped_pos, distance = index_for(maze).snap(pos)
+    if distance > max_snap_distance:
+        raise Exception(f"The {pos_name} node at x={pos.x}, y={pos.y} is {distance:.1f} maze units away from the network, more than {max_snap_distance}!")
+
+    return snapped_pos, distance
+
+def snap_cities(cities: dict[str, NodePos], maze_file: str) -> list[dict]:
+    """
+    Snaps all cities to a network at once with the saved index of the maze.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects.
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: A list with a dictionary per city containing the name, the given and the snapped coordinates and the snap distance in maze units.
+    """
+    index = SnappingIndex(astar_lib.load_maze(maze_file), maze_file)
+    names = list(cities.keys())
+    xs = np.array([cities[name].x for name in names])
+    ys = np.array([cities[name].y for name in names])
+
+    snapped_xs, snapped_ys, distances = index.snap_many(xs, ys)
+    return [
+        {"name": name, "x": int(x), "y": int(y), "snapped_x": int(snapped_x), "snapped_y": int(snapped_y), "distance": float(distance)}
+        for name, x, y, snapped_x, snapped_y, distance in zip(names, xs, ys, snapped_xs, snapped_ys, distances)
+    ]
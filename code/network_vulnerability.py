@@ -0,0 +1,247 @@
+import csv
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+import astar_lib
+import network_graph
+import shared_networks
+import train_car_comparison as comparison
+from network_graph import INFINITE_COST, PRECISION_FACTOR
+from parameters import NodePos
+
+vulnerability_dir = comparison.output_dir.joinpath("network-vulnerability")
+
+# side length of the blocks defining the segments in cells, 4 cells are about 7 km
+segment_size = 4
+
+# table columns of the ranked segments
+table_columns = ["rank", "segment", "x", "y", "affected_pairs", "disconnected_pairs", "added_minutes", "max_added_minutes", "worst_pair"]
+
+# state of each worker process, filled once by init_worker
+worker_state = {}
+
+class VulnerableNetwork():
+    """
+    A slow network of a vehicle type (e.g. main roads) with the faster network it contains (e.g. highways) prepared for repeated searches.
+
+    Attributes:
+        vehicle_type (str): The vehicle type of the networks.
+        maze (np.ndarray): The maze array of the slow network.
+        adjacency (list): The adjacency list of the slow network, a network_graph.CsrAdjacency if attached from shared memory.
+        pace (np.ndarray): The flat array of minutes per maze unit of each cell.
+        fast_cells (np.ndarray): The flat boolean mask of the cells of the fast network.
+        labels (np.ndarray): The segment number of each cell, -1 for obstacles.
+        segment_count (int): The number of segments.
+
+    Methods:
+        __init__: Loads the networks of a vehicle type and splits them into segments.
+        travel_time: Finds the fastest route between two cells while a segment is closed.
+        closed_cells: Creates the mask of the closed cells of a segment.
+        publish: Publishes the network into shared memory.
+    """
+    def __init__(self, vehicle_type: str, networks: dict[str, np.ndarray] | None = None) -> None:
+        """
+        Initializes a new VulnerableNetwork instance.
+
+        Inputs:
+            vehicle_type: The vehicle type as defined in comparison.vehicle_networks, 'train' or 'car'.
+            networks: Optional already loaded arrays, e.g. attached from shared memory as published by publish. Keys are the maze file names, 'labels' for the segment labels, 'pace' and 'fast_cells' and the adjacency arrays of the slow maze file. Missing arrays are loaded or computed.
+        """
+        networks = networks or {}
+        self.vehicle_type = vehicle_type
+        slow_maze_file, fast_maze_file, slow_speed, fast_speed = comparison.vehicle_networks[vehicle_type]
+        self.maze = networks[slow_maze_file] if slow_maze_file in networks else astar_lib.load_maze(slow_maze_file)
+
+        if "pace" in networks:
+            # the workers search on the shared arrays instead of building their own
+            self.adjacency = shared_networks.attached_adjacency(networks, slow_maze_file)
+            self.pace = networks["pace"]
+            self.fast_cells = networks["fast_cells"]
+        else:
+            fast_maze = networks[fast_maze_file] if fast_maze_file in networks else astar_lib.load_maze(fast_maze_file)
+            self.adjacency = network_graph.build_adjacency(network_graph.walkable_mask(self.maze))
+            self.pace = comparison.network_pace(fast_maze, slow_speed, fast_speed).ravel()
+            self.fast_cells = network_graph.walkable_mask(fast_maze).ravel()
+
+        if "labels" in networks:
+            self.labels = networks["labels"]
+            self.segment_count = int(self.labels.max()) + 1
+        else:
+            self.labels, self.segment_count = network_graph.network_segments(network_graph.walkable_mask(self.maze), segment_size)
+
+    def travel_time(self, start: int, end: int, closed_segment: int = -1) -> tuple[float, list[int]]:
+        """
+        Finds the fastest route between two cells. The cells of the closed segment cannot be passed, except the start and end cell themselves.
+
+        Inputs:
+            start: The flat index of the start cell.
+            end: The flat index of the end cell.
+            closed_segment: The number of the closed segment, -1 if no segment is closed.
+
+        Outputs:
+            minutes, path: The travel time in minutes (infinite if no route exists) and the flat indices of the route.
+        """
+        closed = self.closed_cells(closed_segment, [start, end])
+        cost, path = network_graph.shortest_path(self.adjacency, start, end, self.maze.shape[1], self.pace, closed)
+        if cost >= INFINITE_COST:
+            return float("inf"), []
+        return cost / PRECISION_FACTOR, path
+
+    def closed_cells(self, closed_segment: int, kept_open: list[int]) -> np.ndarray | None:
+        """
+        Creates the mask of the closed cells of a segment.
+
+        Inputs:
+            closed_segment: The number of the closed segment, -1 if no segment is closed.
+            kept_open: The flat indices of cells which stay open, e.g. the start and end cells.
+
+        Outputs:
+            closed: The flat boolean array of closed cells, None if no segment is closed.
+        """
+        if closed_segment == -1:
+            return None
+        closed = self.labels.ravel() == closed_segment
+        closed[kept_open] = False
+        return closed
+
+    def publish(self, shared: shared_networks.SharedNetworks) -> None:
+        """
+        Publishes the slow maze, its adjacency, the pace, the fast cells and the segment labels into shared memory, so a worker attaches everything it searches on and allocates almost nothing itself.
+
+        Inputs:
+            shared: The SharedNetworks receiving the arrays.
+        """
+        slow_maze_file, *_ = comparison.vehicle_networks[self.vehicle_type]
+        shared.publish(slow_maze_file, self.maze)
+        shared.publish_adjacency(slow_maze_file, self.maze)
+        shared.publish("pace", self.pace)
+        shared.publish("fast_cells", self.fast_cells)
+        shared.publish("labels", self.labels)
+
+def init_worker(vehicle_type: str, descriptor: dict | None) -> None:
+    """
+    Prepares the network once in each worker process from the arrays published in shared memory.
+
+    Inputs:
+        vehicle_type: The vehicle type as defined in comparison.vehicle_networks.
+        descriptor: The descriptor of the SharedNetworks the network was published into with VulnerableNetwork.publish. If None, the worker loads and prepares its own copy.
+    """
+    worker_state["network"] = VulnerableNetwork(vehicle_type, None if descriptor is None else shared_networks.attach_networks(descriptor))
+
+def evaluate_closure(task: tuple[int, list[tuple[int, int, int]]]) -> tuple[int, list[tuple[int, float]]]:
+    """
+    Searches again the routes of the pairs which use a segment, while this segment is closed.
+
+    Inputs:
+        task: A tuple (segment, pairs) where pairs is a list of (pair number, start cell, end cell).
+
+    Outputs:
+        segment, times: The segment and a list of (pair number, travel time in minutes) of the affected pairs.
+    """
+    segment, pairs = task
+    network = worker_state["network"]
+    return segment, [(pair, network.travel_time(start, end, segment)[0]) for pair, start, end in pairs]
+
+def scan_network(vehicle_type: str, cities: dict[str, NodePos], workers: int | None = None) -> tuple[list[dict], np.ndarray, np.ndarray]:
+    """
+    Ranks the segments of a network by how much closing them increases the travel time between the city pairs.
+    Only segments lying on one of the current fastest routes are closed and only the pairs whose route uses the closed segment are searched again, in parallel worker processes.
+
+    Inputs:
+        vehicle_type: The vehicle type as defined in comparison.vehicle_networks, 'train' or 'car'.
+        cities: A dictionary mapping city names to their NodePos objects.
+        workers: The number of worker processes. Defaults to the number of CPUs.
+
+    Outputs:
+        table: The ranked segments as a list of dictionaries with the keys of table_columns.
+        heatmap: A float array with the added minutes of the segment of each cell, infinite if closing the segment disconnects a pair and NaN for cells that are not part of the network.
+        maze: The maze array of the scanned network.
+    """
+    network = VulnerableNetwork(vehicle_type)
+    shape = network.maze.shape
+    labels = network.labels.ravel()
+
+    pairs = comparison.city_pairs(cities)
+    baseline = []
+    segment_pairs = {}
+
+    for pair, (start_name, end_name) in enumerate(pairs):
+        start = network_graph.cell_index(cities[start_name].x, cities[start_name].y, shape)
+        end = network_graph.cell_index(cities[end_name].x, cities[end_name].y, shape)
+        minutes, path = network.travel_time(start, end)
+        baseline.append(minutes)
+
+        # only the segments on the current route can make it slower
+        for segment in set(labels[path].tolist()):
+            segment_pairs.setdefault(segment, []).append((pair, start, end))
+
+    # the workers attach the network instead of loading and preparing a copy each
+    with shared_networks.SharedNetworks() as shared:
+        network.publish(shared)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(vehicle_type, shared.descriptor)) as executor:
+            closures = list(executor.map(evaluate_closure, segment_pairs.items()))
+
+    rows = []
+    heatmap = np.where(network.maze != astar_lib.OBSTACLE, 0.0, np.nan)
+
+    for segment, times in closures:
+        added = [(minutes - baseline[pair], pair) for pair, minutes in times]
+        finite_added = [minutes for minutes, _ in added if np.isfinite(minutes)]
+        max_added, worst_pair = max(added)
+
+        ys, xs = np.nonzero(network.labels == segment)
+        rows.append({
+            "segment": segment,
+            "x": int(round(xs.mean())),
+            "y": int(round(ys.mean())),
+            "affected_pairs": len(times),
+            "disconnected_pairs": len(added) - len(finite_added),
+            "added_minutes": round(sum(finite_added), 1),
+            "max_added_minutes": round(max_added, 1),
+            "worst_pair": " - ".join(pairs[worst_pair])
+        })
+        # segments disconnecting a pair are marked as infinitely critical
+        heatmap[network.labels == segment] = sum(finite_added) if len(finite_added) == len(added) else np.inf
+
+    # disconnecting pairs is worse than any detour
+    rows.sort(key=lambda row: (-row["disconnected_pairs"], -row["added_minutes"]))
+    for rank, row in enumerate(rows):
+        row["rank"] = rank + 1
+
+    return rows, heatmap, network.maze
+
+def worker_memory(vehicle_type: str, workers: int, shared: bool) -> int:
+    """
+    Measures the total memory the worker processes of a scan allocate in init_worker.
+
+    Inputs:
+        vehicle_type: The vehicle type as defined in comparison.vehicle_networks.
+        workers: The number of worker processes.
+        shared: True to attach the network from shared memory, False to prepare a copy in every worker.
+
+    Outputs:
+        _: The sum of the peak allocations of all workers in bytes.
+    """
+    if not shared:
+        return shared_networks.measure_memory(init_worker, (vehicle_type, None), workers)
+
+    with shared_networks.SharedNetworks() as shared_network:
+        VulnerableNetwork(vehicle_type).publish(shared_network)
+        return shared_networks.measure_memory(init_worker, (vehicle_type, shared_network.descriptor), workers)
+
+def save_table(filename: str, table: list[dict]) -> None:
+    """
+    Saves the ranked segments as a CSV file in the vulnerability output folder.
+
+    Inputs:
+        filename: The name of the CSV file.
+        table: The ranked segments as returned by scan_network.
+    """
+    vulnerability_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(vulnerability_dir.joinpath(filename), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=table_columns)
+        writer.writeheader()
+        writer.writerows(table)
@@ -0,0 +1,310 @@
+import csv
+import json
+import itertools
+import numpy as np
+
+import astar_lib
+import file_cache
+import incremental_conversion
+import investement_calculator
+import network_graph
+import network_snapping
+import parameters
+import train_car_comparison as comparison
+from parameters import NodePos, params_dir
+
+# parameter file name
+sweep_parameter_file = "parameter_sweep.json"
+# key of the swept vehicle rates in the parameter file, {vehicle: {rate name: [values]}}
+rates_name = "rates"
+
+# swept constants of train_car_comparison, each is kept at its current value if the parameter file does not list it
+swept_constants = ["DISTANCE_SCALE_FACTOR", "INTERCITY_TRAIN_SPEED", "REGIO_TRAIN_SPEED", "HIGHWAY_CAR_SPEED", "MAIN_ROAD_CAR_SPEED"]
+
+# speed constants of the (slow, fast) network of each vehicle type
+vehicle_speeds = {
+    "train": ("REGIO_TRAIN_SPEED", "INTERCITY_TRAIN_SPEED"),
+    "car": ("MAIN_ROAD_CAR_SPEED", "HIGHWAY_CAR_SPEED")
+}
+
+sweep_dir = comparison.output_dir.joinpath("parameter-sweep")
+lengths_file = "route-lengths.json"
+table_file = "scenarios.csv"
+
+# edge length in cells of the tiles crossed by a cached route, a route is searched again when a cell of its tiles changes
+route_tile_size = 16
+
+""" route lengths """
+
+def load_route_lengths(cities: dict[str, NodePos], networks: dict[str, np.ndarray] | None = None) -> dict[str, dict]:
+    """
+    Returns the route lengths of every city pair and vehicle type as returned by comparison.route_lengths.
+    The lengths are cached in the sweep folder: pairs whose cities did not move are reused, as long as none of the mazes changed.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects.
+        networks: Optional networks already loaded with comparison.load_networks.
+
+    Outputs:
+        lengths: A dictionary mapping "start-end" to a dictionary with the start and end city, their positions, {vehicle type: [fast distance, slow route length on the fast network, slow route length on the slow network]} in maze units and the "tiles" crossed by the routes of each vehicle type.
+    """
+    maze_files = [maze_file for networks in comparison.vehicle_networks.values() for maze_file in networks[:2]]
+    sources = file_cache.source_digests([astar_lib.maze_dir.joinpath(maze_file) for maze_file in maze_files])
+
+    cached = {}
+    if file_cache.read_manifest(sweep_dir).get("sources") == sources and sweep_dir.joinpath(lengths_file).exists():
+        with open(sweep_dir.joinpath(lengths_file), 'r') as f:
+            cached = json.load(f)
+
+    lengths = {}
+    for start_name, end_name in comparison.city_pairs(cities):
+        start, end = cities[start_name], cities[end_name]
+        key = f"{start_name}-{end_name}"
+        positions = [start.x, start.y, end.x, end.y]
+
+        if key in cached and cached[key]["positions"] == positions:
+            lengths[key] = cached[key]
+            continue
+
+        lengths[key] = {"start_city": start_name, "end_city": end_name, "positions": positions, "tiles": {}}
+        for vehicle_type, (slow_maze_file, fast_maze_file, _, _) in comparison.vehicle_networks.items():
+            slow_maze = comparison.network_maze(slow_maze_file, networks)
+            fast_maze = comparison.network_maze(fast_maze_file, networks)
+            *route_lengths, solved_fast_maze, solved_slow_maze = comparison.route_lengths(start, end, slow_maze, fast_maze)
+            lengths[key][vehicle_type] = list(route_lengths)
+            lengths[key]["tiles"][vehicle_type] = route_tiles([solved_fast_maze, solved_slow_maze])
+
+    file_cache.atomic_write(sweep_dir.joinpath(lengths_file), lambda f: f.write(json.dumps(lengths, indent=4).encode()))
+    file_cache.write_manifest(sweep_dir, {"sources": sources})
+    return lengths
+
+def route_tiles(solved_mazes: list[np.ndarray]) -> list[int]:
+    """
+    Collects the tiles crossed by routes.
+
+    Inputs:
+        solved_mazes: The solved mazes of the routes, with the routes marked as astar_lib.SOL_PATH.
+
+    Outputs:
+        _: The sorted tiles of route_tile_size cells, numbered row by row.
+    """
+    tiles = set()
+    for solved_maze in solved_mazes:
+        ys, xs = np.nonzero(solved_maze == astar_lib.SOL_PATH)
+        tiles.update((ys // route_tile_size * -(-solved_maze.shape[1] // route_tile_size) + xs // route_tile_size).tolist())
+    return sorted(tiles)
+
+def is_route_unchanged(pair: dict, vehicle_type: str, changes_per_maze: dict[str, incremental_conversion.MazeChanges]) -> bool:
+    """
+    Checks if the cached routes of a city pair and vehicle type are still shortest after cells of their networks changed.
+    Closing cells off a route cannot shorten it, so only changes in its tiles and opened cells which could lie on a shorter route matter: an opened cell can only shorten a route if the octile distances from the start to the cell and on to the end, widened by the snapping at both ends, are not longer than the route.
+
+    Inputs:
+        pair: The cached entry of the city pair as returned by load_route_lengths.
+        vehicle_type: The vehicle type as defined in comparison.vehicle_networks.
+        changes_per_maze: The changes of each changed maze.
+
+    Outputs:
+        _: True if the routes are unchanged, False if they have to be searched again.
+    """
+    slow_maze_file, fast_maze_file, _, _ = comparison.vehicle_networks[vehicle_type]
+    fast_distance, slow_fast_length, slow_slow_length = pair[vehicle_type]
+    start_x, start_y, end_x, end_y = pair["positions"]
+    # cities may be snapped up to max_snap_distance away, a diagonal step is the longest per cell
+    snap_margin = 2 * network_snapping.max_snap_distance * network_graph.DIAGONAL_COST / network_graph.STRAIGHT_COST
+
+    for maze_file, length in [(fast_maze_file, np.inf if fast_distance == -1 else fast_distance), (slow_maze_file, slow_fast_length + slow_slow_length)]:
+        changes = changes_per_maze.get(maze_file)
+        if changes is None:
+            continue
+
+        ys, xs = np.unravel_index(changes.cells(), changes.shape)
+        if np.isin(ys // route_tile_size * -(-changes.shape[1] // route_tile_size) + xs // route_tile_size, pair["tiles"][vehicle_type]).any():
+            return False
+
+        ys, xs = np.unravel_index(changes.opened, changes.shape)
+        lower_bound = np.zeros(ys.size)
+        for x, y in [(start_x, start_y), (end_x, end_y)]:
+            dx, dy = np.abs(xs - x), np.abs(ys - y)
+            lower_bound += (network_graph.STRAIGHT_COST * np.maximum(dx, dy) + (network_graph.DIAGONAL_COST - network_graph.STRAIGHT_COST) * np.minimum(dx, dy)) / network_graph.PRECISION_FACTOR
+        if (lower_bound <= length + snap_margin).any():
+            return False
+
+    return True
+
+def invalidate_route_lengths(changes_list: list[incremental_conversion.MazeChanges]) -> tuple[int, int] | None:
+    """
+    Keeps the cached route lengths which the changed cells of the networks cannot affect, after their maps were converted again.
+    The other pairs are searched again by the next load_route_lengths, which would search every pair if the digest of a maze changed.
+
+    Inputs:
+        changes_list: The changes of the converted mazes as returned by incremental_conversion.update_maze.
+
+    Outputs:
+        _: The number of kept and invalidated pairs. None if no network changed or the cache was not built for the previous mazes.
+    """
+    maze_files = [maze_file for networks in comparison.vehicle_networks.values() for maze_file in networks[:2]]
+    changes_per_maze = {changes.maze_file: changes for changes in changes_list if changes.maze_file in maze_files}
+    sources = file_cache.read_manifest(sweep_dir).get("sources")
+    if not changes_per_maze or sources is None or not sweep_dir.joinpath(lengths_file).exists():
+        return None
+    if any(changes.full_rewrite or sources.get(maze_file) != changes.previous_digest for maze_file, changes in changes_per_maze.items()):
+        return None
+
+    with open(sweep_dir.joinpath(lengths_file), 'r') as f:
+        cached = json.load(f)
+
+    # pairs cached without their tiles are searched again
+    lengths = {key: pair for key, pair in cached.items() if "tiles" in pair and all(is_route_unchanged(pair, vehicle_type, changes_per_maze) for vehicle_type in comparison.vehicle_networks)}
+    sources.update({maze_file: changes.digest for maze_file, changes in changes_per_maze.items()})
+
+    file_cache.atomic_write(sweep_dir.joinpath(lengths_file), lambda f: f.write(json.dumps(lengths, indent=4).encode()))
+    file_cache.write_manifest(sweep_dir, {"sources": sources})
+    return len(lengths), len(cached) - len(lengths)
+
+""" scenarios """
+
+def load_sweep(filename: str, rates_per_vehicle: dict[str, dict[str, dict[str, float]]]) -> dict[str, list[float]]:
+    """
+    Loads the swept values of each parameter. Constants and rates missing in the file keep their current value.
+
+    Inputs:
+        filename: The name of the parameter file.
+        rates_per_vehicle: The rates of rates_per_vehicle.json.
+
+    Outputs:
+        axes: A dictionary mapping each parameter to its values, the rates are named "<vehicle> <rate name>", e.g. "Train Price per km".
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+
+    axes = {name: params.get(name, [getattr(comparison, name)]) for name in swept_constants}
+    swept_rates = params.get(rates_name, {})
+
+    for vehicle_rates in rates_per_vehicle.values():
+        for vehicle, rates in vehicle_rates.items():
+            for rate_name, rate in rates.items():
+                axes[f"{vehicle} {rate_name}"] = swept_rates.get(vehicle, {}).get(rate_name, [rate])
+
+    return axes
+
+def scenario_grid(axes: dict[str, list[float]]) -> dict[str, np.ndarray]:
+    """
+    Builds every combination of the parameter values.
+
+    Inputs:
+        axes: A dictionary mapping each parameter to its values.
+
+    Outputs:
+        _: A dictionary mapping each parameter to an array with its value in each scenario.
+    """
+    # https://numpy.org/doc/stable/reference/generated/numpy.meshgrid.html
+    grids = np.meshgrid(*[np.asarray(values, dtype=float) for values in axes.values()], indexing='ij')
+    return {name: grid.ravel() for name, grid in zip(axes.keys(), grids)}
+
+def evaluate(lengths: dict[str, dict], scenarios: dict[str, np.ndarray], rates_per_vehicle: dict[str, dict[str, dict[str, float]]]) -> dict[str, np.ndarray]:
+    """
+    Evaluates all city pairs in all scenarios at once, with the same rounding as comparison.vehicle_analysis: each vehicle type takes its faster route, the faster vehicle type wins (the train on a tie).
+    The arrays have the shape (pairs, scenarios).
+
+    Inputs:
+        lengths: The route lengths as returned by load_route_lengths.
+        scenarios: The value of each parameter in each scenario as returned by scenario_grid.
+        rates_per_vehicle: The rates of rates_per_vehicle.json, only used for the vehicle names.
+
+    Outputs:
+        results: A dictionary with the network, distance (km) and minutes of each vehicle type, the winner and the rates of each vehicle (e.g. "Train Price").
+    """
+    pairs = list(lengths.values())
+    scale = scenarios["DISTANCE_SCALE_FACTOR"][None, :]
+    results = {}
+
+    def real_distance_and_time(maze_distance: np.ndarray, speed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # vectorized comparison.real_rounded_distance_and_time, np.round rounds half to even like round
+        real_distance = maze_distance * scale
+        return np.round(real_distance), np.round(real_distance / speed * 60)
+
+    for vehicle_type, (slow_speed_name, fast_speed_name) in vehicle_speeds.items():
+        fast_distance, slow_fast_length, slow_slow_length = np.array([pair[vehicle_type] for pair in pairs], dtype=float).T[:, :, None]
+        slow_speed, fast_speed = scenarios[slow_speed_name][None, :], scenarios[fast_speed_name][None, :]
+
+        fast_km, fast_minutes = real_distance_and_time(fast_distance, fast_speed)
+        # no route on the fast network
+        fast_minutes = np.where(fast_distance == -1, np.inf, fast_minutes)
+
+        slow_slow_km, slow_slow_minutes = real_distance_and_time(slow_slow_length, slow_speed)
+        slow_fast_km, slow_fast_minutes = real_distance_and_time(slow_fast_length, fast_speed)
+
+        takes_fast = fast_minutes <= slow_slow_minutes + slow_fast_minutes
+        slow_title, fast_title = comparison.network_titles[vehicle_type]
+
+        results[f"{vehicle_type}_network"] = np.where(takes_fast, fast_title, slow_title)
+        results[f"{vehicle_type}_distance"] = np.where(takes_fast, fast_km, slow_slow_km + slow_fast_km)
+        results[f"{vehicle_type}_minutes"] = np.where(takes_fast, fast_minutes, slow_slow_minutes + slow_fast_minutes)
+
+    results["winner"] = np.where(results["train_minutes"] <= results["car_minutes"], "train", "car")
+
+    # like investement_calculator.calculate_rates, the rates are applied to the rounded distance
+    for vehicle_type, vehicle_rates in rates_per_vehicle.items():
+        for vehicle, rates in vehicle_rates.items():
+            for rate_name in rates.keys():
+                results[f"{vehicle} {rate_name.replace(investement_calculator.rate_suffix, '')}"] = results[f"{vehicle_type}_distance"] * scenarios[f"{vehicle} {rate_name}"][None, :]
+
+    return results
+
+def run_sweep(cities: dict[str, NodePos], filename: str = sweep_parameter_file) -> tuple[list[dict], dict[str, np.ndarray], dict[str, np.ndarray]]:
+    """
+    Evaluates every city pair in every combination of the swept parameters.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects.
+        filename: The name of the sweep parameter file.
+
+    Outputs:
+        pairs, scenarios, results: The city pairs as returned by load_route_lengths, the parameter values of each scenario and the results of each pair and scenario as returned by evaluate.
+    """
+    rates_per_vehicle, _ = investement_calculator.load_vehicle_rates_and_units()
+    scenarios = scenario_grid(load_sweep(filename, rates_per_vehicle))
+    lengths = load_route_lengths(cities)
+    return list(lengths.values()), scenarios, evaluate(lengths, scenarios, rates_per_vehicle)
+
+def train_win_shares(scenarios: dict[str, np.ndarray], results: dict[str, np.ndarray]) -> dict[str, dict[float, float]]:
+    """
+    Calculates the share of pairs won by the train for each value of each swept parameter, over all scenarios with this value.
+
+    Inputs:
+        scenarios: The parameter values of each scenario.
+        results: The results of each pair and scenario as returned by evaluate.
+
+    Outputs:
+        _: A dictionary mapping each parameter with more than one value to {value: share between 0 and 1}.
+    """
+    train_wins = (results["winner"] == "train").mean(axis=0)
+    return {
+        name: {float(value): float(train_wins[values == value].mean()) for value in np.unique(values)}
+        for name, values in scenarios.items() if len(np.unique(values)) > 1
+    }
+
+def save_table(pairs: list[dict], scenarios: dict[str, np.ndarray], results: dict[str, np.ndarray]) -> None:
+    """
+    Saves one row per scenario and city pair as a CSV file in the sweep folder.
+
+    Inputs:
+        pairs: The city pairs as returned by load_route_lengths.
+        scenarios: The parameter values of each scenario.
+        results: The results of each pair and scenario as returned by evaluate.
+    """
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    columns = ["scenario", *scenarios.keys(), "start_city", "end_city", *results.keys()]
+    scenario_count = len(next(iter(scenarios.values())))
+
+    with open(sweep_dir.joinpath(table_file), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for scenario, (i, pair) in itertools.product(range(scenario_count), enumerate(pairs)):
+            writer.writerow([
+                scenario,
+                *(f"{values[scenario]:g}" for values in scenarios.values()),
+                pair["start_city"], pair["end_city"],
+                *(f"{values[i, scenario]:g}" if values.dtype.kind == "f" else values[i, scenario] for values in results.values())
+            ])
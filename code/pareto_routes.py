@@ -0,0 +1,176 @@
+import heapq
+import time
+import numpy as np
+
+import alternative_routes
+import investement_calculator
+import network_graph
+import network_vulnerability
+import train_car_comparison as comparison
+from network_graph import PRECISION_FACTOR
+from parameters import NodePos
+
+# https://en.wikipedia.org/wiki/Multi-objective_optimization#Pareto_front
+# Martins: On a multicriteria shortest path problem, European Journal of Operational Research 16 (1984)
+# Mandow, Pérez de la Cruz: Multiobjective A* search with consistent heuristics, Journal of the ACM 57 (2010)
+
+# labels closer than these resolutions count as equal (epsilon dominance), which keeps the label sets small
+time_resolution = 0.5 # min
+distance_resolution = 0.5 # km
+
+# optional highest number of settled labels per cell, further labels reaching a full cell are dropped and routes may be missed
+# None keeps every label which is not epsilon-dominated, the end cell is never capped as its labels are the routes
+max_labels_per_cell = None
+
+# rate names of rates_per_vehicle.json compared by the pareto set, mapped to their short name
+pareto_rates = {"Price": "price", "Emissions": "emissions", "Energy": "energy"}
+
+def dominates(a: tuple[float, float], b: tuple[float, float]) -> bool:
+    """
+    Checks if label a is at least as good as label b in every criterion, up to the resolutions.
+
+    Inputs:
+        a: The (minutes, km) of the first label.
+        b: The (minutes, km) of the second label.
+
+    Outputs:
+        _: True if a epsilon-dominates b.
+    """
+    return a[0] <= b[0] + time_resolution and a[1] <= b[1] + distance_resolution
+
+def pareto_search(network: network_vulnerability.VulnerableNetwork, start: int, end: int) -> tuple[list[tuple[float, float, list[int]]], dict]:
+    """
+    Finds the pareto set of routes over travel time and distance with a multi-objective label-setting search (NAMOA*).
+    Labels are settled in the order of their estimated total time; a label is pruned if a settled label of its cell or a route already found dominates it, counting the octile lower bounds of the remaining time and distance.
+    Price, emissions and energy are proportional to the distance for a given vehicle, so this set contains the pareto set over time, price and emissions of every vehicle of the network.
+    If max_labels_per_cell caps the other cells than the end, the set may miss routes, the dropped labels are counted in the statistics.
+
+    Inputs:
+        network: The network with the pace of each cell.
+        start: The flat index of the start cell.
+        end: The flat index of the end cell.
+
+    Outputs:
+        routes, stats: A list of (minutes, km, path) from fastest to shortest, and a dictionary with the number of created, settled and dropped labels, the largest label set of a cell and the runtime in seconds.
+    """
+    start_time = time.perf_counter()
+    shape = network.maze.shape
+    pace = network.pace.tolist()
+
+    # consistent lower bounds of the remaining time and distance of each cell
+    ys, xs = np.divmod(np.arange(network.maze.size), shape[1])
+    end_y, end_x = divmod(end, shape[1])
+    dx, dy = np.abs(xs - end_x), np.abs(ys - end_y)
+    octile = (np.maximum(dx, dy) * network_graph.STRAIGHT_COST + np.minimum(dx, dy) * (network_graph.DIAGONAL_COST - network_graph.STRAIGHT_COST)) / PRECISION_FACTOR
+    time_bounds = (octile * float(network.pace.min())).tolist()
+    distance_bounds = (octile * comparison.DISTANCE_SCALE_FACTOR).tolist()
+
+    # labels are stored once, the queue and the parents refer to their index
+    label_cells = [start]
+    label_parents = [-1]
+    label_costs = [(0.0, 0.0)]
+    settled = {}
+    routes = []
+    border = [(time_bounds[start], distance_bounds[start], 0)]
+    largest_set = 0
+    dropped = 0
+
+    while border:
+        _, _, label = heapq.heappop(border)
+        cell = label_cells[label]
+        minutes, km = label_costs[label]
+        estimate = (minutes + time_bounds[cell], km + distance_bounds[cell])
+
+        # prune labels which cannot lead to a new pareto route
+        if any(dominates(route[:2], estimate) for route in routes):
+            continue
+        cell_labels = settled.setdefault(cell, [])
+        if any(dominates(other, (minutes, km)) for other in cell_labels):
+            continue
+        if max_labels_per_cell is not None and len(cell_labels) >= max_labels_per_cell and cell != end:
+            dropped += 1
+            continue
+        cell_labels.append((minutes, km))
+        largest_set = max(largest_set, len(cell_labels))
+
+        if cell == end:
+            routes.append((minutes, km, trace_labels(label_cells, label_parents, label)))
+            continue
+
+        for neighbor, step_cost in network.adjacency[cell]:
+            length = step_cost / PRECISION_FACTOR
+            new_costs = (minutes + length * (pace[cell] + pace[neighbor]) / 2, km + length * comparison.DISTANCE_SCALE_FACTOR)
+            if any(dominates(other, new_costs) for other in settled.get(neighbor, ())):
+                continue
+
+            label_cells.append(neighbor)
+            label_parents.append(label)
+            label_costs.append(new_costs)
+            heapq.heappush(border, (new_costs[0] + time_bounds[neighbor], new_costs[1] + distance_bounds[neighbor], len(label_cells) - 1))
+
+    stats = {
+        "created_labels": len(label_cells),
+        "settled_labels": sum(len(cell_labels) for cell_labels in settled.values()),
+        "dropped_labels": dropped,
+        "largest_label_set": largest_set,
+        "runtime": time.perf_counter() - start_time
+    }
+    return routes, stats
+
+def trace_labels(label_cells: list[int], label_parents: list[int], label: int) -> list[int]:
+    """
+    Follows the parent labels back to the start label.
+
+    Inputs:
+        label_cells: The cell of each label.
+        label_parents: The parent label of each label, -1 for the start label.
+        label: The label of the end cell.
+
+    Outputs:
+        path: The flat indices of the cells from start to end.
+    """
+    path = []
+    while label != -1:
+        path.append(label_cells[label])
+        label = label_parents[label]
+    return path[::-1]
+
+def pareto_options(start: NodePos, end: NodePos, networks: dict[str, np.ndarray] | None = None) -> tuple[list[dict], dict[str, dict]]:
+    """
+    Finds the pareto set of trips between two positions over time, price and emissions across all vehicles of rates_per_vehicle.json, each vehicle on the network of its vehicle type.
+
+    Inputs:
+        start: The start position.
+        end: The end position.
+        networks: Optional networks already loaded with comparison.load_networks.
+
+    Outputs:
+        options, stats: The non-dominated trips sorted by time, each a dictionary with the vehicle type, vehicle, minutes, km, rates and network breakdown, and the search statistics of each vehicle type.
+    """
+    rates_per_vehicle, _ = investement_calculator.load_vehicle_rates_and_units()
+    options = []
+    stats = {}
+
+    for vehicle_type in comparison.vehicle_networks.keys():
+        network = network_vulnerability.VulnerableNetwork(vehicle_type, networks)
+        start_cell = network_graph.cell_index(start.x, start.y, network.maze.shape)
+        end_cell = network_graph.cell_index(end.x, end.y, network.maze.shape)
+
+        routes, stats[vehicle_type] = pareto_search(network, start_cell, end_cell)
+        stats[vehicle_type]["routes"] = len(routes)
+
+        for minutes, km, path in routes:
+            breakdown = alternative_routes.route_details(network, vehicle_type, path)["breakdown"]
+            for vehicle, rates in rates_per_vehicle[vehicle_type].items():
+                option = {"vehicle_type": vehicle_type, "vehicle": vehicle, "minutes": round(minutes), "distance": round(km)}
+                option.update({name: rates[rate + investement_calculator.rate_suffix] * km for rate, name in pareto_rates.items()})
+                option["breakdown"] = breakdown
+                options.append(option)
+
+    # keep the trips no other trip beats in time, price and emissions at once
+    criteria = lambda option: (option["minutes"], option["price"], option["emissions"])
+    pareto_set = [
+        option for option in options
+        if not any(all(a <= b for a, b in zip(criteria(other), criteria(option))) and criteria(other) != criteria(option) for other in options)
+    ]
+    return sorted(pareto_set, key=criteria), stats
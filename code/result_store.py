@@ -0,0 +1,261 @@
+import sys
+import os
+import json
+import socket
+import numpy as np
+
+import file_cache
+from pathlib import Path
+from parameters import Jasonable
+
+ROOT = Path(sys.path[0]).parent
+store_dir = ROOT.joinpath("output-data", "results")
+
+# every writer appends to its own shard file, so parallel workers never share a file handle or a lock
+shard_prefix = "results-"
+shard_extension = ".jsonl"
+
+# typed columns of a stored result record
+# distance in km, time in minutes, rates in the units defined in rates_per_vehicle.json
+record_columns = {
+    "start_city": str,
+    "end_city": str,
+    "vehicle_type": str,
+    "vehicle": str,
+    "network": str,
+    "distance": float,
+    "minutes": int,
+    "emissions": float,
+    "price": float,
+    "energy": float
+}
+
+# calculated rate names of investement_calculator mapped to their record column
+rate_columns = {"Emissions": "emissions", "Price": "price", "Energy": "energy"}
+
+class ResultRecord(Jasonable):
+    """
+    A single typed result of a trip analysis: one vehicle travelling between two cities on its time efficient network.
+    Inherits from Jasonable to make this class serializable in a .json file.
+
+    Attributes:
+        start_city (str): The name of the departure city.
+        end_city (str): The name of the arrival city.
+        vehicle_type (str): The vehicle sub category, either 'train' or 'car'.
+        vehicle (str): The name of the vehicle (e.g. 'Tesla Model 3').
+        network (str): The title of the time efficient network used (e.g. 'Highways').
+        distance (float): The real distance of the route in km.
+        minutes (int): The travel time in minutes.
+        emissions (float): The emissions of the trip.
+        price (float): The price of the trip.
+        energy (float): The energy consumption of the trip.
+
+    Methods:
+        __init__: Initializes a new instance of ResultRecord, converting every value to its column type.
+        from_dict: Creates a ResultRecord from a dictionary with the column names as keys.
+    """
+    def __init__(self, start_city: str, end_city: str, vehicle_type: str, vehicle: str, network: str, distance: float, minutes: int, emissions: float, price: float, energy: float) -> None:
+        """
+        Initializes a new ResultRecord instance.
+
+        Inputs:
+            start_city: The name of the departure city.
+            end_city: The name of the arrival city.
+            vehicle_type: The vehicle sub category, either 'train' or 'car'.
+            vehicle: The name of the vehicle.
+            network: The title of the time efficient network.
+            distance: The real distance of the route in km.
+            minutes: The travel time in minutes.
+            emissions: The emissions of the trip.
+            price: The price of the trip.
+            energy: The energy consumption of the trip.
+        """
+        self.start_city = str(start_city)
+        self.end_city = str(end_city)
+        self.vehicle_type = str(vehicle_type)
+        self.vehicle = str(vehicle)
+        self.network = str(network)
+        self.distance = float(distance)
+        self.minutes = int(minutes)
+        self.emissions = float(emissions)
+        self.price = float(price)
+        self.energy = float(energy)
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """
+        Creates a ResultRecord from a dictionary, e.g. a line read back from the store.
+
+        Inputs:
+            values: A dictionary containing one entry for each name of record_columns.
+
+        Outputs:
+            _: The ResultRecord holding the typed values.
+        """
+        try:
+            return cls(*[values[column] for column in record_columns])
+        except KeyError as e:
+            raise KeyError(f"The result record is missing the column {e}!")
+
+class ResultStore():
+    """
+    Append-only store of ResultRecords saved as JSON Lines.
+    Each writer (process) appends whole batches to its own shard file, therefore parallel workers never contend for a lock.
+    Queries read all shards of the store directory.
+
+    Attributes:
+        directory (Path): The directory containing the shard files.
+        writer_id (str): The identifier of this writer, used in the name of its shard file.
+
+    Methods:
+        __init__: Initializes a new instance of ResultStore.
+        shard_path: Returns the path of the shard file of this writer.
+        append: Appends a batch of records to the shard file of this writer.
+        replace: Replaces the shard file of this writer with a batch of records.
+        records: Iterates over all records of all shards.
+        query: Returns all records matching the given city pair, vehicle and network.
+        columns: Returns the matching records as typed numpy columns.
+    """
+    def __init__(self, directory: Path | str = store_dir, writer_id: str | None = None) -> None:
+        """
+        Initializes a new ResultStore instance and creates the store directory if needed.
+
+        Inputs:
+            directory: The directory containing the shard files.
+            writer_id: The identifier of this writer. Defaults to the host name and the process id, which is unique for parallel workers.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        if writer_id is None:
+            writer_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.writer_id = writer_id
+
+    def shard_path(self) -> Path:
+        """
+        Returns the path of the shard file this writer appends to.
+
+        Outputs:
+            _: The path of the shard file.
+        """
+        return self.directory.joinpath(shard_prefix + self.writer_id + shard_extension)
+
+    def append(self, records: list[ResultRecord]) -> None:
+        """
+        Appends a batch of records to the shard file of this writer.
+        The whole batch is written with a single write call, so a reader never sees half of a batch of a finished writer.
+
+        Inputs:
+            records: The records to be stored.
+        """
+        if not records:
+            return
+
+        batch = "".join(json.dumps(record.jsonable()) + "\n" for record in records)
+
+        with open(self.shard_path(), 'a') as f:
+            f.write(batch)
+
+    def replace(self, records: list[ResultRecord]) -> None:
+        """
+        Replaces the shard file of this writer with a batch of records at once, e.g. the merged results of a batch job, which may be merged again without duplicating them.
+
+        Inputs:
+            records: The records to be stored.
+        """
+        batch = "".join(json.dumps(record.jsonable()) + "\n" for record in records)
+        file_cache.atomic_write(self.shard_path(), lambda f: f.write(batch.encode()))
+
+    def records(self):
+        """
+        Iterates over all records of all shards of the store.
+
+        Outputs:
+            _: A generator yielding each stored ResultRecord.
+        """
+        for path in sorted(self.directory.glob(shard_prefix + "*" + shard_extension)):
+            with open(path, 'r') as f:
+                for line in f:
+                    # skip empty lines and the incomplete last line of a writer that crashed
+                    if not line.endswith("\n") or not line.strip():
+                        continue
+                    yield ResultRecord.from_dict(json.loads(line))
+
+    def query(self, start_city: str | None = None, end_city: str | None = None, vehicle: str | None = None, network: str | None = None) -> list[ResultRecord]:
+        """
+        Returns all records matching the given filters. A filter set to None matches every value.
+
+        Inputs:
+            start_city: The name of the departure city.
+            end_city: The name of the arrival city.
+            vehicle: The name of the vehicle.
+            network: The title of the network.
+
+        Outputs:
+            _: A list of the matching records in the order they were stored.
+        """
+        filters = {"start_city": start_city, "end_city": end_city, "vehicle": vehicle, "network": network}
+        filters = {key: value for key, value in filters.items() if value is not None}
+
+        return [record for record in self.records() if all(getattr(record, key) == value for key, value in filters.items())]
+
+    def columns(self, **filters) -> dict[str, np.ndarray]:
+        """
+        Returns the matching records as typed columns ready for aggregation.
+
+        Inputs:
+            filters: The same keyword filters accepted by query.
+
+        Outputs:
+            _: A dictionary mapping each column name to a numpy array.
+        """
+        return records_to_columns(self.query(**filters))
+
+def records_to_columns(records: list[ResultRecord]) -> dict[str, np.ndarray]:
+    """
+    Converts a list of records to one numpy array per column. Numeric columns keep their type, text columns become object arrays.
+
+    Inputs:
+        records: The records to convert.
+
+    Outputs:
+        _: A dictionary mapping each column name to a numpy array.
+    """
+    columns = {}
+    for column, column_type in record_columns.items():
+        dtype = column_type if column_type in (int, float) else object
+        columns[column] = np.array([getattr(record, column) for record in records], dtype=dtype)
+    return columns
+
+def build_comparison_records(start_city: str, end_city: str, rail_network: str, rail_distance: int, rail_minutes: int, car_network: str, car_distance: int, car_minutes: int, calculated_rates: dict[str, dict[str, float]], rates_per_vehicle: dict[str, dict[str, dict[str, float]]]) -> list[ResultRecord]:
+    """
+    Builds one record per vehicle from the results of a train car comparison.
+    Must be called with the numeric calculated rates, before they are converted to strings for the JSON export.
+
+    Inputs:
+        start_city - The name of the departure city.
+        end_city - The name of the arrival city.
+        rail_network - The title of the time efficient rail network.
+        rail_distance - The distance covered by train in km.
+        rail_minutes - The total travel time by train in minutes.
+        car_network - The title of the time efficient car network.
+        car_distance - The distance covered by car in km.
+        car_minutes - The total travel time by car in minutes.
+        calculated_rates - The calculated rates for each vehicle, as returned by investement_calculator.calculate_rates.
+        rates_per_vehicle - The rates per km for each vehicle type and vehicle.
+
+    Outputs:
+        records - The list of records, one per vehicle.
+    """
+    # local import to avoid loading matplotlib in every worker that only stores results
+    from investement_calculator import train_vehicles, car_vehicles
+
+    trips = {train_vehicles: (rail_network, rail_distance, rail_minutes), car_vehicles: (car_network, car_distance, car_minutes)}
+    records = []
+
+    for vehicle_type, (network, distance, minutes) in trips.items():
+        for vehicle in rates_per_vehicle[vehicle_type].keys():
+            rates = {column: calculated_rates[vehicle].get(rate_name, float("nan")) for rate_name, column in rate_columns.items()}
+            records.append(ResultRecord(start_city, end_city, vehicle_type, vehicle, network, distance, minutes, **rates))
+
+    return records
@@ -0,0 +1,347 @@
+import json
+import asyncio
+import urllib.parse
+import urllib.request
+import urllib.error
+
+from concurrent.futures import ThreadPoolExecutor
+
+import train_car_comparison as comparison
+import investement_calculator
+import distance_fields
+import astar_lib
+from parameters import NodePos
+
+# the service only listens on the local machine
+service_host = "127.0.0.1"
+service_port = 8765
+
+# analysis function of each vehicle type, both accept the warm networks
+vehicle_analyses = {
+    investement_calculator.train_vehicles: comparison.rail_analysis,
+    investement_calculator.car_vehicles: comparison.car_analysis
+}
+
+# http status lines used by the service
+status_lines = {200: "200 OK", 400: "400 Bad Request", 404: "404 Not Found", 405: "405 Method Not Allowed", 500: "500 Internal Server Error"}
+
+class RouteService():
+    """
+    Long-running route query service keeping the networks, the cities and the vehicle rates in memory.
+    The blocking A* searches run in a thread pool (ctypes releases the GIL during run_astar), so the event loop keeps accepting requests.
+    Identical queries share one computation: a query arriving while the same route is computed awaits the running computation, later queries reuse its result.
+
+    Attributes:
+        cities (dict): The city names mapped to their NodePos objects.
+        networks (dict): The loaded networks as returned by comparison.load_networks.
+        fields (dict): The persisted DistanceFields of the cities on each network, key: maze file name.
+        rates_per_vehicle (dict): The rates per km of each vehicle.
+        rate_units (dict): The unit of each rate.
+        executor (ThreadPoolExecutor): The thread pool running the searches.
+        routes (dict): The running or finished route computations, key: (vehicle type, start city, end city), value: asyncio.Future.
+        computations (int): The number of route computations started.
+        coalesced_queries (int): The number of route queries answered by an already started computation.
+        port (int): The port the server is bound to, None while it is not serving.
+
+    Methods:
+        __init__: Loads the networks and the parameters once.
+        route: Returns the time efficient route of a vehicle type between two cities.
+        compare: Compares the train and the car route between two cities including their rates.
+        matrix: Returns the travel times of a vehicle type between all pairs of cities.
+        distance: Looks up the exact distance from a city to another city or to any cell of a network.
+        stats: Returns the counters of the service.
+        handle: Answers a parsed HTTP request.
+    """
+    def __init__(self, cities: dict[str, NodePos], workers: int | None = None) -> None:
+        """
+        Initializes a new RouteService instance.
+
+        Inputs:
+            cities: A dictionary mapping city names to their NodePos objects.
+            workers: The number of threads running searches. Defaults to the ThreadPoolExecutor default.
+        """
+        self.cities = cities
+        self.networks = comparison.load_networks()
+        self.fields = {maze_file: distance_fields.DistanceFields(maze_file, cities) for maze_file in self.networks}
+        self.rates_per_vehicle, self.rate_units = investement_calculator.load_vehicle_rates_and_units()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        self.routes = {}
+        self.computations = 0
+        self.coalesced_queries = 0
+        self.port = None
+
+    def analyze(self, vehicle_type: str, start_name: str, end_name: str) -> dict:
+        """
+        Runs the blocking analysis of a vehicle type on the warm networks, called in the thread pool.
+
+        Inputs:
+            vehicle_type: The vehicle type, 'train' or 'car'.
+            start_name: The name of the departure city.
+            end_name: The name of the arrival city.
+
+        Outputs:
+            _: The route as a JSON serializable dictionary.
+        """
+        start, end = comparison.destinations(start_name, end_name, self.cities)
+        title, _, distance, hours, minutes, _ = vehicle_analyses[vehicle_type](start, end, show_plot=False, networks=self.networks)
+
+        return {"start_city": start_name, "end_city": end_name, "vehicle_type": vehicle_type, "network": title, "distance": int(distance), "minutes": hours * 60 + minutes}
+
+    async def route(self, vehicle_type: str, start_name: str, end_name: str) -> dict:
+        """
+        Returns the time efficient route of a vehicle type between two cities, computing it at most once.
+
+        Inputs:
+            vehicle_type: The vehicle type, 'train' or 'car'.
+            start_name: The name of the departure city.
+            end_name: The name of the arrival city.
+
+        Outputs:
+            _: The route as a dictionary with the keys start_city, end_city, vehicle_type, network, distance (km) and minutes.
+        """
+        if vehicle_type not in vehicle_analyses:
+            raise ValueError(f'The vehicle type "{vehicle_type}" does not exist!')
+        comparison.destinations(start_name, end_name, self.cities)
+
+        key = (vehicle_type, start_name, end_name)
+        if key in self.routes:
+            self.coalesced_queries += 1
+        else:
+            self.computations += 1
+            self.routes[key] = asyncio.get_running_loop().run_in_executor(self.executor, self.analyze, *key)
+
+        computation = self.routes[key]
+        try:
+            # shielded, so a cancelled query does not cancel the computation other queries are waiting for
+            return await asyncio.shield(computation)
+        except Exception:
+            # failed computations are not kept, the next query tries again
+            if self.routes.get(key) is computation:
+                del self.routes[key]
+            raise
+
+    async def compare(self, start_name: str, end_name: str) -> dict:
+        """
+        Compares the train and the car route between two cities, like the Train vs. Car Comparison mode.
+
+        Inputs:
+            start_name: The name of the departure city.
+            end_name: The name of the arrival city.
+
+        Outputs:
+            _: A dictionary with the train and car routes, the faster vehicle type and the calculated rates of each vehicle.
+        """
+        train_route, car_route = await asyncio.gather(
+            self.route(investement_calculator.train_vehicles, start_name, end_name),
+            self.route(investement_calculator.car_vehicles, start_name, end_name)
+        )
+        rates = investement_calculator.calculate_rates(self.rates_per_vehicle, train_route["distance"], car_route["distance"])
+        faster = investement_calculator.train_vehicles if train_route["minutes"] <= car_route["minutes"] else investement_calculator.car_vehicles
+
+        return {"train": train_route, "car": car_route, "faster": faster, "rates": rates, "rate_units": self.rate_units}
+
+    async def matrix(self, vehicle_type: str) -> dict:
+        """
+        Returns the travel times and distances of a vehicle type between all pairs of cities. The pairs are computed concurrently.
+
+        Inputs:
+            vehicle_type: The vehicle type, 'train' or 'car'.
+
+        Outputs:
+            _: A dictionary with the city names and the symmetric minutes and distance matrices in the order of the city names.
+        """
+        pairs = comparison.city_pairs(self.cities)
+        names = list(dict.fromkeys(name for pair in pairs for name in pair))
+        routes = await asyncio.gather(*[self.route(vehicle_type, start_name, end_name) for start_name, end_name in pairs])
+
+        minutes = [[0] * len(names) for _ in names]
+        distances = [[0] * len(names) for _ in names]
+        for (start_name, end_name), route in zip(pairs, routes):
+            i, j = names.index(start_name), names.index(end_name)
+            minutes[i][j] = minutes[j][i] = route["minutes"]
+            distances[i][j] = distances[j][i] = route["distance"]
+
+        return {"vehicle_type": vehicle_type, "cities": names, "minutes": minutes, "distance": distances}
+
+    def distance(self, network: str, start_name: str, end_name: str | None = None, x: int | None = None, y: int | None = None) -> dict:
+        """
+        Looks up the exact shortest distance on a single network in the distance field of the start city, no search is needed.
+
+        Inputs:
+            network: The maze file name of the network, e.g. 'railnetwork.csv'.
+            start_name: The name of the departure city.
+            end_name: The name of the arrival city. If None, the cell x, y is the target.
+            x: The x-coordinate of the target cell.
+            y: The y-coordinate of the target cell.
+
+        Outputs:
+            _: A dictionary with the target, the distance in maze units and in km (None if the target is not reachable) and the number of path cells.
+        """
+        if network not in self.fields:
+            raise ValueError(f'The network "{network}" does not exist!')
+        fields = self.fields[network]
+
+        if end_name is not None:
+            end = comparison.check_destination(end_name, self.cities)
+            x, y = end.x, end.y
+        if x is None or y is None:
+            raise ValueError("Either an end city or the coordinates x and y of the target are required!")
+        x, y = int(x), int(y)
+        if not astar_lib.is_in_bounds(NodePos(x, y), fields.maze):
+            raise ValueError(f"The cell ({x}, {y}) lies outside of the network!")
+
+        maze_distance = fields.distance(start_name, x, y)
+        reachable = maze_distance != float("inf")
+
+        return {
+            "network": network, "start_city": start_name, "end_city": end_name, "x": x, "y": y,
+            "maze_distance": maze_distance if reachable else None,
+            "distance": round(maze_distance * comparison.DISTANCE_SCALE_FACTOR) if reachable else None,
+            "path_cells": len(fields.path(start_name, x, y))
+        }
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the service.
+
+        Outputs:
+            _: A dictionary with the number of computations, coalesced queries and kept routes.
+        """
+        return {"computations": self.computations, "coalesced_queries": self.coalesced_queries, "routes": len(self.routes)}
+
+    async def handle(self, method: str, target: str) -> tuple[int, dict]:
+        """
+        Answers a parsed HTTP request.
+
+        Inputs:
+            method: The HTTP method, only GET is supported.
+            target: The request target including the query string, e.g. '/route?vehicle=train&start=Bern&end=Geneva'.
+
+        Outputs:
+            status, body: The HTTP status code and the JSON serializable answer.
+        """
+        if method != "GET":
+            return 405, {"error": f"The method {method} is not supported!"}
+
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        try:
+            if url.path == "/route":
+                return 200, await self.route(query["vehicle"], query["start"], query["end"])
+            if url.path == "/compare":
+                return 200, await self.compare(query["start"], query["end"])
+            if url.path == "/matrix":
+                return 200, await self.matrix(query["vehicle"])
+            if url.path == "/distance":
+                return 200, self.distance(query["network"], query["start"], query.get("end"), query.get("x"), query.get("y"))
+            if url.path == "/stats":
+                return 200, self.stats()
+        except KeyError as e:
+            # missing query parameters and unknown cities
+            return 400, {"error": f"Invalid query: {e.args[0]}"}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+        return 404, {"error": f"The endpoint {url.path} does not exist!"}
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Reads one HTTP request from a connection, answers it with JSON and closes the connection.
+
+        Inputs:
+            reader: The stream of the request.
+            writer: The stream of the response.
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # skip the headers, the service only answers GET requests without a body
+            while (await reader.readline()).strip():
+                pass
+
+            if len(request_line) != 3:
+                status, body = 400, {"error": "Malformed request line!"}
+            else:
+                status, body = await self.handle(request_line[0], request_line[1])
+
+            payload = json.dumps(body).encode()
+            header = f"HTTP/1.1 {status_lines[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+            writer.write(header.encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        """
+        Stops the thread pool after the running searches finished.
+        """
+        self.executor.shutdown(wait=True)
+
+async def serve(service: RouteService, host: str = service_host, port: int = service_port, started: asyncio.Event | None = None) -> None:
+    """
+    Runs the HTTP server of a route service until it gets cancelled.
+
+    Inputs:
+        service: The route service answering the requests.
+        host: The address to listen on, the local machine by default.
+        port: The port to listen on, 0 picks a free port.
+        started: Optional event set as soon as the server accepts connections. The bound port is stored in service.port.
+    """
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    service.port = server.sockets[0].getsockname()[1]
+
+    if started is not None:
+        started.set()
+
+    async with server:
+        await server.serve_forever()
+
+def run_service(cities: dict[str, NodePos], host: str = service_host, port: int = service_port) -> None:
+    """
+    Loads the networks once and answers route queries until the user presses Ctrl+C.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects.
+        host: The address to listen on.
+        port: The port to listen on.
+    """
+    service = RouteService(cities)
+    print(f"Route service listening on http://{host}:{port} (endpoints: /route, /compare, /matrix, /distance, /stats), stop with Ctrl+C")
+
+    try:
+        asyncio.run(serve(service, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+""" client """
+
+def query(endpoint: str, host: str = service_host, port: int = service_port, **params) -> dict:
+    """
+    Sends a query to a running route service, e.g. query("route", vehicle="train", start="Bern", end="Geneva").
+
+    Inputs:
+        endpoint: The name of the endpoint: 'route', 'compare', 'matrix', 'distance' or 'stats'.
+        host: The address of the service.
+        port: The port of the service.
+        params: The query parameters of the endpoint.
+
+    Outputs:
+        _: The decoded JSON answer.
+
+    Raises:
+        ValueError: If the service answered with an error.
+    """
+    url = f"http://{host}:{port}/{endpoint}?{urllib.parse.urlencode(params)}"
+
+    try:
+        with urllib.request.urlopen(url) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get("error", str(e)))
@@ -0,0 +1,217 @@
+import weakref
+import tracemalloc
+import multiprocessing
+import numpy as np
+
+from multiprocessing import shared_memory
+
+import astar_lib
+import network_graph
+
+# https://docs.python.org/3/library/multiprocessing.shared_memory.html
+
+# shared memory blocks attached by this process, kept alive as long as the views on them are used
+# key: name of the network, value: (shared memory block, read-only view)
+attached_networks = {}
+
+# the arrays of a published adjacency, named "<network name> <part>"
+adjacency_parts = ["indptr", "indices", "costs"]
+
+def release_blocks(blocks: list[shared_memory.SharedMemory]) -> None:
+    """
+    Closes and removes shared memory blocks. Blocks that were already removed are skipped, so this can be called several times.
+
+    Inputs:
+        blocks: The shared memory blocks created by this process.
+    """
+    for block in blocks:
+        try:
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+class SharedNetworks():
+    """
+    Publishes loaded networks once into shared memory, so worker processes can attach read-only numpy views instead of loading or receiving a copy of every grid.
+    The blocks are removed deterministically: when leaving the with-block (also after an exception), when calling close, or at the latest when the publishing process exits.
+    If the publishing process gets killed, the resource tracker of multiprocessing removes the blocks it left behind.
+
+    Attributes:
+        blocks (list): The shared memory blocks created by this process.
+        descriptor (dict): The picklable description of the networks, passed to the workers.
+
+    Methods:
+        __init__: Initializes a new instance of SharedNetworks.
+        publish: Copies an array into a new shared memory block.
+        publish_mazes: Loads maze files and publishes them.
+        publish_adjacency: Publishes the adjacency of a network as compressed sparse row arrays.
+        close: Removes all shared memory blocks.
+    """
+    def __init__(self) -> None:
+        """
+        Initializes a new SharedNetworks instance without any networks.
+        """
+        self.blocks = []
+        self.descriptor = {}
+        # runs at garbage collection or at interpreter exit, whatever comes first
+        self.finalizer = weakref.finalize(self, release_blocks, self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def publish(self, name: str, array: np.ndarray) -> np.ndarray:
+        """
+        Copies an array into a new shared memory block.
+
+        Inputs:
+            name: The name of the network, e.g. the maze file name.
+            array: The array to publish.
+
+        Outputs:
+            _: A numpy view on the shared memory block.
+        """
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.blocks.append(block)
+
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+
+        self.descriptor[name] = (block.name, array.shape, array.dtype.str)
+        return view
+
+    def publish_mazes(self, maze_files: list[str]) -> None:
+        """
+        Loads maze files with astar_lib.load_maze and publishes them under their file name.
+
+        Inputs:
+            maze_files: The file names of the mazes in the maze folder.
+        """
+        for maze_file in maze_files:
+            self.publish(maze_file, astar_lib.load_maze(maze_file))
+
+    def publish_adjacency(self, name: str, maze: np.ndarray) -> None:
+        """
+        Builds the adjacency of a network as compressed sparse row arrays and publishes them, so workers search on it without building their own adjacency list.
+
+        Inputs:
+            name: The name of the network, its arrays are published as "<name> indptr", "<name> indices" and "<name> costs".
+            maze: The maze array of the network.
+        """
+        for part, array in zip(adjacency_parts, network_graph.build_csr_adjacency(network_graph.walkable_mask(maze))):
+            self.publish(f"{name} {part}", array)
+
+    def close(self) -> None:
+        """
+        Removes all shared memory blocks. The views of attached workers stay valid until they are closed, but no new worker can attach.
+        """
+        self.finalizer()
+
+def attach_block(block_name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches an existing shared memory block without taking over the responsibility to remove it.
+
+    Inputs:
+        block_name: The name of the shared memory block.
+
+    Outputs:
+        _: The attached shared memory block.
+    """
+    try:
+        # Python 3.13+
+        return shared_memory.SharedMemory(name=block_name, track=False)
+    except TypeError:
+        # older versions register the block again at the resource tracker, which worker processes share with the publishing process
+        # https://github.com/python/cpython/issues/82300
+        return shared_memory.SharedMemory(name=block_name)
+
+def attach_networks(descriptor: dict) -> dict[str, np.ndarray]:
+    """
+    Attaches read-only views on the networks published by SharedNetworks. Networks already attached by this process are reused.
+
+    Inputs:
+        descriptor: The descriptor attribute of a SharedNetworks instance.
+
+    Outputs:
+        networks: A dictionary mapping each network name to its read-only numpy view.
+    """
+    networks = {}
+
+    for name, (block_name, shape, dtype) in descriptor.items():
+        if name not in attached_networks or attached_networks[name][0].name != block_name:
+            block = attach_block(block_name)
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            view.flags.writeable = False
+            attached_networks[name] = (block, view)
+
+        networks[name] = attached_networks[name][1]
+
+    return networks
+
+def attached_adjacency(networks: dict[str, np.ndarray], name: str) -> network_graph.CsrAdjacency:
+    """
+    Returns the adjacency of a network published with SharedNetworks.publish_adjacency.
+
+    Inputs:
+        networks: The attached networks as returned by attach_networks.
+        name: The name of the network.
+
+    Outputs:
+        _: The adjacency reading the shared arrays.
+    """
+    return network_graph.CsrAdjacency(*(networks[f"{name} {part}"] for part in adjacency_parts))
+
+def detach_networks() -> None:
+    """
+    Releases all views and closes the shared memory blocks attached by this process.
+    """
+    for block, _ in attached_networks.values():
+        block.close()
+    attached_networks.clear()
+
+""" memory measurement """
+
+def measure_worker(initializer, initargs: tuple, results) -> None:
+    """
+    Runs the initializer of a worker pool in a worker process and measures the memory it allocates.
+    numpy reports its allocations to tracemalloc, the shared memory blocks are not allocated by the worker and therefore not counted.
+
+    Inputs:
+        initializer: The module level function preparing a worker, e.g. network_vulnerability.init_worker.
+        initargs: The arguments of the initializer.
+        results: The queue receiving the peak number of bytes the worker allocated.
+    """
+    tracemalloc.start()
+    initializer(*initargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    detach_networks()
+    results.put(peak)
+
+def measure_memory(initializer, initargs: tuple, workers: int) -> int:
+    """
+    Measures the total memory the worker processes allocate in their initializer, the networks they attach have to be published by the caller.
+
+    Inputs:
+        initializer: The module level function preparing a worker.
+        initargs: The arguments of the initializer.
+        workers: The number of worker processes.
+
+    Outputs:
+        _: The sum of the peak allocations of all workers in bytes.
+    """
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=measure_worker, args=(initializer, initargs, results)) for _ in range(workers)]
+
+    for process in processes:
+        process.start()
+    peaks = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    return sum(peaks)
@@ -0,0 +1,296 @@
+import heapq
+import tracemalloc
+import numpy as np
+
+from collections import OrderedDict
+from ctypes import sizeof
+
+import astar_lib
+import file_cache
+from network_graph import STRAIGHT_COST, DIAGONAL_COST, PRECISION_FACTOR
+from parameters import NodePos
+
+# the tiles of a maze are saved in a folder beside the maze, e.g. maze/railnetwork-tiles/
+tiles_suffix = "-tiles"
+tiles_file = "tiles.bin"
+
+# side length of a square tile in cells, a tile of 64 x 64 cells takes 4 kB
+default_tile_size = 64
+# number of tiles kept mapped at the same time
+default_cache_tiles = 16
+
+# the 8 neighbors of a cell as (x offset, y offset, cost)
+neighbor_steps = [(dx, dy, DIAGONAL_COST if dx and dy else STRAIGHT_COST) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+
+def tiles_dir(maze_file: str):
+    """
+    Returns the folder containing the tiles of a maze.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+
+    Outputs:
+        _: The path of the folder beside the maze file.
+    """
+    return astar_lib.maze_dir.joinpath(maze_file.rsplit(".", 1)[0] + tiles_suffix)
+
+""" tiled storage """
+
+def write_tiles(maze_file: str, tile_size: int = default_tile_size) -> dict:
+    """
+    Converts a maze CSV file into tiles without loading the whole maze: only one band of tile_size rows is in memory at a time.
+    The tiles are stored one after another in row-major order, each tile as tile_size x tile_size bytes (1 walkable, 0 obstacle), tiles at the border are padded with obstacles.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+        tile_size: The side length of a tile in cells.
+
+    Outputs:
+        manifest: The description of the tiles, also saved in the manifest of the tiles folder.
+    """
+    directory = tiles_dir(maze_file)
+    source = astar_lib.maze_dir.joinpath(maze_file)
+    shape = {}
+
+    def write_bands(f) -> None:
+        band = []
+        height = 0
+        width = 0
+
+        def write_band() -> None:
+            padded_width = -(-width // tile_size) * tile_size
+            cells = np.zeros((tile_size, padded_width), dtype=np.uint8)
+            cells[:len(band), :width] = np.array(band, dtype=np.uint8)
+            # (rows, tile columns, columns) -> (tile columns, rows, columns), so each tile is contiguous
+            f.write(cells.reshape(tile_size, -1, tile_size).transpose(1, 0, 2).tobytes())
+            band.clear()
+
+        with open(source, 'r') as csv_file:
+            for line in csv_file:
+                if not line.strip():
+                    continue
+                row = [value.strip() not in ("", "0") for value in line.split(",")]
+                width = width or len(row)
+                band.append(row)
+                height += 1
+                if len(band) == tile_size:
+                    write_band()
+        if band:
+            write_band()
+
+        shape.update(height=height, width=width)
+
+    file_cache.atomic_write(directory.joinpath(tiles_file), write_bands)
+
+    manifest = {"maze": file_cache.file_digest(source), "height": shape["height"], "width": shape["width"], "tile_size": tile_size}
+    file_cache.write_manifest(directory, manifest)
+    return manifest
+
+class TiledMaze():
+    """
+    A maze stored as tiles, which are memory mapped on demand. At most cache_tiles tiles are mapped at the same time, the least recently used tile gets unmapped first.
+    Therefore the memory used by the maze is bounded by the tile cache and not by the size of the maze.
+
+    Attributes:
+        maze_file (str): The file name of the maze.
+        height (int): The number of rows of the maze.
+        width (int): The number of columns of the maze.
+        tile_size (int): The side length of a tile.
+        tile_columns (int): The number of tiles per row of tiles.
+        cache_tiles (int): The highest number of mapped tiles.
+        tiles (OrderedDict): The mapped tiles, key: (tile row, tile column), ordered from the least to the most recently used.
+        loads (int): The number of tiles mapped so far.
+        evictions (int): The number of tiles unmapped to respect the cache size.
+
+    Methods:
+        __init__: Opens the tiles of a maze, converting the maze first if needed.
+        tile: Returns a tile, mapping it if it is not cached.
+        is_walkable: Checks if a cell lies inside of the maze and is walkable.
+        tile_bytes: Returns the size of a tile in bytes.
+    """
+    def __init__(self, maze_file: str, cache_tiles: int = default_cache_tiles, tile_size: int = default_tile_size) -> None:
+        """
+        Initializes a new TiledMaze instance. The tiles are rewritten if the maze changed or a different tile size is requested.
+
+        Inputs:
+            maze_file: The file name of the maze in the maze folder.
+            cache_tiles: The highest number of tiles mapped at the same time.
+            tile_size: The side length of a tile in cells.
+        """
+        directory = tiles_dir(maze_file)
+        self.path = directory.joinpath(tiles_file)
+
+        manifest = file_cache.read_manifest(directory)
+        maze_digest = file_cache.file_digest(astar_lib.maze_dir.joinpath(maze_file))
+        if manifest.get("maze") != maze_digest or manifest.get("tile_size") != tile_size or not self.path.exists():
+            manifest = write_tiles(maze_file, tile_size)
+
+        self.maze_file = maze_file
+        self.height = manifest["height"]
+        self.width = manifest["width"]
+        self.tile_size = tile_size
+        self.tile_columns = -(-self.width // tile_size)
+
+        self.cache_tiles = cache_tiles
+        self.tiles = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    def tile_bytes(self) -> int:
+        """
+        Returns the size of a single tile.
+
+        Outputs:
+            _: The number of bytes of a tile.
+        """
+        return self.tile_size * self.tile_size
+
+    def tile(self, tile_row: int, tile_column: int) -> np.ndarray:
+        """
+        Returns a tile, mapping it and unmapping the least recently used tile if it is not cached.
+
+        Inputs:
+            tile_row: The row of the tile.
+            tile_column: The column of the tile.
+
+        Outputs:
+            _: The read-only tile_size x tile_size array of the tile.
+        """
+        key = (tile_row, tile_column)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        # https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
+        offset = (tile_row * self.tile_columns + tile_column) * self.tile_bytes()
+        self.tiles[key] = np.memmap(self.path, dtype=np.uint8, mode='r', offset=offset, shape=(self.tile_size, self.tile_size))
+        self.loads += 1
+
+        if len(self.tiles) > self.cache_tiles:
+            # dropping the last reference unmaps the tile
+            self.tiles.popitem(last=False)
+            self.evictions += 1
+
+        return self.tiles[key]
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        """
+        Checks if a cell lies inside of the maze and is walkable.
+
+        Inputs:
+            x: The x-coordinate of the cell.
+            y: The y-coordinate of the cell.
+
+        Outputs:
+            _: True if the cell is walkable.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        tile_row, row = divmod(y, self.tile_size)
+        tile_column, column = divmod(x, self.tile_size)
+        return bool(self.tile(tile_row, tile_column)[row, column])
+
+""" search """
+
+def octile_cost(x: int, y: int, end_x: int, end_y: int) -> int:
+    """
+    Calculates the cost of the cheapest path between two cells when there are no obstacles, which never overestimates the real cost.
+
+    Inputs:
+        x, y: The coordinates of the first cell.
+        end_x, end_y: The coordinates of the second cell.
+
+    Outputs:
+        _: The octile distance with the integer step costs.
+    """
+    dx = abs(x - end_x)
+    dy = abs(y - end_y)
+    return STRAIGHT_COST * max(dx, dy) + (DIAGONAL_COST - STRAIGHT_COST) * min(dx, dy)
+
+def tiled_astar(maze: TiledMaze, start: NodePos, end: NodePos) -> tuple[float, list[tuple[int, int]]]:
+    """
+    Finds the shortest path with A* on a tiled maze. The tiles are mapped when the search reaches them, and the search state is only stored for the cells it reached.
+
+    Inputs:
+        maze: The tiled maze.
+        start: The start position.
+        end: The end position.
+
+    Outputs:
+        distance, path: The distance in maze units like returned by py_run_astar and the (x, y) coordinates of the path from start to end.
+
+    Raises:
+        Exception: If the start or end is not walkable or no path exists.
+    """
+    for pos, pos_name in [(start, "Start"), (end, "End")]:
+        if not maze.is_walkable(pos.x, pos.y):
+            raise Exception(f"The {pos_name} node at x={pos.x}, y={pos.y} has to be a walkable cell inside of the maze!")
+
+    # cells are keyed by their flat index, ints take less memory than coordinate tuples
+    width = maze.width
+    start_cell = start.y * width + start.x
+    end_cell = end.y * width + end.x
+
+    # sparse search state, only the reached cells get an entry
+    g_costs = {start_cell: 0}
+    parents = {start_cell: -1}
+    visited = set()
+    border = [(octile_cost(start.x, start.y, end.x, end.y), 0, start_cell)]
+
+    while border:
+        _, g_cost, cell = heapq.heappop(border)
+        if cell in visited:
+            continue
+        if cell == end_cell:
+            path = []
+            while cell != -1:
+                path.append(divmod(cell, width)[::-1])
+                cell = parents[cell]
+            return g_cost / PRECISION_FACTOR, path[::-1]
+        visited.add(cell)
+
+        y, x = divmod(cell, width)
+        for dx, dy, step_cost in neighbor_steps:
+            neighbor = cell + dy * width + dx
+            if neighbor in visited or not maze.is_walkable(x + dx, y + dy):
+                continue
+            new_cost = g_cost + step_cost
+            if new_cost < g_costs.get(neighbor, new_cost + 1):
+                g_costs[neighbor] = new_cost
+                parents[neighbor] = cell
+                heapq.heappush(border, (new_cost + octile_cost(x + dx, y + dy, end.x, end.y), new_cost, neighbor))
+
+    raise Exception("No valid path found!")
+
+def measure_search(maze_file: str, start: NodePos, end: NodePos, cache_tiles: int = default_cache_tiles, tile_size: int = default_tile_size) -> dict:
+    """
+    Runs a tiled search and measures its memory, compared to loading the whole maze and its Node array for py_run_astar.
+
+    Inputs:
+        maze_file: The file name of the maze in the maze folder.
+        start: The start position.
+        end: The end position.
+        cache_tiles: The highest number of tiles mapped at the same time.
+        tile_size: The side length of a tile in cells.
+
+    Outputs:
+        _: A dictionary with the distance, the number of path cells, tile loads and evictions, the bound of the mapped tiles, the peak of the search state (bytes, measured with tracemalloc) and the size of the full maze with its Node array (bytes).
+    """
+    maze = TiledMaze(maze_file, cache_tiles, tile_size)
+
+    tracemalloc.start()
+    distance, path = tiled_astar(maze, start, end)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cells = maze.height * maze.width
+    return {
+        "distance": distance,
+        "path_cells": len(path),
+        "tile_loads": maze.loads,
+        "tile_evictions": maze.evictions,
+        "tile_cache_bytes": cache_tiles * maze.tile_bytes(),
+        "search_state_bytes": peak,
+        # load_maze returns an int64 array, createNodes a Node per cell
+        "full_grid_bytes": cells * (np.dtype(np.int64).itemsize + sizeof(astar_lib.Node))
+    }
@@ -0,0 +1,255 @@
+import heapq
+import time
+import numpy as np
+
+import network_graph
+import network_vulnerability
+import parameters
+import train_car_comparison as comparison
+from network_graph import PRECISION_FACTOR
+from parameters import params_dir
+
+# https://en.wikipedia.org/wiki/Time-dependent_vehicle_routing_problem
+# Ichoua, Gendreau, Potvin: Vehicle dispatching with time-dependent travel times, European Journal of Operational Research 144 (2003)
+# Kaufman, Smith: Fastest paths in time-dependent networks, Journal of Intelligent Transportation Systems 1 (1993)
+
+# parameter file name and its keys
+profile_parameter_file = "speed_profiles.json"
+# minutes between two samples of the profiles
+resolution_name = "resolution"
+# speed factor breakpoints of each maze file, {maze file: [["HH:MM", factor]]}
+profiles_name = "profiles"
+# regions with their own profiles, {region name: {"bounds": [x min, y min, x max, y max], "profiles": {maze file: [["HH:MM", factor]]}}}
+regions_name = "regions"
+
+MINUTES_PER_DAY = 24 * 60
+default_resolution = 15 # min
+
+# the longest step between two cells in maze units, it limits how fast the pace may drop without breaking FIFO
+MAX_STEP_LENGTH = network_graph.DIAGONAL_COST / PRECISION_FACTOR
+
+def clock_minutes(clock: str) -> int:
+    """
+    Converts a time of day to minutes after midnight.
+
+    Inputs:
+        clock: The time as "HH:MM".
+
+    Outputs:
+        _: The minutes after midnight.
+    """
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def minutes_clock(minutes: float) -> str:
+    """
+    Converts minutes after midnight to a time of day, later days wrap around.
+
+    Inputs:
+        minutes: The minutes after midnight.
+
+    Outputs:
+        _: The time as "HH:MM".
+    """
+    hours, minutes = divmod(round(minutes) % MINUTES_PER_DAY, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+def sample_profile(breakpoints: list[list], resolution: int) -> np.ndarray:
+    """
+    Samples a piecewise-linear daily profile at every multiple of the resolution. The profile repeats every day, so the last breakpoint is interpolated towards the first one of the next day.
+
+    Inputs:
+        breakpoints: The [["HH:MM", factor]] breakpoints, a constant factor of 1 if empty.
+        resolution: The minutes between two samples, a divisor of a day.
+
+    Outputs:
+        _: The factor at each sample of the day.
+    """
+    samples = np.arange(0, MINUTES_PER_DAY, resolution)
+    if not breakpoints:
+        return np.ones(samples.size)
+    # https://numpy.org/doc/stable/reference/generated/numpy.interp.html
+    return np.interp(samples, [clock_minutes(clock) for clock, _ in breakpoints], [factor for _, factor in breakpoints], period=MINUTES_PER_DAY)
+
+def enforce_fifo(paces: np.ndarray, resolution: int) -> np.ndarray:
+    """
+    Raises the paces where they drop so fast, that leaving later on a step could mean arriving earlier (first in, first out).
+    A step of length L departing at t arrives at t + L * pace(t), which never decreases as long as the pace drops by at most 1 / L per minute.
+
+    Inputs:
+        paces: The minutes per maze unit at each sample of the day.
+        resolution: The minutes between two samples.
+
+    Outputs:
+        paces: The paces, raised where necessary.
+    """
+    paces = paces.copy()
+    max_drop = resolution / MAX_STEP_LENGTH
+    # the day wraps around, so a second pass carries raised paces over midnight
+    for _ in range(2):
+        for k in range(paces.size):
+            paces[k] = max(paces[k], paces[k - 1] - max_drop)
+    return paces
+
+class TimeDependentNetwork():
+    """
+    A network of a vehicle type whose speeds depend on the time of day, with a piecewise-linear speed profile per maze file and optionally per region.
+    The paces of all profiles are sampled once in a compact table with a row per profile, and each cell refers to its row, so the pace of a cell at any time is a linear interpolation between two neighboring samples.
+
+    Attributes:
+        network (VulnerableNetwork): The network with its adjacency, static pace and fast cells.
+        resolution (int): The minutes between two samples of the profiles.
+        table (np.ndarray): The minutes per maze unit of each profile row at each sample, with the first sample repeated at the end.
+        cell_rows (np.ndarray): The flat array of the profile row of each cell.
+        row_names (list): The (region, network title) of each row, region None outside of all regions.
+
+    Methods:
+        __init__: Loads the network and samples its profiles.
+        paces_at: Returns the pace of every profile row at a time.
+        travel_time: Finds the fastest route for a departure time with time-dependent A*.
+    """
+    def __init__(self, vehicle_type: str, profile_params: dict, networks: dict[str, np.ndarray] | None = None) -> None:
+        """
+        Initializes a new TimeDependentNetwork instance.
+
+        Inputs:
+            vehicle_type: The vehicle type as defined in comparison.vehicle_networks, 'train' or 'car'.
+            profile_params: The parameters of the speed profile file.
+            networks: Optional networks already loaded with comparison.load_networks.
+        """
+        slow_maze_file, fast_maze_file, slow_speed, fast_speed = comparison.vehicle_networks[vehicle_type]
+        self.network = network_vulnerability.VulnerableNetwork(vehicle_type, networks)
+        self.resolution = profile_params.get(resolution_name, default_resolution)
+        if MINUTES_PER_DAY % self.resolution:
+            raise ValueError("The resolution of the speed profiles has to divide a day!")
+
+        profiles = profile_params.get(profiles_name, {})
+        regions = profile_params.get(regions_name, {})
+        shape = self.network.maze.shape
+        slow_title, fast_title = comparison.network_titles[vehicle_type]
+
+        # two rows per region, one for the slow and one for the fast network, regions without an own profile use the profile of the network
+        rows = []
+        self.row_names = []
+        region_of_cell = np.zeros(shape, dtype=np.int32)
+        for region_idx, (region_name, region) in enumerate([(None, {"profiles": profiles}), *regions.items()]):
+            region_profiles = region["profiles"]
+            for maze_file, speed, title in [(slow_maze_file, slow_speed, slow_title), (fast_maze_file, fast_speed, fast_title)]:
+                factors = sample_profile(region_profiles.get(maze_file, profiles.get(maze_file, [])), self.resolution)
+                rows.append(enforce_fifo(60 * comparison.DISTANCE_SCALE_FACTOR / (speed * factors), self.resolution))
+                self.row_names.append((region_name, title))
+
+            # later regions cover earlier ones
+            if region_name is not None:
+                x_min, y_min, x_max, y_max = region["bounds"]
+                region_of_cell[y_min:y_max + 1, x_min:x_max + 1] = region_idx
+
+        table = np.array(rows)
+        self.table = np.hstack([table, table[:, :1]])
+        self.cell_rows = (region_of_cell.ravel() * 2 + self.network.fast_cells).astype(np.int32)
+
+    def paces_at(self, minutes: float) -> np.ndarray:
+        """
+        Interpolates the pace of every profile row at a time.
+
+        Inputs:
+            minutes: The minutes after midnight, later days wrap around.
+
+        Outputs:
+            _: The minutes per maze unit of each row.
+        """
+        slot, fraction = divmod((minutes % MINUTES_PER_DAY) / self.resolution, 1)
+        slot = int(slot)
+        return self.table[:, slot] + (self.table[:, slot + 1] - self.table[:, slot]) * fraction
+
+    def travel_time(self, start: int, end: int, departure: float) -> tuple[float, list[int]]:
+        """
+        Finds the fastest route between two cells for a departure time with time-dependent A*.
+        A step departing at t takes its length times the mean pace of both cells at t. The profiles respect FIFO, so the earliest arrival at a cell is always the best one to continue from and each cell is settled once like in the static search.
+        The pace only depends on the time of the expanded cell, so the profiles are interpolated once per expansion and each step is a table lookup.
+
+        Inputs:
+            start: The flat index of the start cell.
+            end: The flat index of the end cell.
+            departure: The departure time in minutes after midnight.
+
+        Outputs:
+            minutes, path: The travel time in minutes (infinite if no route exists) and the flat indices of the route.
+        """
+        width = self.network.maze.shape[1]
+        adjacency = self.network.adjacency
+        cell_rows = self.cell_rows.tolist()
+        table = self.table.tolist()
+        # the smallest pace of the whole day keeps the heuristic admissible at any time
+        heuristic_weight = float(self.table.min()) / PRECISION_FACTOR
+
+        arrivals = {start: departure}
+        parents = {start: -1}
+        visited = set()
+        border = [(departure + network_graph.octile_cost(start, end, width) * heuristic_weight, departure, start)]
+
+        while border:
+            _, arrival, cell = heapq.heappop(border)
+            if cell in visited:
+                continue
+            if cell == end:
+                return arrival - departure, network_graph.trace_parents(parents, end)
+            visited.add(cell)
+
+            # the same interpolation as paces_at on lists, which is faster for the few rows
+            slot, fraction = divmod((arrival % MINUTES_PER_DAY) / self.resolution, 1)
+            slot = int(slot)
+            paces = [row[slot] + (row[slot + 1] - row[slot]) * fraction for row in table]
+            pace = paces[cell_rows[cell]]
+            for neighbor, step_cost in adjacency[cell]:
+                new_arrival = arrival + step_cost / PRECISION_FACTOR * (pace + paces[cell_rows[neighbor]]) / 2
+                if new_arrival < arrivals.get(neighbor, float("inf")):
+                    arrivals[neighbor] = new_arrival
+                    parents[neighbor] = cell
+                    heapq.heappush(border, (new_arrival + network_graph.octile_cost(neighbor, end, width) * heuristic_weight, new_arrival, neighbor))
+
+        return float("inf"), []
+
+def load_profiles(filename: str) -> dict:
+    """
+    Loads the speed profiles from a JSON file.
+
+    Inputs:
+        filename: The name of the parameter file.
+
+    Outputs:
+        _: The parameters with the resolution, the profiles of each maze file and the regions.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        return parameters.read_params(f)
+
+def departure_profile(network: TimeDependentNetwork, start: int, end: int, departures: list[float]) -> list[dict]:
+    """
+    Searches the fastest route for each departure time and compares it with the static search, which uses the constant speeds.
+
+    Inputs:
+        network: The time-dependent network.
+        start: The flat index of the start cell.
+        end: The flat index of the end cell.
+        departures: The departure times in minutes after midnight.
+
+    Outputs:
+        _: A dictionary per departure with the departure and arrival time as "HH:MM", the minutes, the runtime of the search and the static minutes and runtime.
+    """
+    start_time = time.perf_counter()
+    static_minutes, _ = network.network.travel_time(start, end)
+    static_runtime = time.perf_counter() - start_time
+
+    results = []
+    for departure in departures:
+        start_time = time.perf_counter()
+        minutes, _ = network.travel_time(start, end, departure)
+        results.append({
+            "departure": minutes_clock(departure),
+            "arrival": minutes_clock(departure + minutes),
+            "minutes": minutes,
+            "runtime": time.perf_counter() - start_time,
+            "static_minutes": static_minutes,
+            "static_runtime": static_runtime
+        })
+    return results
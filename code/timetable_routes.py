@@ -0,0 +1,359 @@
+import csv
+import math
+import bisect
+import numpy as np
+
+import network_graph
+import network_snapping
+import network_vulnerability
+import parameters
+import train_car_comparison as comparison
+from astar_lib import SOL_PATH
+from parameters import NodePos, params_dir
+
+# https://en.wikipedia.org/wiki/Connection_scan_algorithm
+# Dibbelt, Pajor, Strasser, Wagner: Connection Scan Algorithm, Journal of Experimental Algorithmics 23 (2018)
+# https://gtfs.org/schedule/reference/
+
+# folder of the timetable, with a reduced set of the GTFS files and columns
+timetable_dir = params_dir.joinpath("timetable")
+stops_file = "stops.csv"
+trips_file = "trips.csv"
+stop_times_file = "stop_times.csv"
+
+# key of the departure time in the train car comparison parameter file
+departure_time_name = "departure_time"
+default_departure_time = "07:30"
+
+# minutes to change the train at a stop if stops.csv does not define them
+default_transfer_minutes = 3
+# minutes a train waits at each intermediate stop of the generated timetable
+dwell_minutes = 2
+
+# lines of the generated timetable, served in both directions
+# key: line name, value: (stops, first departure, last departure, minutes between two trains)
+timetable_lines = {
+    "IC1": (["Geneva", "Lausanne", "Bern", "Zurich", "St. Gallen"], "05:34", "22:04", 30),
+    "IC3": (["Basel", "Zurich", "Chur"], "05:37", "22:37", 60),
+    "IC2": (["Zurich", "Lugano"], "06:09", "21:09", 60),
+    "IC21": (["Basel", "Luzern", "Lugano"], "06:28", "20:28", 60),
+    "IC6": (["Basel", "Bern"], "05:58", "22:28", 30),
+    "IR35": (["Bern", "Luzern"], "06:00", "22:00", 60),
+    "IR70": (["Zurich", "Luzern"], "05:35", "23:05", 30),
+    "IR90": (["Geneva", "Lausanne", "Sion"], "05:42", "21:42", 60),
+    "RE": (["St. Gallen", "Chur"], "05:50", "22:50", 60)
+}
+
+def parse_time(clock: str) -> int:
+    """
+    Converts a GTFS time to minutes after midnight of the service day, times after midnight are later than 24:00:00.
+
+    Inputs:
+        clock: The time as "HH:MM:SS" or "HH:MM".
+
+    Outputs:
+        _: The minutes after midnight.
+    """
+    hours, minutes = clock.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+def format_time(minutes: float) -> str:
+    """
+    Converts minutes after midnight of the service day to a GTFS time.
+
+    Inputs:
+        minutes: The minutes after midnight.
+
+    Outputs:
+        _: The time as "HH:MM:SS".
+    """
+    hours, minutes = divmod(round(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:00"
+
+class Timetable():
+    """
+    The connections of a timetable as a table of arrays sorted by departure time, the input of the Connection Scan Algorithm.
+    A connection is a train driving from one stop to the next without stopping in between.
+
+    Attributes:
+        stop_names (list): The name of each stop, the stops are numbered in the order of stops.csv.
+        stop_positions (list): The NodePos of each stop.
+        transfer_minutes (list): The minutes to change the train at each stop.
+        trip_lines (list): The line of each trip, the trips are numbered in the order of trips.csv.
+        departure_stops, arrival_stops, departures, arrivals, trips (np.ndarray): The columns of the connections, times in minutes after midnight.
+
+    Methods:
+        __init__: Loads the timetable files and sorts the connections.
+        stop: Returns the number of a stop.
+        earliest_arrival: Finds the journey arriving first for a departure time.
+        profile: Finds the optimal departures of the whole day from every stop to a target.
+        all_pairs_profiles: Runs the profile query for every target.
+    """
+    def __init__(self, directory=timetable_dir) -> None:
+        """
+        Initializes a new Timetable instance.
+
+        Inputs:
+            directory: The folder of the timetable files.
+        """
+        with open(directory.joinpath(stops_file), 'r', newline='') as f:
+            stops = list(csv.DictReader(f))
+        with open(directory.joinpath(trips_file), 'r', newline='') as f:
+            trips = list(csv.DictReader(f))
+        with open(directory.joinpath(stop_times_file), 'r', newline='') as f:
+            stop_times = list(csv.DictReader(f))
+
+        self.stop_names = [stop["stop_name"] for stop in stops]
+        self.stop_positions = [NodePos(int(stop["x"]), int(stop["y"])) for stop in stops]
+        self.transfer_minutes = [int(stop.get("min_transfer_time") or default_transfer_minutes) for stop in stops]
+        stop_numbers = {stop["stop_id"]: i for i, stop in enumerate(stops)}
+
+        self.trip_lines = [trip["route_id"] for trip in trips]
+        trip_numbers = {trip["trip_id"]: i for i, trip in enumerate(trips)}
+
+        # consecutive stop times of a trip form a connection
+        stop_times.sort(key=lambda row: (trip_numbers[row["trip_id"]], int(row["stop_sequence"])))
+        connections = [
+            (stop_numbers[a["stop_id"]], stop_numbers[b["stop_id"]], parse_time(a["departure_time"]), parse_time(b["arrival_time"]), trip_numbers[a["trip_id"]])
+            for a, b in zip(stop_times, stop_times[1:]) if a["trip_id"] == b["trip_id"]
+        ]
+        # a connection arriving at the departure time of the next one of the same trip has to come first
+        connections.sort(key=lambda connection: (connection[2], connection[3]))
+
+        columns = np.array(connections, dtype=np.int32).reshape(-1, 5).T
+        self.departure_stops, self.arrival_stops, self.departures, self.arrivals, self.trips = columns
+
+    def stop(self, name: str) -> int:
+        """
+        Returns the number of a stop.
+
+        Inputs:
+            name: The name of the stop.
+
+        Outputs:
+            _: The number of the stop.
+
+        Raises:
+            KeyError: If no stop has this name.
+        """
+        if name not in self.stop_names:
+            raise KeyError(f"The timetable has no stop {name}!")
+        return self.stop_names.index(name)
+
+    def earliest_arrival(self, source: int, target: int, departure: int) -> dict | None:
+        """
+        Finds the journey which arrives first at the target when leaving the source at the departure time or later.
+        The connections are scanned once in the order of their departure, from the first one at the departure time until the first one leaving after the arrival at the target.
+        A trip can be boarded if its connection leaves after the arrival at its stop plus the transfer time, or if it was already boarded before.
+
+        Inputs:
+            source: The number of the start stop.
+            target: The number of the end stop.
+            departure: The earliest departure in minutes after midnight.
+
+        Outputs:
+            journey: A dictionary with the departure and arrival time and the legs, each with the line, the trip, both stops and their times. None if the target cannot be reached on this day, a journey without legs arriving at the departure time if the source is the target.
+        """
+        departure_stops, arrival_stops = self.departure_stops.tolist(), self.arrival_stops.tolist()
+        departures, arrivals, trips = self.departures.tolist(), self.arrivals.tolist(), self.trips.tolist()
+
+        arrival = [math.inf] * len(self.stop_names)
+        # time from which a train can be boarded at a stop, arrival plus transfer time
+        ready = [math.inf] * len(self.stop_names)
+        arrival[source] = ready[source] = departure
+        boarded = [-1] * len(self.trip_lines)
+        # connections where the leg reaching each stop was boarded and left
+        legs = [None] * len(self.stop_names)
+
+        first = int(np.searchsorted(self.departures, departure))
+        for i in range(first, len(departures)):
+            if departures[i] >= arrival[target]:
+                break
+            trip = trips[i]
+            if boarded[trip] == -1 and ready[departure_stops[i]] <= departures[i]:
+                boarded[trip] = i
+            if boarded[trip] != -1 and arrivals[i] < arrival[arrival_stops[i]]:
+                stop = arrival_stops[i]
+                arrival[stop] = arrivals[i]
+                ready[stop] = arrivals[i] + self.transfer_minutes[stop]
+                legs[stop] = (boarded[trip], i)
+
+        if arrival[target] == math.inf:
+            return None
+
+        journey_legs = []
+        stop = target
+        while stop != source:
+            board, alight = legs[stop]
+            journey_legs.append({
+                "line": self.trip_lines[trips[board]],
+                "trip": trips[board],
+                "from": self.stop_names[departure_stops[board]],
+                "to": self.stop_names[stop],
+                "departure": departures[board],
+                "arrival": arrivals[alight]
+            })
+            stop = departure_stops[board]
+
+        journey_legs.reverse()
+        # no leg is needed if the source is the target
+        first_departure = journey_legs[0]["departure"] if journey_legs else departure
+        return {"departure": first_departure, "arrival": arrival[target], "legs": journey_legs}
+
+    def profile(self, target: int) -> list[list[tuple[int, int]]]:
+        """
+        Finds the optimal departures of the whole day from every stop to a target with the profile Connection Scan Algorithm.
+        The connections are scanned once backwards, each stop keeps its (departure, arrival) pairs where no later departure arrives as early, and each trip the earliest arrival reachable by staying on it.
+
+        Inputs:
+            target: The number of the end stop.
+
+        Outputs:
+            profiles: For each stop the (departure, arrival) pairs of its optimal journeys to the target, sorted by departure.
+        """
+        departure_stops, arrival_stops = self.departure_stops.tolist(), self.arrival_stops.tolist()
+        departures, arrivals, trips = self.departures.tolist(), self.arrivals.tolist(), self.trips.tolist()
+
+        # the pairs of each stop are appended with decreasing departures and arrivals, the departures are negated to bisect them in increasing order
+        negated_departures = [[] for _ in self.stop_names]
+        profile_arrivals = [[] for _ in self.stop_names]
+        trip_arrival = [math.inf] * len(self.trip_lines)
+
+        for i in range(len(departures) - 1, -1, -1):
+            stop = arrival_stops[i]
+            best = arrivals[i] if stop == target else trip_arrival[trips[i]]
+
+            # the best journey changing the train at the arrival stop leaves it after the transfer time
+            count = bisect.bisect_right(negated_departures[stop], -(arrivals[i] + self.transfer_minutes[stop]))
+            if count:
+                best = min(best, profile_arrivals[stop][count - 1])
+
+            trip_arrival[trips[i]] = best
+            if best == math.inf:
+                continue
+
+            stop = departure_stops[i]
+            if not profile_arrivals[stop] or best < profile_arrivals[stop][-1]:
+                # a pair with the same departure is replaced by the better one
+                if negated_departures[stop] and negated_departures[stop][-1] == -departures[i]:
+                    negated_departures[stop].pop()
+                    profile_arrivals[stop].pop()
+                negated_departures[stop].append(-departures[i])
+                profile_arrivals[stop].append(best)
+
+        return [[(-departure, arrival) for departure, arrival in zip(stop_departures, stop_arrivals)][::-1] for stop_departures, stop_arrivals in zip(negated_departures, profile_arrivals)]
+
+    def all_pairs_profiles(self) -> dict[tuple[str, str], list[tuple[int, int]]]:
+        """
+        Finds the optimal departures of the whole day between every pair of stops, with one profile scan per target.
+
+        Outputs:
+            _: A dictionary mapping (start name, end name) to the (departure, arrival) pairs of the optimal journeys.
+        """
+        profiles = {}
+        for target, target_name in enumerate(self.stop_names):
+            for source, pairs in enumerate(self.profile(target)):
+                if source != target:
+                    profiles[(self.stop_names[source], target_name)] = pairs
+        return profiles
+
+def generate_timetable(cities: dict[str, NodePos], directory=timetable_dir, networks: dict[str, np.ndarray] | None = None) -> None:
+    """
+    Generates the timetable of the timetable_lines. The running time between two stops is the travel time of the fastest route on the rail networks, rounded up to whole minutes, plus the dwell time at intermediate stops.
+
+    Inputs:
+        cities: A dictionary mapping city names to their NodePos objects, every stop of a line has to be a city.
+        directory: The folder of the timetable files.
+        networks: Optional networks already loaded with comparison.load_networks.
+    """
+    network = network_vulnerability.VulnerableNetwork("train", networks)
+    stop_names = list(dict.fromkeys(name for stops, _, _, _ in timetable_lines.values() for name in stops))
+    cells = {name: stop_cell(cities[name], network.maze, comparison.rail_network_maze_file) for name in stop_names}
+
+    running_minutes = {}
+    for stops, _, _, _ in timetable_lines.values():
+        for a, b in zip(stops, stops[1:]):
+            minutes, _ = network.travel_time(cells[a], cells[b])
+            running_minutes[(a, b)] = running_minutes[(b, a)] = math.ceil(minutes)
+
+    trips = []
+    stop_times = []
+    for line, (stops, first, last, headway) in timetable_lines.items():
+        for direction, line_stops in enumerate([stops, stops[::-1]]):
+            for start in range(parse_time(first), parse_time(last) + 1, headway):
+                trip_id = f"{line}-{direction}-{format_time(start)[:5].replace(':', '')}"
+                trips.append((line, trip_id))
+
+                time = start
+                for sequence, stop in enumerate(line_stops):
+                    arrival = time
+                    departure = time if sequence in (0, len(line_stops) - 1) else time + dwell_minutes
+                    stop_times.append((trip_id, format_time(arrival), format_time(departure), stop, sequence))
+                    if sequence < len(line_stops) - 1:
+                        time = departure + running_minutes[(stop, line_stops[sequence + 1])]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory.joinpath(stops_file), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["stop_id", "stop_name", "x", "y", "min_transfer_time"])
+        writer.writerows((name, name, cities[name].x, cities[name].y, default_transfer_minutes) for name in stop_names)
+    with open(directory.joinpath(trips_file), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["route_id", "trip_id"])
+        writer.writerows(trips)
+    with open(directory.joinpath(stop_times_file), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"])
+        writer.writerows(stop_times)
+
+def stop_cell(pos: NodePos, maze: np.ndarray, maze_file: str | None = None) -> int:
+    """
+    Returns the cell of a stop on the rail network, the nearest walkable cell if it lies slightly off the network.
+
+    Inputs:
+        pos: The position of the stop.
+        maze: The maze of the rail network.
+        maze_file: The optional file name of the maze, to use the snapping index saved beside it.
+
+    Outputs:
+        _: The flat index of the cell.
+    """
+    snapped_pos, _ = network_snapping.index_for(maze, maze_file).snap(pos)
+    return network_graph.cell_index(snapped_pos.x, snapped_pos.y, maze.shape)
+
+def journey_maze(timetable: Timetable, journey: dict, networks: dict[str, np.ndarray] | None = None) -> np.ndarray:
+    """
+    Draws the geometry of a journey on the rail network: each leg follows the fastest route between its stops on railnetwork.csv.
+
+    Inputs:
+        timetable: The timetable of the journey.
+        journey: The journey as returned by Timetable.earliest_arrival.
+        networks: Optional networks already loaded with comparison.load_networks.
+
+    Outputs:
+        maze: The rail network with the cells of the journey marked as solution path.
+    """
+    network = network_vulnerability.VulnerableNetwork("train", networks)
+    maze = network.maze.copy()
+
+    for leg in journey["legs"]:
+        start = stop_cell(timetable.stop_positions[timetable.stop(leg["from"])], network.maze, comparison.rail_network_maze_file)
+        end = stop_cell(timetable.stop_positions[timetable.stop(leg["to"])], network.maze, comparison.rail_network_maze_file)
+        _, path = network.travel_time(start, end)
+        maze.ravel()[path] = SOL_PATH
+
+    return maze
+
+def load_departure_time(filename: str) -> int:
+    """
+    Loads the departure time from the train car comparison parameter file.
+
+    Inputs:
+        filename: The name of the parameter file.
+
+    Outputs:
+        _: The departure time in minutes after midnight, the default departure time if the file does not define one.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+    return parse_time(params.get(departure_time_name, default_departure_time))
@@ -2,14 +2,17 @@ import numpy as np
 import astar_lib
 import parameters
 import maze_plot
+import network_snapping
 import json
 import sys
+import itertools
 
 from pathlib import Path
 from parameters import NodePos, params_dir
 
 ROOT = Path(sys.path[0]).parent
 output_dir = ROOT.joinpath("output-data")
+route_images_dir = output_dir.joinpath("route-images")
 
 # determined factor to approximate the real distance
 DISTANCE_SCALE_FACTOR = 1.7241
@@ -31,17 +34,38 @@ rail_network_maze_file = "railnetwork.csv"
 road_maze_file = "roadnetwork.csv"
 highway_maze_file = "highway-network.csv"
 
+# networks of each vehicle type as used by rail_analysis and car_analysis
+# key: vehicle type as in rates_per_vehicle.json, value: (slow maze file, fast maze file, slow speed, fast speed)
+vehicle_networks = {
+    "train": (rail_network_maze_file, intercity_rail_network_maze_file, REGIO_TRAIN_SPEED, INTERCITY_TRAIN_SPEED),
+    "car": (road_maze_file, highway_maze_file, MAIN_ROAD_CAR_SPEED, HIGHWAY_CAR_SPEED)
+}
+
+# titles of the (slow, fast) networks of each vehicle type
+network_titles = {
+    "train": ("Regional Train Lines", "Intercity Train Lines"),
+    "car": ("Main Roads", "Highways")
+}
+
 # parameter file name
 train_car_parameter_file = "train_car_comparison.json"
 
 # parameter city names in train_car_comparison.json
 start_city_name = "start_city"
 end_city_name = "end_city"
+# optional parameter to additionally export the results of a pair as one json file
+export_json_name = "export_json"
+
+# cities whose name starts with this prefix are only used to measure the DISTANCE_SCALE_FACTOR
+measurement_node_prefix = "Measurement_"
 
 # output data attribute names
 output_distance = "distance"
 output_time = "time"
 output_faster_network = "time efficient"
+# positions snapped to the networks and the nodes of the search with cutoff, returned beside the results but not exported
+output_snapped = "snapped"
+output_search_stats = "search"
 km_unit = " km"
 
 """ data preparation """
@@ -72,6 +96,20 @@ def load_maze_locations(filename: str) -> dict[str, NodePos]:
         
         return cities
 
+def city_pairs(cities: dict[str, NodePos]) -> list[tuple[str, str]]:
+    """
+    Lists every pair of cities that can be analyzed, skipping the measurement nodes.
+    Each unordered pair is listed once in the order of the cities file.
+
+    Inputs:
+        cities - A dictionary mapping city names to their NodePos objects.
+
+    Outputs:
+        _ - A list of (start city name, end city name) tuples.
+    """
+    names = [name for name in cities.keys() if not name.startswith(measurement_node_prefix)]
+    return list(itertools.combinations(names, 2))
+
 def check_destination(destination_name: str, cities: dict[str, NodePos]) -> NodePos:
     """
     Checks if a specified destination exists in the given cities dictionary and returns its NodePos.
@@ -137,6 +175,20 @@ def load_destinations(filename: str, cities: dict[str, NodePos]) -> tuple[str, s
         
         return start_city, end_city, *destinations(start_city, end_city, cities)
 
+def load_export_option(filename: str) -> bool:
+    """
+    Loads the option whether the results of a city pair should additionally be exported as a single JSON file.
+
+    Inputs:
+        filename - The name of the file containing the destination data.
+
+    Outputs:
+        _ - True if the JSON export is enabled, False if it is disabled or not defined.
+    """
+    with open(params_dir.joinpath(filename), 'r') as f:
+        params = parameters.read_params(f)
+        return bool(params.get(export_json_name, False))
+
 
 """ output data analysis """
 
@@ -176,6 +228,21 @@ def minutes_to_hours_and_minutes(minutes: int) -> tuple[int, int]:
     return hours, remaining_minutes
 
 
+def network_pace(fast_maze: np.ndarray, slow_speed: float, fast_speed: float) -> np.ndarray:
+    """
+    Calculates the real travel time per maze unit for each cell of a slow network, which contains the fast network.
+    Cells of the fast network are travelled at the fast speed, all other cells at the slow speed.
+
+    Inputs:
+        fast_maze - The maze representing the faster network.
+        slow_speed - The average speed on the slower network in km/h.
+        fast_speed - The average speed on the faster network in km/h.
+
+    Outputs:
+        _ - A float array with the minutes per maze unit of each cell.
+    """
+    return np.where(fast_maze != astar_lib.OBSTACLE, 60 * DISTANCE_SCALE_FACTOR / fast_speed, 60 * DISTANCE_SCALE_FACTOR / slow_speed)
+
 def calculate_fast_route_proportion(slow_solved_maze: np.ndarray, fast_unsolved_maze: np.ndarray) -> tuple[int, int]:
     """
     Calculates the proportion of the fast route within the slow route's solution path.
@@ -201,10 +268,61 @@ def calculate_fast_route_proportion(slow_solved_maze: np.ndarray, fast_unsolved_
 
 """" simulation"""
 
-def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_maze: np.ndarray, slow_title: str, fast_title: str, slow_speed: float, fast_speed: float) -> tuple[str, np.ndarray, int, int, int, dict]:
+def route_lengths(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_maze: np.ndarray, search_stats: dict | None = None, snaps: list | None = None) -> tuple[float, float, float, np.ndarray, np.ndarray]:
+    """
+    Runs the A* algorithm on the 'slow' and 'fast' maze of a vehicle type and splits the route on the slow maze into its parts on the fast and on the slow network.
+    The start and end are snapped to the nearest cell of each network if they lie slightly off it.
+    The lengths do not depend on the speeds or the DISTANCE_SCALE_FACTOR, so they can be reused for any of their values.
+    The slow maze includes the fast maze, so the fast route is also a route on the slow maze and its length is an upper bound of the slow route: the search on the slow maze skips all nodes which cannot lie on a route within it.
+
+    Inputs:
+        start - The starting position in the maze, represented as a NodePos object.
+        end - The ending position in the maze, also represented as a NodePos object.
+        slow_maze - The maze representing the slower network, which includes the fast network.
+        fast_maze - The maze representing the faster network.
+        search_stats - An optional dictionary which receives the number of expanded and skipped nodes of the search on the slow maze, as returned by astar_lib.py_run_astar.
+        snaps - An optional list which receives a (name, position, snapped position, distance) tuple for every snap of the start or end to a network.
+
+    Outputs:
+        fast_distance - The length of the route on the fast network in maze units, -1 if there is none.
+        slow_fast_length, slow_slow_length - The lengths of the route on the slow maze lying on the fast and on the slow network in maze units.
+        solved_fast_maze, solved_slow_maze - The solved mazes of both routes.
+    """
+    # cities slightly off a network start at its nearest cell
+    positions = [("Start", start), ("End", end)] * 2
+    snapped = [network_snapping.snap_to_network(pos, pos_name, maze) for (pos_name, pos), maze in zip(positions, [fast_maze, fast_maze, slow_maze, slow_maze])]
+    (fast_start, _), (fast_end, _), (slow_start, _), (slow_end, _) = snapped
+    if snaps is not None:
+        snaps += [(pos_name, pos, snapped_pos, distance) for (pos_name, pos), (snapped_pos, distance) in zip(positions, snapped) if distance > 0]
+
+    # slow maze includes fast maze
+    # if no valid path found some cities were improperly configured
+    if not astar_lib.are_connected(slow_start, slow_end, slow_maze):
+        raise Exception("Could not find any valid route! Please check that all cities are properly configured.")
+
+    # the component labels answer without searching if the fast network does not connect both cities
+    if astar_lib.are_connected(fast_start, fast_end, fast_maze):
+        fast_distance, solved_fast_maze = astar_lib.py_run_astar(fast_start, fast_end, fast_maze)
+    else:
+        fast_distance, solved_fast_maze = -1, fast_maze
+
+    # snapping may move the cities to other cells on the slow maze, which may need a longer route
+    cutoff = fast_distance if fast_distance != -1 and slow_start.get_pos() + slow_end.get_pos() == fast_start.get_pos() + fast_end.get_pos() else None
+    slow_distance, solved_slow_maze = astar_lib.py_run_astar(slow_start, slow_end, slow_maze, cutoff, search_stats)
+    # the cutoff only skips nodes, so the search is repeated without it if it still missed the route
+    if slow_distance == float("inf"):
+        slow_distance, solved_slow_maze = astar_lib.py_run_astar(slow_start, slow_end, slow_maze, stats=search_stats)
+    
+    total_nodes, fast_nodes = calculate_fast_route_proportion(solved_slow_maze, fast_maze)
+
+    slow_fast_length, slow_slow_length = np.array([fast_nodes, total_nodes - fast_nodes]) / total_nodes * slow_distance
+
+    return fast_distance, float(slow_fast_length), float(slow_slow_length), solved_fast_maze, solved_slow_maze
+
+def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_maze: np.ndarray, slow_title: str, fast_title: str, slow_speed: float, fast_speed: float, show_plot: bool = True) -> tuple[str, np.ndarray, int, int, int, dict]:
     """
     Analyzes and compares two transportation networks (e.g., rail vs. car) to determine the most efficient route in terms of time. The function performs the following steps:
-    1. Run the A* algorithm on both the 'slow' and 'fast' mazes, representing two different transportation networks. The 'slow' network could be, for instance, regional train lines, while the 'fast' network could represent intercity train lines or highways.
+    1. Run route_lengths, which snaps the start and end to the nearest cell of each network if they lie slightly off it and runs the A* algorithm on both the 'slow' and 'fast' mazes, representing two different transportation networks. The 'slow' network could be, for instance, regional train lines, while the 'fast' network could represent intercity train lines or highways. The length of the fast route is the cutoff of the search on the slow maze, its expanded and skipped nodes are returned in the data.
     2. Calculate the real-world distance and travel time for each network based on the distances returned by the A* algorithm and the average speed for each network.
     3. Compare the total travel time for each network and determine which one offers the shortest travel time.
     4. Print and plot the results, showing a comparison between the two networks in terms of travel time, distance, and the route taken.
@@ -218,6 +336,7 @@ def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_m
         fast_title - The title for the faster network.
         slow_speed - The average speed on the slower network.
         fast_speed - The average speed on the faster network.
+        show_plot - Whether the comparison of both networks is plotted when the fast network wins.
 
     Outputs:
         faster_maze_title: str - The title of the chosen network based on time efficiency.
@@ -225,22 +344,14 @@ def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_m
         real_distance: int - The real-world distance of the chosen path.
         hours: int - The total hours for the journey.
         minutes: int - The remaining minutes for the journey.
-        data: dict - Dictionary containing information on the length and time of the chosen paths.
+        data: dict - Dictionary containing information on the length and time of the chosen paths, the snaps of the start and end to the networks as returned by route_lengths under output_snapped and the search_stats of route_lengths under output_search_stats.
     """
-    fast_distance, solved_fast_maze = astar_lib.py_run_astar(start, end, fast_maze)
-    slow_distance, solved_slow_maze = astar_lib.py_run_astar(start, end, slow_maze)
-    
-    # slow maze includes fast maze
-    # if no valid path found some cities were improperly configured
-    if slow_distance == -1:
-        raise Exception("Could not find any valid route! Please check that all cities are properly configured.")
-    
-    total_nodes, fast_nodes = calculate_fast_route_proportion(solved_slow_maze, fast_maze)
-
-    distances = np.array([fast_nodes, total_nodes - fast_nodes]) / total_nodes * slow_distance
+    search_stats, snaps = {}, []
+    fast_distance, slow_fast_length, slow_slow_length, solved_fast_maze, solved_slow_maze = route_lengths(start, end, slow_maze, fast_maze, search_stats, snaps)
 
-    real_slow_slow_distance, slow_time_slow_minutes = real_rounded_distance_and_time(distances[0], slow_speed)
-    real_slow_fast_distance, slow_time_fast_minutes = real_rounded_distance_and_time(distances[1], fast_speed)
+    # the part of the slow route on the fast network is travelled at the fast speed
+    real_slow_slow_distance, slow_time_slow_minutes = real_rounded_distance_and_time(slow_slow_length, slow_speed)
+    real_slow_fast_distance, slow_time_fast_minutes = real_rounded_distance_and_time(slow_fast_length, fast_speed)
 
     real_slow_distance = real_slow_slow_distance + real_slow_fast_distance
     slow_time_minutes = slow_time_slow_minutes + slow_time_fast_minutes
@@ -249,12 +360,12 @@ def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_m
 
 
     # prepare output data
-    data = {slow_title: {output_distance: f"{real_slow_distance}{km_unit}", output_time: f"{slow_hours}h {slow_minutes}min"}}
+    data = {slow_title: {output_distance: f"{real_slow_distance}{km_unit}", output_time: f"{slow_hours}h {slow_minutes}min"}, output_snapped: snaps, output_search_stats: search_stats}
 
     # check if fast network did not find any path
     if fast_distance == -1:
         # add 1 to always make fast time bigger to force slow time to be returned
-        fast_time_minutes = slow_distance + 1
+        fast_time_minutes = slow_time_minutes + 1
         data.update({fast_title: "No valid path found"})
     else:
         # everything went smoothly, continue calculating
@@ -269,7 +380,8 @@ def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_m
         hours, minutes = fast_hours, fast_minutes
         faster_maze_title = fast_title
 
-        maze_plot.show_maze_comparison(solved_fast_maze, solved_slow_maze, fast_title, slow_title, DISTANCE_SCALE_FACTOR)
+        if show_plot:
+            maze_plot.show_maze_comparison(solved_fast_maze, solved_slow_maze, fast_title, slow_title, DISTANCE_SCALE_FACTOR)
 
     else:
         real_distance = real_slow_distance
@@ -281,37 +393,68 @@ def vehicle_analysis(start: NodePos, end: NodePos, slow_maze: np.ndarray, fast_m
 
     return faster_maze_title, solved_rail_maze, real_distance, hours, minutes, data
 
-def rail_analysis(start: NodePos, end: NodePos) -> tuple[str, np.ndarray, int, int, int, dict]:
+def load_networks() -> dict[str, np.ndarray]:
+    """
+    Loads all networks used by rail_analysis and car_analysis, so they can be kept in memory for repeated analyses.
+
+    Outputs:
+        _ - A dictionary mapping each maze file name to its maze array.
+    """
+    maze_files = [maze_file for networks in vehicle_networks.values() for maze_file in networks[:2]]
+    return {maze_file: network_maze(maze_file, None) for maze_file in maze_files}
+
+def network_maze(maze_file: str, networks: dict[str, np.ndarray] | None) -> np.ndarray:
+    """
+    Returns an already loaded network or loads it from its file together with the snapping index saved beside it, which route_lengths then finds for the array.
+
+    Inputs:
+        maze_file - The file name of the maze.
+        networks - The loaded networks as returned by load_networks, or None.
+
+    Outputs:
+        _ - The maze array of the network.
+    """
+    if networks is not None and maze_file in networks:
+        return networks[maze_file]
+    maze = astar_lib.load_maze(maze_file)
+    network_snapping.index_for(maze, maze_file)
+    return maze
+
+def rail_analysis(start: NodePos, end: NodePos, show_plot: bool = True, networks: dict[str, np.ndarray] | None = None) -> tuple[str, np.ndarray, int, int, int, dict]:
     """
     Conducts an analysis of the rail network by comparing intercity and regional train lines to find the optimal route.
 
     Inputs:
         start - The starting position for the analysis, represented as a NodePos object.
         end - The ending position for the analysis, also represented as a NodePos object.
+        show_plot - Whether the comparison of both networks is plotted.
+        networks - Optional networks already loaded with load_networks. Otherwise the mazes are loaded from their files.
 
     Outputs:
         A tuple containing the results of the rail analysis, including the chosen network, the solved maze, the real-world distance, the time for the journey in hours and minutes, and a data dict where these values are stored.
     """
-    ic_maze = astar_lib.load_maze(intercity_rail_network_maze_file)
-    regio_maze = astar_lib.load_maze(rail_network_maze_file)
+    ic_maze = network_maze(intercity_rail_network_maze_file, networks)
+    regio_maze = network_maze(rail_network_maze_file, networks)
 
-    return vehicle_analysis(start, end, regio_maze, ic_maze, "Regional Train Lines", "Intercity Train Lines", REGIO_TRAIN_SPEED, INTERCITY_TRAIN_SPEED)
+    return vehicle_analysis(start, end, regio_maze, ic_maze, *network_titles["train"], REGIO_TRAIN_SPEED, INTERCITY_TRAIN_SPEED, show_plot)
 
-def car_analysis(start: NodePos, end: NodePos) -> tuple[str, np.ndarray, int, int, int, dict]:
+def car_analysis(start: NodePos, end: NodePos, show_plot: bool = True, networks: dict[str, np.ndarray] | None = None) -> tuple[str, np.ndarray, int, int, int, dict]:
     """
     Conducts an analysis of the car network by comparing highways and main roads to find the optimal route.
 
     Inputs:
         start - The starting position for the analysis, represented as a NodePos object.
         end - The ending position for the analysis, also represented as a NodePos object.
+        show_plot - Whether the comparison of both networks is plotted.
+        networks - Optional networks already loaded with load_networks. Otherwise the mazes are loaded from their files.
 
     Outputs:
         A tuple containing the results of the car analysis, including the chosen network, the solved maze, the real-world distance, the time for the journey in hours and minutes, and a data dict where these values are stored.
     """
-    highway_maze = astar_lib.load_maze(highway_maze_file)
-    road_maze = astar_lib.load_maze(road_maze_file)
+    highway_maze = network_maze(highway_maze_file, networks)
+    road_maze = network_maze(road_maze_file, networks)
 
-    return vehicle_analysis(start, end, road_maze, highway_maze, "Main Roads", "Highways", MAIN_ROAD_CAR_SPEED, HIGHWAY_CAR_SPEED)
+    return vehicle_analysis(start, end, road_maze, highway_maze, *network_titles["car"], MAIN_ROAD_CAR_SPEED, HIGHWAY_CAR_SPEED, show_plot)
 
 """" outputs """
 